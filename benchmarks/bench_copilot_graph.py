@@ -0,0 +1,66 @@
+# ╔══════════════════════════════════════════════════════════╗
+#   bench_copilot_graph.py  –  per-request graph overhead
+# ╚══════════════════════════════════════════════════════════╝
+#
+# Compares rebuilding + compiling the copilot graph on every request
+# (old /chat behaviour) with reusing the graph compiled once at startup.
+# Node functions are replaced by no-op stubs so only LangGraph overhead
+# is measured – no LLM or embedding calls are made.
+#
+#   python benchmarks/bench_copilot_graph.py [iterations]
+
+import os
+import sys
+import time
+import statistics
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import utils.copilot_graph as cg
+
+
+def classify_stub(state):
+    state.intent = "general_query"
+    return state
+
+def respond_stub(state):
+    state.llm_response = "ok"
+    return state
+
+
+def run(label, request_fn, iterations):
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        request_fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    print(f"{label:<28} mean {statistics.mean(timings):8.3f} ms   "
+          f"median {statistics.median(timings):8.3f} ms   p95 {sorted(timings)[int(len(timings) * 0.95) - 1]:8.3f} ms")
+    return statistics.mean(timings)
+
+
+def main(iterations=200):
+    cg.GRAPH_NODES = {
+        "classify_input": classify_stub,
+        "handle_design_change": respond_stub,
+        "suggest_improvement": respond_stub,
+        "answer_query": respond_stub,
+    }
+
+    def state():
+        return cg.CopilotState(user_input="What is the GWP?", design_data={})
+
+    def rebuild_per_request():
+        cg.build_copilot_graph().invoke(state())
+
+    def cached_graph():
+        cg.get_copilot_graph().invoke(state())
+
+    cg.get_copilot_graph()  # startup compile, not counted
+    print(f"Copilot graph overhead over {iterations} requests (stub nodes)\n")
+    before = run("before: build per request", rebuild_per_request, iterations)
+    after = run("after: compiled once", cached_graph, iterations)
+    print(f"\nSaved {before - after:.3f} ms per request ({before / after:.1f}x less graph overhead)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,128 @@
+# ╔══════════════════════════════════════════════════════════╗
+#   bench_prefix_cache.py  –  prompt prefix reuse on a local LLM
+# ╚══════════════════════════════════════════════════════════╝
+#
+# Starts a local OpenAI-compatible stub that behaves like LM Studio's
+# single-slot prompt cache: each request only "processes" the tokens after
+# the longest prefix shared with the previous request. The same chat
+# workload is sent twice – once with the old layout (design data
+# interpolated inside the system prompt) and once through
+# utils.prompt_builder (static instructions first, data last) – and the
+# reused / reprocessed token counts are compared.
+#
+#   python benchmarks/bench_prefix_cache.py
+
+import os
+import re
+import sys
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from openai import OpenAI
+from llm_calls import ANSWER_QUERY_INSTRUCTIONS, IMPROVEMENT_INSTRUCTIONS
+from utils.prompt_builder import build_messages
+from utils.prompt_budget import render_inputs, render_outputs
+
+TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]|\s+")
+
+
+# -- Stub server emulating a single-slot KV cache --
+class PrefixCacheStub:
+    def __init__(self):
+        self.previous = []
+        self.reused = 0
+        self.processed = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def consume(self, messages):
+        text = "".join(f"<|{m['role']}|>\n{m['content']}\n" for m in messages)
+        tokens = TOKEN_PATTERN.findall(text)
+        with self.lock:
+            shared = 0
+            for a, b in zip(tokens, self.previous):
+                if a != b:
+                    break
+                shared += 1
+            self.reused += shared
+            self.processed += len(tokens) - shared
+            self.requests += 1
+            self.previous = tokens
+
+
+def make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            stub.consume(body["messages"])
+            payload = json.dumps({
+                "id": "stub", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "ok"}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 1, "total_tokens": 1}
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+    return Handler
+
+
+# -- Workload --
+def load_design():
+    path = os.path.join(os.path.dirname(__file__), "..", "knowledge", "ml_output.json")
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return data.get("inputs_decoded", {}), data.get("outputs", {})
+
+def workload(rounds=4, questions_per_round=4, seed=7):
+    """Design changes every few questions, mirroring a design session."""
+    rng = random.Random(seed)
+    inputs, outputs = load_design()
+    questions = ["What is the GWP?", "How can I reduce embodied carbon?", "Is the EUI high?",
+                 "Which insulation should I use?", "What drives operational carbon?"]
+    for _ in range(rounds):
+        outputs = {k: round(v * rng.uniform(0.8, 1.2), 2) for k, v in outputs.items()}
+        for _ in range(questions_per_round):
+            kind = rng.choice(["answer", "improve"])
+            yield kind, rng.choice(questions), render_inputs(inputs), render_outputs(outputs)
+
+def legacy_messages(kind, question, inputs_text, outputs_text):
+    instructions = ANSWER_QUERY_INSTRUCTIONS if kind == "answer" else IMPROVEMENT_INSTRUCTIONS
+    first, rest = instructions.strip().split("\n", 1)
+    system = f"{first}\n\nDesign Inputs:\n{inputs_text}\n\nDesign Outputs:\n{outputs_text}\n\n{rest}"
+    return [{"role": "system", "content": system}, {"role": "user", "content": question}]
+
+def builder_messages(kind, question, inputs_text, outputs_text):
+    instructions = ANSWER_QUERY_INSTRUCTIONS if kind == "answer" else IMPROVEMENT_INSTRUCTIONS
+    return build_messages(instructions, context={"Design inputs": inputs_text, "Design outputs": outputs_text}, user=question)
+
+
+def run(label, make_messages):
+    stub = PrefixCacheStub()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(stub))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = OpenAI(base_url=f"http://127.0.0.1:{server.server_address[1]}/v1", api_key="stub")
+
+    for call in workload():
+        client.chat.completions.create(model="stub", messages=make_messages(*call))
+    server.shutdown()
+
+    total = stub.reused + stub.processed
+    print(f"{label:<22} requests {stub.requests:3d}   reused {stub.reused:6d}   "
+          f"reprocessed {stub.processed:6d}   prefix reuse {100 * stub.reused / total:5.1f}%")
+    return stub.processed
+
+
+if __name__ == "__main__":
+    print("Prompt prefix reuse against a single-slot cache stub\n")
+    before = run("legacy layout", legacy_messages)
+    after = run("prompt_builder layout", builder_messages)
+    print(f"\nTokens reprocessed: {before} → {after} ({100 * (before - after) / before:.1f}% fewer)")
@@ -0,0 +1,111 @@
+# ╔══════════════════════════════════════════════════════════╗
+#   bench_workers.py  –  throughput of non-LLM endpoints vs --workers
+# ╚══════════════════════════════════════════════════════════╝
+#
+# Starts the chat server with uvicorn at 1, 2, 4… workers and hammers the
+# endpoints that never call the LLM (/ping, /api/gwp_data, /api/ml_output,
+# /conversation_state) from several client processes with keep-alive
+# connections. Prints requests/s per worker count and the scaling factor
+# against a single worker – with state in the shared SQLite store it should
+# grow close to linearly until the CPU cores run out.
+#
+#   python benchmarks/bench_workers.py [max_workers] [seconds]
+
+import os
+import sys
+import time
+import socket
+import subprocess
+import http.client
+import multiprocessing
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+HOST = "127.0.0.1"
+ENDPOINTS = ["/ping", "/api/gwp_data", "/api/ml_output", "/conversation_state"]
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers, port):
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server.chat_server:app", "--host", HOST, "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection(HOST, port, timeout=2)
+            conn.request("GET", "/ping")
+            if conn.getresponse().status == 200:
+                time.sleep(1)  # let the remaining workers finish booting
+                return proc
+        except OSError:
+            time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"Server with {workers} workers did not come up on port {port}")
+
+
+def client_loop(args):
+    """One client process: cycle through the endpoints until the deadline, return (ok, errors)."""
+    port, client_id, deadline = args
+    headers = {"X-Session-Id": f"bench-client-{client_id:04d}"}
+    conn = http.client.HTTPConnection(HOST, port, timeout=10)
+    ok = errors = 0
+    i = client_id
+    while time.time() < deadline:
+        path = ENDPOINTS[i % len(ENDPOINTS)]
+        i += 1
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(HOST, port, timeout=10)
+    conn.close()
+    return ok, errors
+
+
+def measure(workers, seconds, clients):
+    port = free_port()
+    proc = start_server(workers, port)
+    try:
+        deadline = time.time() + seconds
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.map(client_loop, [(port, c, deadline) for c in range(clients)])
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    ok = sum(r[0] for r in results)
+    errors = sum(r[1] for r in results)
+    return ok / seconds, errors
+
+
+def main(max_workers=4, seconds=10):
+    cores = os.cpu_count() or 1
+    counts = [n for n in (1, 2, 4, 8, 16) if n <= max_workers]
+    print(f"Non-LLM endpoint throughput, {seconds}s per run, {cores} CPU cores\n")
+    baseline = None
+    for workers in counts:
+        clients = max(4, workers * 4)
+        rps, errors = measure(workers, seconds, clients)
+        baseline = baseline or rps
+        print(f"workers={workers:<3} clients={clients:<3} {rps:9.1f} req/s   "
+              f"x{rps / baseline:4.2f} vs 1 worker (ideal x{workers})   errors={errors}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    )
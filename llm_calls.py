@@ -8,7 +8,10 @@ import sys
 import subprocess
 import re
 import traceback
-from server.config import client, completion_model
+import asyncio
+import openai
+from server.config import client
+from utils.llm_gateway import llm_gateway, INTERACTIVE, BACKGROUND, PROBE
 
 # -- Optional imports for external features --
 try:
@@ -24,27 +27,29 @@ except ImportError:
 
 
 # -- Generate dynamic LLM greeting --
-def generate_dynamic_greeting():
-    """Generate a varied, engaging greeting for the design assistant"""
+GREETING_MESSAGES = [
+    {
+        "role": "system",
+        "content": """
+        You are a friendly architectural design assistant. Generate a brief, welcoming greeting that:
+        - Is warm and engaging
+        - Mentions sustainable design or architecture
+        - Varies each time (don't be repetitive)
+        - Is 1-2 sentences maximum
+        
+        Generate a unique, engaging greeting now.
+        """
+    }
+]
+
+def generate_dynamic_greeting(priority=INTERACTIVE, deadline=None):
+    """Generate a varied, engaging greeting for the design assistant (PROBE priority for health checks)"""
     try:
         print("[GREETING] Starting dynamic greeting generation...")
         
-        response = client.chat.completions.create(
-            model=completion_model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": """
-                    You are a friendly architectural design assistant. Generate a brief, welcoming greeting that:
-                    - Is warm and engaging
-                    - Mentions sustainable design or architecture
-                    - Varies each time (don't be repetitive)
-                    - Is 1-2 sentences maximum
-                    
-                    Generate a unique, engaging greeting now.
-                    """
-                }
-            ],
+        response = llm_gateway.chat(
+            priority=priority, deadline=deadline, label="greeting", route="greeting",
+            messages=GREETING_MESSAGES,
             timeout=50.0  # 30 second timeout
         )
         
@@ -57,12 +62,28 @@ def generate_dynamic_greeting():
         traceback.print_exc()
         raise e  # Don't return fallback, raise error instead
 
+async def generate_dynamic_greeting_async():
+    """Async variant of generate_dynamic_greeting (AsyncOpenAI client)"""
+    try:
+        response = await llm_gateway.achat(
+            priority=INTERACTIVE, label="greeting", route="greeting",
+            messages=GREETING_MESSAGES,
+            timeout=50.0
+        )
+        greeting = response.choices[0].message.content.strip()
+        print(f"[GREETING] Generated: {greeting}")
+        return greeting
+    except Exception as e:
+        print(f"[GREETING] Error: {e}")
+        traceback.print_exc()
+        raise e
+
 # -- Provide 1-sentence sustainability insight --
 def provide_sustainability_insight(parameter_type, new_value):
     """Generate simple sustainability insights for parameter changes"""
     try:
-        response = client.chat.completions.create(
-            model=completion_model,
+        response = llm_gateway.chat(
+            priority=INTERACTIVE, label="sustainability_insight", route="insight",
             messages=[
                 {
                     "role": "system", 
@@ -140,16 +161,10 @@ def initialize_placeholder_dictionary():
         print(f"[INIT] Error creating placeholder dictionary: {e}")
         return False
 
-# -- Save compiled ML dictionary to file --
-def save_ml_dictionary(ml_dict):
+# -- Save compiled ML dictionary to file (the session's own copy when `design_dir` is set) --
+def save_ml_dictionary(ml_dict, design_dir=None):
     try:
-        knowledge_folder = "knowledge"
-        os.makedirs(knowledge_folder, exist_ok=True)
-        
-        filepath = os.path.join(knowledge_folder, "compiled_ml_data.json")
-        with open(filepath, 'w') as f:
-            json.dump(ml_dict, f, indent=2)
-        
+        filepath = save_parameters(ml_dict, design_dir)
         print(f"[ML DICT] Saved to {filepath}")
         return True
         
@@ -316,18 +331,14 @@ def apply_component_specific_change(component, material):
         return f"Updated {component} to {material.replace('_', ' ')}"
 
 # -- Update compiled_ml_data.json with new parameter values --
-def update_compiled_ml_data_with_changes(parameter_updates):
-    """Update compiled_ml_data.json with new parameter values"""
+def update_compiled_ml_data_with_changes(parameter_updates, design_dir=None):
+    """Update compiled_ml_data.json (the session's own copy when `design_dir` is set) with new parameter values"""
     try:
         from collections import OrderedDict
         
-        ml_data_path = os.path.join("knowledge", "compiled_ml_data.json")
-        
         # Read existing data
-        if os.path.exists(ml_data_path):
-            with open(ml_data_path, 'r') as f:
-                current_data = json.load(f)
-        else:
+        current_data = load_parameters(design_dir)
+        if not current_data:
             # Create default structure if file doesn't exist
             current_data = {
                 "EW_PAR": 1, "EW_INS": 2, "IW_PAR": 1, "ES_INS": 1,
@@ -353,8 +364,7 @@ def update_compiled_ml_data_with_changes(parameter_updates):
             ordered_data[key] = current_data.get(key, 0)
         
         # Write back to file
-        with open(ml_data_path, 'w') as f:
-            json.dump(ordered_data, f, indent=2)
+        save_parameters(ordered_data, design_dir)
         
         print(f"[ML UPDATE] Successfully updated compiled_ml_data.json")
         return True
@@ -380,98 +390,157 @@ from utils.version_analysis_utils import (
     get_best_version,
     extract_versions_from_input,
     summarize_versions_data,
-    load_version_details
+    load_version_details,
+    get_design_revision
+)
+from utils.single_flight import coalesced, coalesced_async
+from utils.retrieval import retrieve_snippets, snippet_sections
+from utils.context_fetch import gather_context
+from utils.prompt_budget import (
+    PROMPT_BUDGETS,
+    GWP_KEY,
+    render_inputs,
+    render_outputs,
+    render_versions_table,
+    select_relevant_versions,
+    fit_sections,
+    log_prompt_tokens,
+    estimate_tokens
 )
+from utils.prompt_builder import build_messages, canonical_json
+from utils.phrase_matcher import extract_parameter_updates
+from utils.design_state import load_parameters, save_parameters, ml_output_path, predictor_env
 
 # -- Answer user questions using design inputs/outputs --
-def answer_user_query(user_query, design_data):
-    """Return a precise, factual answer using available project data."""
+ANSWER_QUERY_INSTRUCTIONS = """
+You are a technical assistant. Use the design data provided with the question to answer it.
+Respond in 1–2 concise sentences. Be direct. If unsure, say so plainly.
+"""
+
+def with_history(sections, budget, history):
+    """Append the conversation memory as the last (most volatile) section and widen the budget for it."""
+    if not history:
+        return sections, budget
+    return sections + [("Conversation so far", history, 1)], budget + PROMPT_BUDGETS["conversation_history"]
+
+def _answer_query_messages(user_query, history=None, design_dir=None):
+    """Gather version/ML context and build the chat messages for answer_user_query (`history`: rendered conversation memory)."""
     
    # NEW DEFINITION FOR VERSIONING CONSIDERATIONS 07.06.25 
     mentioned_versions = extract_versions_from_input(user_query)
 
-    if mentioned_versions:
-        version_data = summarize_versions_data(mentioned_versions)
-        summary_text = json.dumps(version_data, indent=2)
-    else:
-        version_data = summarize_version_outputs()
-        summary_text = json.dumps(version_data, indent=2)
+    # Design data comes from the first mentioned version, otherwise from ml_output.json
+    def fetch_design():
+        if mentioned_versions:
+            version_details = load_version_details(mentioned_versions[0])
+            if version_details:
+                return version_details.get("inputs_decoded", {}), version_details.get("outputs", {})
+            return {}, {}
+        with open(ml_output_path(design_dir), "r", encoding="utf-8") as f:
+            ml_data = json.load(f)
+        return ml_data.get("inputs_decoded", {}), ml_data.get("outputs", {})
+
+    context = gather_context(
+        {
+            "design": fetch_design,
+            "versions": summarize_version_outputs,
+            "knowledge": lambda: retrieve_snippets(user_query, k=3),
+        },
+        defaults={"design": ({}, {}), "versions": [], "knowledge": []},
+        label="QUERY CONTEXT"
+    )
+    design_inputs, design_outputs = context["design"]
+    relevant_versions = select_relevant_versions(context["versions"], mentioned=mentioned_versions)
+
+    # Least volatile first: versions change per iteration, design per change, knowledge per question
+    context_text = fit_sections(*with_history(
+        [
+            ("Saved versions (mentioned, best, latest)", render_versions_table(relevant_versions), 1),
+            ("Design inputs", render_inputs(design_inputs), 0),
+            ("Design outputs (kWh/m²a, kg CO2e/m²a GFA)", render_outputs(design_outputs), 0),
+            *snippet_sections("Relevant knowledge", context["knowledge"]),
+        ],
+        PROMPT_BUDGETS["answer_user_query"],
+        history
+    ))
 
+    return build_messages(ANSWER_QUERY_INSTRUCTIONS, context=context_text, user=user_query, call_name="answer_user_query")
 
-    if mentioned_versions:
-        first_version = mentioned_versions[0]
-        version_details = load_version_details(first_version)
-        if version_details:
-            design_inputs = version_details.get("inputs_decoded", {})
-            design_outputs = version_details.get("outputs", {})
-        else:
-            design_inputs = {}
-            design_outputs = {}
-    else:
-        try:
-            with open("knowledge/ml_output.json", "r", encoding="utf-8") as f:
-                ml_data = json.load(f)
-                design_inputs = ml_data.get("inputs_decoded", {})
-                design_outputs = ml_data.get("outputs", {})
-        except Exception as e:
-            print(f"[QUERY] Failed to load ml_output.json: {e}")
-            design_inputs, design_outputs = {}, {}
-
-
-    response = client.chat.completions.create(
-        model=completion_model,
-        messages=[
-            {
-                "role": "system",
-                "content": f"""
-                You are a technical assistant. Use the current design data to answer user questions.
-
-                Design Inputs:
-                {json.dumps(design_inputs, indent=2)}
-
-                Design Outputs:
-                {json.dumps(design_outputs, indent=2)}
-
-                Respond in 1–2 concise sentences. Be direct. If unsure, say so plainly.
-                """
-            },
-            {
-                "role": "user",
-                "content": user_query
-            }
-        ]
+def answer_user_query(user_query, design_data, history=None, design_dir=None):
+    """Return a precise, factual answer using available project data."""
+    response = llm_gateway.chat(
+        priority=INTERACTIVE, label="answer_user_query", route="query",
+        messages=_answer_query_messages(user_query, history, design_dir)
     )
+    return response.choices[0].message.content
 
+async def answer_user_query_async(user_query, design_data, history=None, design_dir=None):
+    """Async variant of answer_user_query; context gathering runs off the event loop."""
+    messages = await asyncio.to_thread(_answer_query_messages, user_query, history, design_dir)
+    response = await llm_gateway.achat(
+        priority=INTERACTIVE, label="answer_user_query", route="query",
+        messages=messages
+    )
     return response.choices[0].message.content
 
+# -- Stream a chat completion token by token --
+async def stream_chat_completion(messages, route="query", **kwargs):
+    """Yield content deltas from a streamed completion (AsyncOpenAI, stream=True) on the given model route."""
+    stream = llm_gateway.astream(
+        priority=INTERACTIVE, label="chat_stream", route=route,
+        messages=messages,
+        **kwargs
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
 # -- Suggest practical, data-driven design improvements --
-def suggest_improvements(user_prompt, design_data):
-    """Give 1–2 brief, practical suggestions based on the design data and SQL dataset insights."""
-    design_data_json = json.dumps(design_data)
-
-    version_summary = summarize_version_outputs()
-    version_summary_text = json.dumps(version_summary, indent=2)
-
-    best_version = get_best_version()
-    best_version_text = json.dumps(best_version, indent=2)
-
-    ranking_block = "\nVersion ranking by GWP (best to worst):\n"
-    sorted_versions = sorted(version_summary, key=lambda x: x.get("GWP total", float('inf')))
-    for v in sorted_versions:
-        ranking_block += f"- {v['version']}: {v.get('GWP total', 'N/A')} kg CO2e/m²\n"
-
-    # Step 1: Get dataset-based reference examples (if available)
-    if SQL_DATASET_AVAILABLE:
-        try:
-            reference_examples = get_top_low_carbon_high_gfa(max_results=3)
-        except Exception as e:
-            print(f"Error accessing SQL dataset: {e}")
-            reference_examples = []
-    else:
-        reference_examples = []
+IMPROVEMENT_INSTRUCTIONS = """
+You are a design advisor. Suggest practical improvements using the data provided with the request.
+
+Answer the user's prompt in 1–2 short, specific suggestions.
+Be direct. No intros, no conclusions. Do not repeat the user prompt.
+If helpful, compare with previous versions or point out changes.
+"""
+
+def _improvement_messages(user_prompt, design_data, history=None):
+    """Gather version/dataset context and build the chat messages for suggest_improvements."""
+    # Step 1: Fetch versions, dataset examples and knowledge snippets concurrently
+    def fetch_reference_examples():
+        if not SQL_DATASET_AVAILABLE:
+            return []
+        return get_top_low_carbon_high_gfa(max_results=3)
+
+    context = gather_context(
+        {
+            "versions": summarize_version_outputs,
+            "reference_examples": fetch_reference_examples,
+            "knowledge": lambda: retrieve_snippets(user_prompt, k=4),
+        },
+        defaults={"versions": [], "reference_examples": [], "knowledge": []},
+        label="IMPROVEMENT CONTEXT"
+    )
+
+    version_summary = context["versions"]
+
+    # Best version is derived from the summaries already loaded (no second scan)
+    best_version, best_value = get_best_version(metric=GWP_KEY, summaries=version_summary)
+    best_version_text = f"{best_version} (GWP {best_value:.2f} kg CO2e/m²a)" if best_version else "N/A"
+
+    # Only the versions worth comparing against: mentioned, best and latest, ranked by GWP
+    relevant_versions = select_relevant_versions(
+        version_summary, mentioned=extract_versions_from_input(user_prompt), latest=3
+    )
+    relevant_versions.sort(key=lambda v: v["outputs"].get(GWP_KEY, float("inf")))
+
+    reference_examples = context["reference_examples"]
 
     if reference_examples:
-        formatted_examples = "\n".join(
+        dataset_text = "\n".join(
             [
                 f"- {row.get('Typology', 'Unknown')} | "
                 f"GFA: {row.get('GFA', 'N/A')} | "
@@ -479,44 +548,39 @@ def suggest_improvements(user_prompt, design_data):
                 for row in reference_examples
             ]
         )
-        dataset_block = f"""
-Reference examples from other projects with high GFA and low carbon footprint:
-{formatted_examples}
-"""
     else:
-        dataset_block = "\n(No dataset matches found — skipping example injection.)\n"
-
-    # ✅ Step 2: Build the system prompt (outside of the if block!)
-    system_prompt = f"""
-You are a design advisor. Suggest practical improvements using this data:
-
-Current design:
-{design_data_json}
-
-Recent version summaries:
-{version_summary_text}
-
-Best performing version:
-{best_version_text}
-
-{ranking_block}
-
-{dataset_block}
+        dataset_text = "(No dataset matches found — skipping example injection.)"
+
+    # Step 2: Assemble the context within the call's token budget (least volatile first)
+    context_text = fit_sections(*with_history(
+        [
+            ("Reference examples from other projects with high GFA and low carbon footprint", dataset_text, 3),
+            ("Relevant versions, ranked by GWP (best to worst)", render_versions_table(relevant_versions), 1),
+            ("Best performing version", best_version_text, 0),
+            ("Current design", canonical_json(design_data), 0),
+            *snippet_sections("Relevant climate and material strategies", context["knowledge"]),
+        ],
+        PROMPT_BUDGETS["suggest_improvements"],
+        history
+    ))
 
-Answer the user's prompt in 1–2 short, specific suggestions.
-Be direct. No intros, no conclusions. Do not repeat the user prompt.
-If helpful, compare with previous versions or point out changes.
-"""
+    return build_messages(IMPROVEMENT_INSTRUCTIONS, context=context_text, user=user_prompt, call_name="suggest_improvements")
 
-    # Step 3: Call the LLM
-    response = client.chat.completions.create(
-        model=completion_model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+def suggest_improvements(user_prompt, design_data, history=None):
+    """Give 1–2 brief, practical suggestions based on the design data and SQL dataset insights."""
+    response = llm_gateway.chat(
+        priority=INTERACTIVE, label="suggest_improvements", route="suggestion",
+        messages=_improvement_messages(user_prompt, design_data, history)
     )
+    return response.choices[0].message.content
 
+async def suggest_improvements_async(user_prompt, design_data, history=None):
+    """Async variant of suggest_improvements."""
+    messages = await asyncio.to_thread(_improvement_messages, user_prompt, design_data, history)
+    response = await llm_gateway.achat(
+        priority=INTERACTIVE, label="suggest_improvements", route="suggestion",
+        messages=messages
+    )
     return response.choices[0].message.content
 
 # -- Convert ML parameter dictionary to readable summary for user --
@@ -547,188 +611,364 @@ def generate_user_summary(ml_dict):
 
 
 # -- Suggest a change and update model inputs via JSON patching --
-def suggest_change(user_prompt, design_data):
-        # --- Load current parameters from file ---
-        compiled_path = os.path.join("knowledge", "compiled_ml_data.json")
-        with open(compiled_path, "r", encoding="utf-8") as f:
-            current_parameters = json.load(f)
-
-        # --- Construct the system prompt ---
-        system_prompt = f"""
-    You are a design assistant helping update building parameters.
-
-    The user will describe a design change (e.g., "Change exterior wall insulation to mineral wool"). You must:
-
-    1. Read the current parameters below.
-    2. Modify ONLY the parameters explicitly mentioned by the user.
-    3. Leave all other values unchanged.
-    4. Output a full dictionary with exactly these 13 keys:
-    - Typology, WWR, EW_PAR, EW_INS, IW_PAR, ES_INS, IS_PAR, RO_PAR, RO_INS, BC, A/V, Volume(m3), VOL/VOLBBOX
-
-    DO NOT include explanations or any text. Respond ONLY with a plain JSON dictionary.
-
-    If the user mentions "structure", "frame", "beams", or "columns", update the `BC` parameter accordingly.
-
-    ### Current Parameters:
-    {json.dumps(current_parameters, indent=2)}
-
-    ### Parameter Options:
-    - Typology: BLOCK=0, L-SHAPE=1, C-SHAPE=2, COURTYARD=3
-    - WWR: VERY LOW=0, LOW=1, MODERATE=2, HIGH=3
-    - EW_PAR / IW_PAR: BRICK=0, CONCRETE=1, EARTH=2, STRAW=3, TIMBER FRAME=4, TIMBER MASS=5
-    - EW_INS: CELLULOSE=0, CORK=1, EPS=2, GLASS WOOL=3, MINERAL WOOL=4, WOOD FIBER=5
-    - ES_INS: EXTRUDED GLASS=0, XPS=1
-    - IS_PAR / RO_PAR: CONCRETE=0, TIMBER FRAME=1, TIMBER MASS=2
-    - RO_INS: CELLULOSE=0, CORK=1, EPS=2, EXTRUDED GLASS=3, GLASS WOOL=4, MINERAL WOOL=5, WOOD FIBER=6, XPS=7
-    - A/V, Volume(m3), VOL/VOLBBOX: floats from geometry system
-    - BC (Beams & Columns STRUCTURE): STEEL=0, CONCRETE=1, TIMBER=2 ← can be changed by user prompts like "change beams to steel"
+REQUIRED_KEYS = {
+    "Typology", "WWR", "EW_PAR", "EW_INS", "IW_PAR", "ES_INS",
+    "IS_PAR", "RO_PAR", "RO_INS", "BC", "A/V", "Volume(m3)", "VOL/VOLBBOX"
+}
+
+PROTECTED_KEYS = {"A/V", "Volume(m3)", "VOL/VOLBBOX"}
+
+DEFAULT_INPUTS = {
+    "Typology": 1, "WWR": 2, "EW_PAR": 0, "EW_INS": 0, "IW_PAR": 0,
+    "ES_INS": 0, "IS_PAR": 0, "RO_PAR": 0, "RO_INS": 0, "BC": 2,
+    "A/V": 0.4, "Volume(m3)": 1000.0, "VOL/VOLBBOX": 1.0
+}
+
+# -- Constrained output for design changes --
+MATERIALS_PATH = os.path.join("knowledge", "materials.json")
+
+# Editable parameter -> category in materials.json (protected geometry floats are never generated)
+PARAMETER_CATEGORIES = {
+    "Typology": "Typology",
+    "WWR": "Window-to-Wall_Ratio",
+    "EW_PAR": "Ext.Wall_Partition",
+    "EW_INS": "Ext.Wall_Insulation",
+    "IW_PAR": "Int.Wall_Partition",
+    "ES_INS": "Ext.Slab_Insulation",
+    "IS_PAR": "Int.Slab_Partition",
+    "RO_PAR": "Roof_Partition",
+    "RO_INS": "Roof_Insulation",
+    "BC": "Beams & Columns"
+}
+
+_design_change_schema = None
+_schema_format_supported = True   # flipped off if the local server rejects response_format
+
+def get_design_change_schema():
+    """JSON schema for the parameter dict: one integer enum per editable key, from materials.json."""
+    global _design_change_schema
+    if _design_change_schema is None:
+        with open(MATERIALS_PATH, "r", encoding="utf-8") as f:
+            materials = json.load(f)
+        properties = {
+            key: {"type": "integer", "enum": sorted(int(v) for v in materials[category])}
+            for key, category in PARAMETER_CATEGORIES.items()
+        }
+        _design_change_schema = {
+            "type": "object",
+            "properties": properties,
+            "required": list(PARAMETER_CATEGORIES),
+            "additionalProperties": False
+        }
+    return _design_change_schema
+
+def design_change_max_tokens(schema):
+    """Token bound for one schema-conforming answer (widest values, pretty-printed) plus slack."""
+    widest = {key: max(prop["enum"]) for key, prop in schema["properties"].items()}
+    return estimate_tokens(json.dumps(widest, indent=2)) + 16
 
+def _design_change_request():
+    """Extra completion kwargs: schema-constrained output and a matching max_tokens.
+
+    The tight max_tokens only holds for schema-constrained output; prompt-only
+    JSON may carry fences or prose, so it keeps the route's default limit.
     """
+    if not _schema_format_supported:
+        return {}
+    try:
+        schema = get_design_change_schema()
+    except Exception as e:
+        print(f"[DESIGN CHANGE] Schema unavailable, using free-form JSON: {e}")
+        return {}
+    return {
+        "max_tokens": design_change_max_tokens(schema),
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "design_parameters", "strict": True, "schema": schema}
+        }
+    }
 
-        # --- Call the LLM ---
-        response = client.chat.completions.create(
-            model=completion_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
+def _schema_rejected(error, request):
+    """True (and disable the schema) if the server refused response_format; the call is then retried without it."""
+    global _schema_format_supported
+    if "response_format" not in request or not isinstance(error, openai.BadRequestError):
+        return False
+    print(f"[DESIGN CHANGE] Server rejected json_schema response_format, falling back to prompt-only JSON: {error}")
+    _schema_format_supported = False
+    return True
+
+DESIGN_CHANGE_INSTRUCTIONS = """
+You are a design assistant helping update building parameters.
+
+The user will describe a design change (e.g., "Change exterior wall insulation to mineral wool"). You must:
+
+1. Read the current parameters given with the request.
+2. Modify ONLY the parameters explicitly mentioned by the user.
+3. Leave all other values unchanged.
+4. Output a dictionary with exactly these 10 keys (integer codes only):
+- Typology, WWR, EW_PAR, EW_INS, IW_PAR, ES_INS, IS_PAR, RO_PAR, RO_INS, BC
+
+DO NOT include explanations or any text. Respond ONLY with a plain JSON dictionary.
+
+If the user mentions "structure", "frame", "beams", or "columns", update the `BC` parameter accordingly.
+
+### Parameter Options:
+- Typology: BLOCK=0, L-SHAPE=1, C-SHAPE=2, COURTYARD=3
+- WWR: VERY LOW=0, LOW=1, MODERATE=2, HIGH=3
+- EW_PAR / IW_PAR: BRICK=0, CONCRETE=1, EARTH=2, STRAW=3, TIMBER FRAME=4, TIMBER MASS=5
+- EW_INS: CELLULOSE=0, CORK=1, EPS=2, GLASS WOOL=3, MINERAL WOOL=4, WOOD FIBER=5
+- ES_INS: EXTRUDED GLASS=0, XPS=1
+- IS_PAR / RO_PAR: CONCRETE=0, TIMBER FRAME=1, TIMBER MASS=2
+- RO_INS: CELLULOSE=0, CORK=1, EPS=2, EXTRUDED GLASS=3, GLASS WOOL=4, MINERAL WOOL=5, WOOD FIBER=6, XPS=7
+- A/V, Volume(m3), VOL/VOLBBOX: set by the geometry system, never output them
+- BC (Beams & Columns STRUCTURE): STEEL=0, CONCRETE=1, TIMBER=2 ← can be changed by user prompts like "change beams to steel"
+"""
+
+def _design_change_messages(user_prompt, design_dir=None):
+    """Load the session's current parameters and build the parameter-update prompt."""
+    # --- Load current parameters from file ---
+    current_parameters = load_parameters(design_dir)
+
+    # --- Static instructions first, current parameters last ---
+    messages = build_messages(
+        DESIGN_CHANGE_INSTRUCTIONS,
+        context={"Current Parameters": current_parameters},
+        user=user_prompt,
+        call_name="suggest_change"
+    )
+    return messages, current_parameters
+
+# --- Extract and parse the JSON ---
+def extract_json_block(text):
+    match = re.search(r'\{[\s\S]*?\}', text)
+    return match.group(0).strip() if match else None
+
+def parse_and_validate_model_response(response_text, user_prompt, current_parameters, default_inputs=DEFAULT_INPUTS):
+    try:
+        parsed = json.loads(response_text)
+        if not isinstance(parsed, dict):
+            raise ValueError("Parsed content is not a dictionary.")
+
+        user_prompt_lower = user_prompt.lower()
+        if "beam" in user_prompt_lower or "column" in user_prompt_lower:
+            if "steel" in user_prompt_lower:
+                parsed["BC"] = 0
+            elif "concrete" in user_prompt_lower:
+                parsed["BC"] = 1
+            elif "timber" in user_prompt_lower:
+                parsed["BC"] = 2
+            print(f"[FORCED STRUCTURE OVERRIDE] Detected BC update in user prompt → BC = {parsed.get('BC')}")
+
+        missing = REQUIRED_KEYS - parsed.keys()
+        for key in missing:
+            if key in PROTECTED_KEYS and key in current_parameters:
+                parsed[key] = current_parameters[key]  # geometry values are not generated by the model
+                continue
+            print(f"[VALIDATION] Missing key: {key} → using default")
+            parsed[key] = default_inputs[key]
+
+        for key in PROTECTED_KEYS:
+            if key in parsed and key in current_parameters:
+                if parsed[key] != current_parameters[key]:
+                    print(f"[PROTECTION] Ignoring unauthorized edit to {key}")
+                    parsed[key] = current_parameters[key]
+
+        float_keys = {"A/V", "Volume(m3)", "VOL/VOLBBOX"}
+        for key in float_keys:
+            parsed[key] = float(parsed[key])
+        for key in REQUIRED_KEYS - float_keys:
+            parsed[key] = int(parsed[key])
+
+        return parsed
+    except Exception as e:
+        raise ValueError(f"Invalid model response: {e}")
+
+def apply_design_change_response(raw_response, user_prompt, current_parameters, design_dir=None):
+    """Validate the LLM parameter dict and save it. Returns an error message, or None on success."""
+    print(f"[RAW LLM RESPONSE]\n{raw_response}")
+    cleaned_json = extract_json_block(raw_response or "")
+
+    try:
+        validated_dict = parse_and_validate_model_response(cleaned_json, user_prompt, current_parameters)
+
+        merged_result = current_parameters.copy()
+        merged_result.update(validated_dict)
+
+        save_ml_dictionary(merged_result, design_dir)
+        return None
+    except ValueError as e:
+        print(f"❌ Error validating LLM output: {e}")
+        with open("invalid_llm_output.json", "w", encoding="utf-8") as f:
+            f.write(raw_response or "")
+        return "⚠️ Unable to process design change due to invalid output."
+
+# --- Run ML predictor ---
+def run_ml_predictor(design_dir=None):
+    project_root = os.path.dirname(os.path.abspath(__file__))
+    predictor_path = os.path.join(project_root, "utils", "ML_predictor.py")
+    python_path = sys.executable
+
+    if not os.path.exists(predictor_path):
+        print("⚠️ ML Predictor script not found.")
+        return
+
+    try:
+        result = subprocess.run(
+            [python_path, predictor_path],
+            cwd=project_root,
+            env={**os.environ, **predictor_env(design_dir)},
+            capture_output=True,
+            text=True,
+            check=True
         )
+        print("ML Predictor Output:\n", result.stdout)
+    except subprocess.CalledProcessError as e:
+        print("ML Predictor failed:\n", e.stderr)
 
-        raw_response = response.choices[0].message.content
-        print(f"[RAW LLM RESPONSE]\n{raw_response}")
+CHANGE_EXPLANATION_INSTRUCTIONS = """
+You are a helpful sustainability design advisor. The user made updates to their building design.
 
-        # --- Extract and parse the JSON ---
-        def extract_json_block(text):
-            match = re.search(r'\{[\s\S]*?\}', text)
-            return match.group(0).strip() if match else None
+You will receive the two versions of the design. Use them to explain what changed in a friendly, human way. Mention only what changed.
 
-        REQUIRED_KEYS = {
-            "Typology", "WWR", "EW_PAR", "EW_INS", "IW_PAR", "ES_INS",
-            "IS_PAR", "RO_PAR", "RO_INS", "BC", "A/V", "Volume(m3)", "VOL/VOLBBOX"
-        }
+Keep it short and clear: 2–3 sentences. Refer to building components like walls, slabs, insulation, or window ratios.
+"""
 
-        PROTECTED_KEYS = {"A/V", "Volume(m3)", "VOL/VOLBBOX"}
+def _change_explanation_messages(design_dir=None):
+    """Build the before/after explanation prompt, or None if the new output can't be read."""
+    # --- Load new output for comparison ---
+    try:
+        with open(ml_output_path(design_dir), "r", encoding="utf-8") as f:
+            new_data = json.load(f)
+    except Exception as e:
+        print(f"[COMPARE] Failed to load new output: {e}")
+        return None
 
-        default_inputs = {
-            "Typology": 1, "WWR": 2, "EW_PAR": 0, "EW_INS": 0, "IW_PAR": 0,
-            "ES_INS": 0, "IS_PAR": 0, "RO_PAR": 0, "RO_INS": 0, "BC": 2,
-            "A/V": 0.4, "Volume(m3)": 1000.0, "VOL/VOLBBOX": 1.0
-        }
+    previous_data = get_last_version_data() or {}
 
-        def parse_and_validate_model_response(response_text, default_inputs):
-            try:
-                parsed = json.loads(response_text)
-                if not isinstance(parsed, dict):
-                    raise ValueError("Parsed content is not a dictionary.")
-
-                user_prompt_lower = user_prompt.lower()
-                if "beam" in user_prompt_lower or "column" in user_prompt_lower:
-                    if "steel" in user_prompt_lower:
-                        parsed["BC"] = 0
-                    elif "concrete" in user_prompt_lower:
-                        parsed["BC"] = 1
-                    elif "timber" in user_prompt_lower:
-                        parsed["BC"] = 2
-                    print(f"[FORCED STRUCTURE OVERRIDE] Detected BC update in user prompt → BC = {parsed['BC']}")
-
-                missing = REQUIRED_KEYS - parsed.keys()
-                for key in missing:
-                    print(f"[VALIDATION] Missing key: {key} → using default")
-                    parsed[key] = default_inputs[key]
-
-                for key in PROTECTED_KEYS:
-                    if key in parsed and key in current_parameters:
-                        if parsed[key] != current_parameters[key]:
-                            print(f"[PROTECTION] Ignoring unauthorized edit to {key}")
-                            parsed[key] = current_parameters[key]
-
-                float_keys = {"A/V", "Volume(m3)", "VOL/VOLBBOX"}
-                for key in float_keys:
-                    parsed[key] = float(parsed[key])
-                for key in REQUIRED_KEYS - float_keys:
-                    parsed[key] = int(parsed[key])
-
-                return parsed
-            except Exception as e:
-                raise ValueError(f"Invalid model response: {e}")
-
-        cleaned_json = extract_json_block(raw_response)
-
-        try:
-            validated_dict = parse_and_validate_model_response(cleaned_json, default_inputs)
-
-            merged_result = current_parameters.copy()
-            merged_result.update(validated_dict)
-
-            save_ml_dictionary(merged_result)
-        except ValueError as e:
-            print(f"❌ Error validating LLM output: {e}")
-            with open("invalid_llm_output.json", "w", encoding="utf-8") as f:
-                f.write(raw_response)
-            return "⚠️ Unable to process design change due to invalid output."
-
-        # --- Run ML predictor ---
-        def run_ml_predictor():
-            project_root = os.path.dirname(os.path.abspath(__file__))
-            predictor_path = os.path.join(project_root, "utils", "ML_predictor.py")
-            python_path = sys.executable
-
-            if not os.path.exists(predictor_path):
-                print("⚠️ ML Predictor script not found.")
-                return
-
-            try:
-                result = subprocess.run(
-                    [python_path, predictor_path],
-                    cwd=project_root,
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-                print("ML Predictor Output:\n", result.stdout)
-            except subprocess.CalledProcessError as e:
-                print("ML Predictor failed:\n", e.stderr)
-
-        run_ml_predictor()
-
-
-
-        # --- Load new output for comparison ---
-        try:
-            with open("knowledge/ml_output.json", "r", encoding="utf-8") as f:
-                new_data = json.load(f)
-        except Exception as e:
-            print(f"[COMPARE] Failed to load new output: {e}")
-            return "✅ Change saved, but result analysis unavailable."
-
-        previous_data = get_last_version_data()
-
-        change_explanation_prompt = f"""
-    You are a helpful sustainability design advisor. The user made updates to their building design.
-
-    Below are the two versions of the design. Use this to explain what changed in a friendly, human way. Mention only what changed.
-
-    Keep it short and clear: 2–3 sentences. Refer to building components like walls, slabs, insulation, or window ratios.
-
-    ### BEFORE:
-    {json.dumps(previous_data.get("inputs_decoded", {}), indent=2)}
-
-    ### AFTER:
-    {json.dumps(new_data.get("inputs_decoded", {}), indent=2)}
-    """
+    return build_messages(
+        CHANGE_EXPLANATION_INSTRUCTIONS,
+        context={
+            "BEFORE": render_inputs(previous_data.get("inputs_decoded", {})),
+            "AFTER": render_inputs(new_data.get("inputs_decoded", {})),
+        },
+        user="Explain the design update.",
+        call_name="change_explanation"
+    )
 
-        llm_response = client.chat.completions.create(
-            model=completion_model,
-            messages=[
-                {"role": "system", "content": change_explanation_prompt},
-                {"role": "user", "content": "Explain the design update."}
-            ]
+def _apply_direct_change(user_prompt, design_dir=None):
+    """Apply a plain material change found by the phrase matcher. Returns (handled, error_message)."""
+    try:
+        updates = extract_parameter_updates(user_prompt)
+    except Exception as e:
+        print(f"[DESIGN CHANGE] Phrase matcher failed, using LLM: {e}")
+        return False, None
+    if not updates:
+        return False, None
+
+    print(f"[DESIGN CHANGE] Matched without LLM: {updates}")
+    if not update_compiled_ml_data_with_changes(updates, design_dir):
+        return True, "⚠️ Unable to process design change."
+    return True, None
+
+def _apply_llm_change(user_prompt, design_dir=None):
+    """Ask the LLM for the full parameter dict and save it. Returns an error message, or None."""
+    messages, current_parameters = _design_change_messages(user_prompt, design_dir)
+
+    # --- Call the LLM (output constrained to the parameter schema) ---
+    request = _design_change_request()
+    try:
+        response = llm_gateway.chat(
+            priority=INTERACTIVE, label="suggest_change", route="change",
+            messages=messages,
+            **request
+        )
+    except Exception as e:
+        if not _schema_rejected(e, request):
+            raise
+        response = llm_gateway.chat(
+            priority=INTERACTIVE, label="suggest_change", route="change",
+            messages=messages
         )
 
-        interpretation = llm_response.choices[0].message.content.strip()
-        return interpretation
+    return apply_design_change_response(response.choices[0].message.content, user_prompt, current_parameters, design_dir)
+
+def suggest_change(user_prompt, design_data, design_dir=None):
+    # Plain material swaps are parsed directly; anything ambiguous goes through the LLM.
+    # Changes go to the session's own design files when `design_dir` is set (utils/design_state).
+    handled, error = _apply_direct_change(user_prompt, design_dir)
+    if not handled:
+        error = _apply_llm_change(user_prompt, design_dir)
+    if error:
+        return error
+
+    run_ml_predictor(design_dir)
+
+    explanation_messages = _change_explanation_messages(design_dir)
+    if explanation_messages is None:
+        return "✅ Change saved, but result analysis unavailable."
+
+    llm_response = llm_gateway.chat(
+        priority=INTERACTIVE, label="change_explanation", route="explanation",
+        messages=explanation_messages
+    )
+
+    interpretation = llm_response.choices[0].message.content.strip()
+    return interpretation
+
+async def _apply_llm_change_async(user_prompt, design_dir=None):
+    """Async variant of _apply_llm_change."""
+    messages, current_parameters = await asyncio.to_thread(_design_change_messages, user_prompt, design_dir)
+
+    request = _design_change_request()
+    try:
+        response = await llm_gateway.achat(
+            priority=INTERACTIVE, label="suggest_change", route="change",
+            messages=messages,
+            **request
+        )
+    except Exception as e:
+        if not _schema_rejected(e, request):
+            raise
+        response = await llm_gateway.achat(
+            priority=INTERACTIVE, label="suggest_change", route="change",
+            messages=messages
+        )
+
+    return await asyncio.to_thread(
+        apply_design_change_response, response.choices[0].message.content, user_prompt, current_parameters, design_dir
+    )
+
+async def suggest_change_async(user_prompt, design_data, design_dir=None):
+    """Async variant of suggest_change; file IO and the ML predictor run in worker threads."""
+    handled, error = await asyncio.to_thread(_apply_direct_change, user_prompt, design_dir)
+    if not handled:
+        error = await _apply_llm_change_async(user_prompt, design_dir)
+    if error:
+        return error
+
+    await asyncio.to_thread(run_ml_predictor, design_dir)
+
+    explanation_messages = await asyncio.to_thread(_change_explanation_messages, design_dir)
+    if explanation_messages is None:
+        return "✅ Change saved, but result analysis unavailable."
+
+    llm_response = await llm_gateway.achat(
+        priority=INTERACTIVE, label="change_explanation", route="explanation",
+        messages=explanation_messages
+    )
+    return llm_response.choices[0].message.content.strip()
  
 # -- Compare specific versions and explain differences --
+COMPARE_VERSIONS_INSTRUCTIONS = """
+You are a sustainability assistant helping architects compare design alternatives.
+
+- Summarize the main differences across the versions given with the request.
+- Focus on GWP, materials, insulation, and energy usage.
+- Be concise and insightful. Write a single paragraph (max 3 sentences).
+- Avoid bullet points and technical jargon.
+"""
+
+@coalesced(revision=lambda *_: get_design_revision())
 def compare_versions_summary(user_input):
     """Compare multiple versions based on decoded inputs and outputs, with an LLM-crafted concise summary."""
     try:
@@ -759,29 +999,27 @@ def compare_versions_summary(user_input):
                 f"- Embodied A-D: {ec}"
             )
 
-        # Build structured prompt for LLM
-        llm_versions_info = "\n".join([
-            f"{v}:\nInputs: {json.dumps(data[v].get('inputs_decoded', {}))}\n"
-            f"Outputs: {json.dumps(data[v].get('outputs', {}))}\n"
-            for v in version_names if v in data
-        ])
-
-        prompt = f"""
-You are a sustainability assistant helping architects compare design alternatives.
-
-- Summarize the main differences across these {len(version_names)} versions.
-- Focus on GWP, materials, insulation, and energy usage.
-- Be concise and insightful. Write a single paragraph (max 3 sentences).
-- Avoid bullet points and technical jargon.
-
-{llm_versions_info}
-"""
+        # Build structured prompt for LLM: one outputs table + one inputs line per version
+        compared = [v for v in version_names if v in data]
+        llm_versions_info = fit_sections(
+            [
+                ("Outputs (kWh/m²a, kg CO2e/m²a GFA)",
+                 render_versions_table([{"version": v, "outputs": data[v].get("outputs", {})} for v in compared]), 0),
+                ("Inputs",
+                 "\n".join(f"{v}: {render_inputs(data[v].get('inputs_decoded', {}))}" for v in compared), 1),
+            ],
+            PROMPT_BUDGETS["compare_versions_summary"]
+        )
 
-        llm_response = client.chat.completions.create(
-            model=completion_model,
-            messages=[
-                {"role": "system", "content": prompt}
-            ]
+        messages = build_messages(
+            COMPARE_VERSIONS_INSTRUCTIONS,
+            context=llm_versions_info,
+            user=f"Compare {', '.join(compared)}.",
+            call_name="compare_versions_summary"
+        )
+        llm_response = llm_gateway.chat(
+            priority=INTERACTIVE, label="compare_versions_summary", route="explanation",
+            messages=messages
         )
 
         summary = llm_response.choices[0].message.content.strip()
@@ -837,17 +1075,14 @@ def get_last_version_data():
 # ╚════════════════════════════════════════════════════════════════════════════╝
 
 # -- LLM GWP Trend message between In.json and In-1.json -- 
-def summarize_gwp_change_between_versions():
-    """Compare In.json and In-1.json and summarize GWP-related differences."""
-    try:
-        with open("knowledge/iterations/In.json", "r", encoding="utf-8") as f:
-            current = json.load(f)
-        with open("knowledge/iterations/In-1.json", "r", encoding="utf-8") as f:
-            previous = json.load(f)
-    except Exception as e:
-        return f"Unable to load version files: {e}"
+GWP_CHANGE_SYSTEM = (
+    "You are a sustainability assistant.\n"
+    "Always respond with **one sentence only**, maximum **10 words**.\n"
+    "Be blunt and specific. Do **not** justify, balance, or explain. Avoid soft language.\n"
+    "If unsure, say: 'No clear GWP cause detected.'"
+)
 
-    prompt = f"""
+GWP_CHANGE_INSTRUCTIONS = """
 Compare the two building design versions below.
 
 Write **exactly ONE sentence**
@@ -860,42 +1095,65 @@ Avoid any of these:
 - extra clauses or balance explanations
 
 Just the *key reason* GWP went up or down.
+"""
 
+# Background summaries are dropped if they can't start within this many seconds (the UI re-polls)
+GWP_SUMMARY_DEADLINE = 30.0
+
+def _gwp_change_messages():
+    """Build the GWP-change prompt from In.json and In-1.json (raises if the files can't be read)."""
+    with open("knowledge/iterations/In.json", "r", encoding="utf-8") as f:
+        current = json.load(f)
+    with open("knowledge/iterations/In-1.json", "r", encoding="utf-8") as f:
+        previous = json.load(f)
+
+    # Fixed instructions lead the user turn; the two versions follow in canonical form
+    data = _render_gwp_versions(previous, current)
+    return [
+        {"role": "system", "content": GWP_CHANGE_SYSTEM},
+        {"role": "user", "content": GWP_CHANGE_INSTRUCTIONS.strip() + "\n\n" + data}
+    ]
+
+def _render_gwp_versions(previous, current):
+    return (
+        "### Previous Version:\n"
+        f"Inputs: {render_inputs(previous.get('inputs_decoded', {}))}\n"
+        f"Outputs: {render_outputs(previous.get('outputs', {}))}\n\n"
+        "### Current Version:\n"
+        f"Inputs: {render_inputs(current.get('inputs_decoded', {}))}\n"
+        f"Outputs: {render_outputs(current.get('outputs', {}))}"
+    )
 
-### Previous Version:
-Inputs:
-{json.dumps(previous.get("inputs_decoded", {}), indent=2)}
-Outputs:
-{json.dumps(previous.get("outputs", {}), indent=2)}
+@coalesced(revision=lambda *_: get_design_revision())
+def summarize_gwp_change_between_versions():
+    """Compare In.json and In-1.json and summarize GWP-related differences."""
+    try:
+        messages = _gwp_change_messages()
+    except Exception as e:
+        return f"Unable to load version files: {e}"
 
-### Current Version:
-Inputs:
-{json.dumps(current.get("inputs_decoded", {}), indent=2)}
-Outputs:
-{json.dumps(current.get("outputs", {}), indent=2)}
-"""
+    try:
+        response = llm_gateway.chat(
+            priority=BACKGROUND, deadline=GWP_SUMMARY_DEADLINE, label="gwp_summary", route="gwp_summary",
+            messages=messages
+        )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        return f"LLM call failed: {e}"
 
+@coalesced_async(revision=lambda *_: get_design_revision())
+async def summarize_gwp_change_between_versions_async():
+    """Async variant of summarize_gwp_change_between_versions."""
     try:
-        response = client.chat.completions.create(
-        model=completion_model,
-        messages=[
-            {
-                "role": "system",
-                "content": (
-                    "You are a sustainability assistant.\n"
-                    "Always respond with **one sentence only**, maximum **10 words**.\n"
-                    "Be blunt and specific. Do **not** justify, balance, or explain. Avoid soft language.\n"
-                    "If unsure, say: 'No clear GWP cause detected.'"
-                )
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        temperature=0.3,
-        max_tokens=60
-    )
+        messages = await asyncio.to_thread(_gwp_change_messages)
+    except Exception as e:
+        return f"Unable to load version files: {e}"
+
+    try:
+        response = await llm_gateway.achat(
+            priority=BACKGROUND, deadline=GWP_SUMMARY_DEADLINE, label="gwp_summary", route="gwp_summary",
+            messages=messages
+        )
         return response.choices[0].message.content.strip()
     except Exception as e:
         return f"LLM call failed: {e}"
@@ -1,18 +1,30 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from fastapi import Request
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from fastapi import Request, Response
 from pydantic import BaseModel
 import uvicorn
 import sys
 import os
 import json
 import time
+import asyncio
 import threading
 from pathlib import Path
 import socket
 import subprocess, multiprocessing
-from utils.embeddings import classify_intent_via_embeddings
+from utils.embeddings import (
+    classify_intent_via_embeddings,
+    load_intent_examples,
+    add_intent_examples,
+    remove_intent_examples
+)
+from utils.answer_cache import answer_cache
+from utils.llm_gateway import llm_gateway
+from utils.single_flight import coalesced, single_flight
+from utils.session_store import session_store, session_id_from, SESSION_COOKIE
+from utils.design_state import ml_output_path
+from utils.export_jobs import export_jobs
 
 # Try to import watchdog for file monitoring
 try:
@@ -46,11 +58,14 @@ app.add_middleware(
     allow_headers=["*"],
 )
  
-# Global conversation state
-conversation_state = {
-    "design_data": {},
-    "conversation_history": [],
-}
+# Per-designer state (design data + conversation memory), selected by X-Session-Id header or cookie.
+# Sessions other than the default one keep their design files under knowledge/sessions/<id>/.
+def get_session(request: Request):
+    return session_store.get(session_id_from(request.headers, request.cookies))
+
+def _session_context(session):
+    """(design data, rendered history) of a session; both read SQLite, so async handlers call this in a thread."""
+    return session.design_data, session.memory.render_history()
 
 # File system observer for ML file changes
 file_observer = None
@@ -78,6 +93,10 @@ class MLFileWatcher(FileSystemEventHandler):
         self.last_modified[file_name] = current_time
         
         print(f"🔄 File watcher detected change in {file_name}")
+
+        # Cached chat answers refer to the previous design outputs
+        if file_name == "ml_output.json":
+            answer_cache.invalidate()
         
         # Handle compiled_ml_data.json changes (geometry detection)
         if file_name == "compiled_ml_data.json":
@@ -117,87 +136,187 @@ def start_file_watcher():
 class ChatRequest(BaseModel):
     message: str
 
+#IntentExamplesRequest: Data model for adding/removing router examples at runtime.
+class IntentExamplesRequest(BaseModel):
+    intent: str
+    examples: list[str]
+
 
-# export report endpoint
+# export report endpoints: exports run as background jobs; poll /api/jobs/{id} for progress
 @app.post("/api/export_report")
 def export_report():
     print("📥 Received /api/export_report call")
-
     try:
-        result = subprocess.run(
-            ["python", "utils/export.py"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print("✅ Export script finished.")
-        return {"status": "success", "message": result.stdout}
-    except subprocess.CalledProcessError as e:
-        print("❌ Export script error:", e.stderr)
-        return {"status": "error", "message": e.stderr}
+        job = export_jobs.submit()
+        return {"status": "accepted", "job_id": job["id"], "job": job}
+    except Exception as e:
+        print("❌ Could not start export:", e)
+        return JSONResponse(content={"status": "error", "message": str(e)}, status_code=500)
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    job = export_jobs.get(job_id)
+    if job is None:
+        return JSONResponse(content={"error": f"Unknown job '{job_id}'"}, status_code=404)
+    return job
+
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = export_jobs.cancel(job_id)
+    if job is None:
+        return JSONResponse(content={"error": f"Unknown job '{job_id}'"}, status_code=404)
+    return job
+
+@app.get("/api/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    job = export_jobs.get(job_id)
+    if job is None or job.get("status") != "done" or not os.path.exists(job.get("result") or ""):
+        return JSONResponse(content={"error": "Report not available"}, status_code=404)
+    return FileResponse(job["result"], media_type="application/pdf", filename="Full_Building_Report.pdf")
 
 
 # chat_endpoint(): Main chat handler that routes user input to the appropriate LLM function using ML data.
-from utils.copilot_graph import CopilotState, build_copilot_graph
+from utils.copilot_graph import CopilotState, get_copilot_graph, stream_copilot_response
 
 @app.post("/chat")
-def chat_endpoint(req: ChatRequest):
+async def chat_endpoint(req: ChatRequest, request: Request, response: Response):
     user_input = req.message.strip()
-    design_data = conversation_state.get("design_data", {})
-    
-    # Crear estado inicial
-    state = CopilotState(user_input=user_input, design_data=design_data)
-    
-    # Ejecutar el grafo
-    graph = build_copilot_graph()
-    result = graph.invoke(state)
+    session = get_session(request)
+    response.set_cookie(SESSION_COOKIE, session.id, httponly=True, samesite="lax")
+
+    # Turns of one session run in order; other sessions are not blocked
+    async with session.turn_lock:
+        # Crear estado inicial (design data and history are SQLite reads: keep them off the event loop)
+        design_data, history = await asyncio.to_thread(_session_context, session)
+        state = CopilotState(user_input=user_input, design_data=design_data, history=history, design_dir=session.design_dir)
+
+        # Ejecutar el grafo (compiled once, reused across requests; async nodes keep the event loop free)
+        graph = get_copilot_graph(async_nodes=True)
+        result = await graph.ainvoke(state)
+
+        await asyncio.to_thread(
+            session.memory.add_turn, user_input, result["llm_response"], intent=result["intent"], mode="langgraph"
+        )
 
     # Empaquetar la respuesta
-    response = {
+    payload = {
         "response": result["llm_response"],
         "intent": result["intent"],
         "mode": "langgraph",
+        "session_id": session.id,
         "error": False
     }
 
     # 👇 Esto imprime el JSON resultante en la consola
-    print(f"\n📤 Chat Response JSON:\n{json.dumps(response, indent=4)}\n")
+    print(f"\n📤 Chat Response JSON:\n{json.dumps(payload, indent=4)}\n")
 
-    conversation_state["conversation_history"].append({
-        "user": user_input,
-        "assistant": result["llm_response"],
-        "mode": "langgraph",
-        "intent": result["intent"],
-        "timestamp": time.time()
-    })
+    return payload
 
-    return response
+#intent examples endpoints: Inspect and tune the embedding router without re-embedding everything.
+@app.get("/api/intent_examples")
+def get_intent_examples():
+    try:
+        return load_intent_examples()
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+@app.post("/api/intent_examples")
+def post_intent_examples(req: IntentExamplesRequest):
+    try:
+        added = add_intent_examples(req.intent, req.examples)
+        return {"status": "success", "intent": req.intent, "added": added}
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "error": str(e)}, status_code=500)
+
+# POST body instead of DELETE: many clients and proxies drop DELETE request bodies
+@app.post("/api/intent_examples/remove")
+def remove_intent_examples_endpoint(req: IntentExamplesRequest):
+    try:
+        removed = remove_intent_examples(req.intent, req.examples)
+        return {"status": "success", "intent": req.intent, "removed": removed}
+    except ValueError as e:
+        return JSONResponse(content={"status": "error", "error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "error": str(e)}, status_code=500)
+
+# chat_stream_endpoint(): Same routing as /chat, but streams LLM tokens as Server-Sent Events.
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest, request: Request):
+    user_input = req.message.strip()
+    session = get_session(request)
+
+    async def event_stream():
+        intent = None
+        try:
+            async with session.turn_lock:
+                design_data, history = await asyncio.to_thread(_session_context, session)
+                state = CopilotState(user_input=user_input, design_data=design_data, history=history, design_dir=session.design_dir)
+                async for kind, value in stream_copilot_response(state):
+                    if kind == "intent":
+                        intent = value
+                        yield sse_event("intent", {"intent": intent})
+                    elif kind == "token":
+                        yield sse_event("token", {"content": value})
+                    elif kind == "done":
+                        await asyncio.to_thread(
+                            session.memory.add_turn, user_input, value, intent=intent, mode="langgraph_stream"
+                        )
+                        yield sse_event("done", {"response": value, "intent": intent, "mode": "langgraph_stream",
+                                                 "session_id": session.id, "error": False})
+        except Exception as e:
+            print(f"❌ [STREAM] Error: {e}")
+            yield sse_event("error", {"response": str(e), "intent": intent, "error": True})
+
+    stream_response = StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    stream_response.set_cookie(SESSION_COOKIE, session.id, httponly=True, samesite="lax")
+    return stream_response
+
+#warm_up(): Compiles the copilot graphs once per worker process before it serves requests.
+@app.on_event("startup")
+async def warm_up():
+    get_copilot_graph()
+    get_copilot_graph(async_nodes=True)
 
 #ping(): Health check endpoint that returns "alive".
 @app.get("/ping")
-def ping():
+async def ping():
     return {"status": "alive"}
 
-#get_conversation_state(): Returns the most recent 5 chat interactions and whether ML file/watcher is active.
+#get_conversation_state(): Returns the most recent 5 chat interactions, the history digest and whether ML file/watcher is active.
 @app.get("/conversation_state")
-def get_conversation_state():
+def get_conversation_state(request: Request):
     """Get current conversation state"""
+    session = get_session(request)
     return {
-    "design_data": conversation_state.get("design_data", {}),
-    "ml_output_exists": os.path.exists("knowledge/ml_output.json"),
+    "session_id": session.id,
+    "design_data": session.design_data,
+    "ml_output_exists": os.path.exists(ml_output_path(session.design_dir)),
     "file_watcher_active": file_observer is not None and file_observer.is_alive() if WATCHDOG_AVAILABLE else False,
-    "conversation_history": conversation_state["conversation_history"][-5:]
+    "conversation_history": session.memory.recent_turns(5),
+    "conversation_digest": session.memory.digest,
+    "sessions": session_store.stats(),
+    "answer_cache": answer_cache.stats()
 }
 
 #debug_analysis_data(): Returns a deep view of the design + ML data sent to LLMs.
 @app.post("/debug_analysis_data")
-def debug_analysis_data():
+def debug_analysis_data(request: Request):
     """Debug endpoint to inspect the ML-enhanced analysis data package"""
     try:
-        design_data = conversation_state.get("design_data", {})
+        session = get_session(request)
+        design_data = session.design_data
         ml_data = {}
 
-        ml_file = "knowledge/ml_output.json"
+        ml_file = ml_output_path(session.design_dir)
         if os.path.exists(ml_file):
             with open(ml_file, 'r') as f:
                 ml_data = json.load(f)
@@ -269,7 +388,7 @@ def test_geometry():
 
 #get_initial_greeting(): Generates and returns a startup greeting via the LLM.
 @app.get("/initial_greeting")
-def get_initial_greeting():
+async def get_initial_greeting():
     """Return a dynamic greeting verified at startup (LLM-based)"""
 
     print("=" * 60)
@@ -279,7 +398,7 @@ def get_initial_greeting():
 
     try:
         print("🤖 [GREETING] Calling generate_dynamic_greeting...")
-        greeting = llm_calls.generate_dynamic_greeting()
+        greeting = await llm_calls.generate_dynamic_greeting_async()
         print(f"✅ [GREETING] SUCCESS! Generated: {greeting}")
         print("=" * 60)
 
@@ -302,7 +421,7 @@ def get_initial_greeting():
         # Retry once more
         try:
             print("🔄 [GREETING] Retrying...")
-            greeting = llm_calls.generate_dynamic_greeting()
+            greeting = await llm_calls.generate_dynamic_greeting_async()
             print(f"✅ [GREETING] Retry success: {greeting}")
             return {
                 "response": greeting,
@@ -355,6 +474,8 @@ def debug_greeting():
             "llm_available": LLM_AVAILABLE
         }
 
+LLM_STATUS_DEADLINE = 15.0  # seconds the /llm_status greeting probe may wait and run
+
 #heck_llm_status(): Full diagnostic of the LLM system's availability and behavior.
 @app.get("/llm_status")
 def check_llm_status():
@@ -376,7 +497,10 @@ def check_llm_status():
             # Try to generate a greeting
             if hasattr(llm_calls, 'generate_dynamic_greeting'):
                 try:
-                    test_greeting = llm_calls.generate_dynamic_greeting()
+                    # Probes queue behind real traffic; give up rather than hang the endpoint
+                    test_greeting = llm_calls.generate_dynamic_greeting(
+                        priority=llm_calls.PROBE, deadline=LLM_STATUS_DEADLINE
+                    )
                     status["can_generate_greeting"] = True
                     status["test_greeting"] = test_greeting[:50] + "..." if len(test_greeting) > 50 else test_greeting
                 except Exception as e:
@@ -391,42 +515,50 @@ def check_llm_status():
     
     return status
 
+#get_llm_metrics(): Queue depth, in-flight generations, wait times and per-call latency histograms of the LLM gateway, plus coalesced calls.
+@app.get("/api/llm_metrics")
+async def get_llm_metrics():
+    return {**llm_gateway.metrics(), "coalesced": single_flight.stats()}
+
 # retrieve ml_output.json for Aymeric's TABLE // clean ml_output check independant from any other // 07/06/2025
 @app.get("/api/ml_output")
-def get_ml_output():
-    # === Serve the decoded material composition from ml_output.json ===
+def get_ml_output(request: Request):
+    # === Serve the decoded material composition from the session's ml_output.json ===
     try:
-        file_path = os.path.join("knowledge", "ml_output.json")
+        file_path = ml_output_path(get_session(request).design_dir)
         with open(file_path, "r") as f:
             data = json.load(f)
         return JSONResponse(content=data)
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
-#get_gwp_data(): Collects all versioned GWP data files (V*.json) for Aymeric’s plot.
-@app.get("/api/gwp_data")
-def get_gwp_data():
+# Polled by several UI panels at once: concurrent requests share one scan of the folder
+@coalesced(copy_result=True)
+def load_gwp_data():
     # === Aggregate data from all V*.json files in knowledge/iterations/ ====
     folder = os.path.join("knowledge", "iterations")
     all_data = []
+    for filename in sorted(os.listdir(folder)):
+        if filename.startswith("V") and filename.endswith(".json"):
+            path = os.path.join(folder, filename)
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                data["version"] = filename.replace(".json", "")  # Add version for x-axis
+                all_data.append(data)
+    return all_data
 
+#get_gwp_data(): Collects all versioned GWP data files (V*.json) for Aymeric’s plot.
+@app.get("/api/gwp_data")
+def get_gwp_data():
     try:
-        for filename in sorted(os.listdir(folder)):
-            if filename.startswith("V") and filename.endswith(".json"):
-                path = os.path.join(folder, filename)
-                with open(path, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    data["version"] = filename.replace(".json", "")  # Add version for x-axis
-                    all_data.append(data)
-
-        return JSONResponse(content=all_data)
+        return JSONResponse(content=load_gwp_data())
     except Exception as e:
         return JSONResponse(content={"error": str(e)}, status_code=500)
 
 
 # LLM message for GWP trend in UI data + ▲ ▼ visual indicator
 @app.get("/api/gwp_summary")
-def get_gwp_summary():
+async def get_gwp_summary():
     from pathlib import Path
 
     file_current = Path("knowledge/iterations/In.json")
@@ -448,7 +580,7 @@ def get_gwp_summary():
         percent_change = round((delta / prev_gwp) * 100, 2)
         arrow = "▲" if percent_change > 0 else "▼"
         color = "red" if percent_change > 0 else "green"
-        summary = llm_calls.summarize_gwp_change_between_versions()
+        summary = await llm_calls.summarize_gwp_change_between_versions_async()
 
         timestamp = file_current.stat().st_mtime
 
@@ -542,10 +674,19 @@ if __name__ == "__main__":
 
     # Start main server
     # uvicorn.run(app, host="127.0.0.1", port=5001) # later replace port=free_port
+    # COPILOT_WORKERS > 1 runs several worker processes; shared state lives in knowledge/shared_state.sqlite3
+    # (COPILOT_LLM_MAX_CONCURRENCY is split between the workers, see server/config.py)
+    workers = int(os.environ.get("COPILOT_WORKERS", "1"))
+    # Spawned worker processes re-run the main module first: give them a small one instead of this file
+    from utils.chart_worker import use_as_spawn_main
+    use_as_spawn_main()
+    if workers > 1:
+        print(f"👥 Starting {workers} server workers")
     uvicorn.run(
-        app, 
+        "server.chat_server:app" if workers > 1 else app,
         host="127.0.0.1", 
         port=5001,
+        workers=workers,
         log_level="warning",  # Only warnings and errors
         access_log=False      # Disable HTTP request logs
     )
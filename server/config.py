@@ -1,7 +1,9 @@
 import os
 import sys
 import random
+import httpx
 from openai import OpenAI as OpenAIClient
+from openai import AsyncOpenAI as AsyncOpenAIClient
 
 # Add project root to import path (if needed elsewhere)
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -9,10 +11,52 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # Mode: only "local" is supported
 mode = "local"
 
-# Local LM Studio client
+# -- HTTP transport to the local server (all values overridable via environment) --
+local_base_url = os.environ.get("COPILOT_LLM_BASE_URL", "http://127.0.0.1:1234/v1")
+llm_pool_size = int(os.environ.get("COPILOT_LLM_POOL_SIZE", "8"))                # open connections
+llm_keepalive_connections = int(os.environ.get("COPILOT_LLM_KEEPALIVE", "4"))     # idle connections kept
+llm_keepalive_expiry = float(os.environ.get("COPILOT_LLM_KEEPALIVE_EXPIRY", "60"))
+llm_connect_timeout = float(os.environ.get("COPILOT_LLM_CONNECT_TIMEOUT", "5"))
+llm_read_timeout = float(os.environ.get("COPILOT_LLM_READ_TIMEOUT", "120"))      # max silence while generating
+llm_max_retries = int(os.environ.get("COPILOT_LLM_MAX_RETRIES", "2"))            # retried by the LLM gateway
+llm_retry_backoff = float(os.environ.get("COPILOT_LLM_RETRY_BACKOFF", "0.5"))    # base delay, doubled per attempt
+llm_connect_retries = int(os.environ.get("COPILOT_LLM_CONNECT_RETRIES", "1"))    # transport-level, failed connects only
+
+http_limits = httpx.Limits(
+    max_connections=llm_pool_size,
+    max_keepalive_connections=llm_keepalive_connections,
+    keepalive_expiry=llm_keepalive_expiry
+)
+http_timeout = httpx.Timeout(
+    connect=llm_connect_timeout,
+    read=llm_read_timeout,
+    write=10.0,
+    pool=llm_connect_timeout
+)
+
+# Local LM Studio client (pooled keep-alive connections; request retries are left to the gateway,
+# the transport only retries failed connects so embedding calls also survive a server restart)
 local_client = OpenAIClient(
-    base_url="http://127.0.0.1:1234/v1", 
-    api_key="lm_studio"  # LM Studio accepts any string
+    base_url=local_base_url,
+    api_key="lm_studio",  # LM Studio accepts any string
+    timeout=http_timeout,
+    max_retries=0,
+    http_client=httpx.Client(
+        transport=httpx.HTTPTransport(limits=http_limits, retries=llm_connect_retries),
+        timeout=http_timeout
+    )
+)
+
+# Async twin of the local client, used by the async chat pipeline
+local_async_client = AsyncOpenAIClient(
+    base_url=local_base_url,
+    api_key="lm_studio",
+    timeout=http_timeout,
+    max_retries=0,
+    http_client=httpx.AsyncClient(
+        transport=httpx.AsyncHTTPTransport(limits=http_limits, retries=llm_connect_retries),
+        timeout=http_timeout
+    )
 )
 
 # Default local model settings
@@ -29,6 +73,46 @@ llama3 = [
     }
 ]
 
+# -- Model profiles and per-call routing --
+# Short, formulaic outputs go to a small fast model; reasoning-heavy calls to the main one.
+# Both default to the model above so a single loaded model keeps working.
+MODEL_PROFILES = {
+    "fast": os.environ.get("COPILOT_FAST_MODEL", llama3[0]["model"]),
+    "main": os.environ.get("COPILOT_MAIN_MODEL", llama3[0]["model"]),
+}
+
+# Route (one per llm_calls / export task) -> profile and generation settings.
+# max_tokens None = decided by the call (e.g. schema-sized design changes).
+MODEL_ROUTES = {
+    "greeting":    {"profile": "fast", "max_tokens": 80,  "temperature": 0.9},
+    "insight":     {"profile": "fast", "max_tokens": 80,  "temperature": 0.5},
+    "gwp_summary": {"profile": "fast", "max_tokens": 60,  "temperature": 0.3},
+    "narration":   {"profile": "fast", "max_tokens": 300, "temperature": 0.6},
+    "digest":      {"profile": "fast", "max_tokens": 160, "temperature": 0.2},
+    "query":       {"profile": "main", "max_tokens": 250, "temperature": 0.3},
+    "suggestion":  {"profile": "main", "max_tokens": 400, "temperature": 0.6},
+    "change":      {"profile": "main", "max_tokens": None, "temperature": 0.0},
+    "explanation": {"profile": "main", "max_tokens": 300, "temperature": 0.4},
+}
+
+def resolve_route(route):
+    """Completion kwargs (model, max_tokens, temperature) for a route; unknown routes use the main model."""
+    settings = MODEL_ROUTES.get(route, {"profile": "main"})
+    kwargs = {"model": MODEL_PROFILES[settings["profile"]]}
+    for key in ("max_tokens", "temperature"):
+        if settings.get(key) is not None:
+            kwargs[key] = settings[key]
+    return kwargs
+
+# Max generations sent to the local server at once (LLM gateway); others wait in its priority queue.
+# The limit is for the whole server: with COPILOT_WORKERS processes each worker's gateway gets its share.
+llm_total_concurrency = int(os.environ.get("COPILOT_LLM_MAX_CONCURRENCY", "2"))
+server_workers = max(1, int(os.environ.get("COPILOT_WORKERS", "1")))
+llm_max_concurrency = max(1, llm_total_concurrency // server_workers)
+if llm_total_concurrency < server_workers:
+    print(f"[CONFIG] COPILOT_LLM_MAX_CONCURRENCY={llm_total_concurrency} is below COPILOT_WORKERS={server_workers}; "
+          f"each worker still gets 1 slot")
+
 # Runtime model selector
 def api_mode(mode):
     if mode == "local":
@@ -39,5 +123,13 @@ def api_mode(mode):
     else:
         raise ValueError("Only 'local' mode is supported in this configuration.")
 
+# Async client for the same mode
+def async_api_mode(mode):
+    if mode == "local":
+        return local_async_client
+    else:
+        raise ValueError("Only 'local' mode is supported in this configuration.")
+
 # Initialize global settings
 client, completion_model, embedding_model = api_mode(mode)
+async_client = async_api_mode(mode)
@@ -0,0 +1,53 @@
+import json
+import pytest
+from utils import design_state
+
+
+@pytest.fixture
+def knowledge(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "knowledge").mkdir()
+    shared = {"EW_PAR": 1, "BC": 2, "A/V": 0.4, "Volume(m3)": 1000.0, "VOL/VOLBBOX": 0.6}
+    (tmp_path / "knowledge" / "compiled_ml_data.json").write_text(json.dumps(shared))
+    return tmp_path / "knowledge"
+
+
+def _shared(knowledge):
+    return json.loads((knowledge / "compiled_ml_data.json").read_text())
+
+
+# -- a new session reads the shared design until it changes something --
+def test_new_session_reads_shared_design(knowledge):
+    session_dir = design_state.session_design_dir("designer-a")
+    assert not design_state.has_own_design(session_dir)
+    assert design_state.load_parameters(session_dir) == _shared(knowledge)
+    assert design_state.ml_output_path(session_dir) == design_state.ml_output_path(None)
+    assert design_state.predictor_env(None) == {}
+
+
+# -- a session's changes never reach the shared file or other sessions --
+def test_session_changes_are_isolated(knowledge):
+    a = design_state.session_design_dir("designer-a")
+    b = design_state.session_design_dir("designer-b")
+
+    parameters = design_state.load_parameters(a)
+    parameters["EW_PAR"] = 3
+    design_state.save_parameters(parameters, a)
+
+    assert design_state.has_own_design(a)
+    assert design_state.load_parameters(a)["EW_PAR"] == 3
+    assert design_state.load_parameters(b)["EW_PAR"] == 1
+    assert _shared(knowledge)["EW_PAR"] == 1
+    assert design_state.predictor_env(a)["COPILOT_ML_INPUT"].endswith("designer-a/compiled_ml_data.json")
+
+
+# -- geometry values follow the shared file (Rhino) even for sessions with their own design --
+def test_geometry_follows_shared_file(knowledge):
+    a = design_state.session_design_dir("designer-a")
+    design_state.save_parameters({**design_state.load_parameters(a), "Volume(m3)": 5.0}, a)
+
+    shared = _shared(knowledge)
+    shared["Volume(m3)"] = 2500.0
+    (knowledge / "compiled_ml_data.json").write_text(json.dumps(shared))
+
+    assert design_state.load_parameters(a)["Volume(m3)"] == 2500.0
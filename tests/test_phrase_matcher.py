@@ -0,0 +1,72 @@
+import pytest
+from utils.phrase_matcher import DesignChangeMatcher
+
+
+@pytest.fixture(scope="module")
+def matcher():
+    return DesignChangeMatcher()
+
+
+# -- plain material changes are applied without the LLM --
+@pytest.mark.parametrize("text, expected", [
+    ("use brick for the exterior walls", {"EW_PAR": 0}),
+    ("make the structure timber", {"BC": 2}),
+    ("set the roof to cork", {"RO_INS": 1}),
+    ("change exterior wall insulation to mineral wool", {"EW_INS": 4}),
+    ("change slab insulation to xps", {"ES_INS": 1}),
+    ("change the walls to brick", {"EW_PAR": 0}),            # bare "walls" means the exterior wall
+    ("set the walls to cork", {"EW_INS": 1}),                # only fits the exterior wall insulation
+    ("Switch the facade to rammed earth, please", {"EW_PAR": 2}),
+    ("use glass wool for the roof insulation", {"RO_INS": 4}),
+    ("switch walls to timber frame and roof insulation to cork", {"EW_PAR": 4, "RO_INS": 1}),
+])
+def test_plain_changes(matcher, text, expected):
+    assert matcher.extract(text) == expected
+
+
+# -- negations and hypotheticals must go to the LLM, never be applied as a change --
+@pytest.mark.parametrize("text", [
+    "don't use concrete for the walls",
+    "don’t use concrete for the walls",
+    "dont use concrete on the roof",
+    "do not use concrete for the walls",
+    "no concrete walls",
+    "never use eps in the roof insulation",
+    "avoid concrete in the roof",
+    "walls without concrete",
+    "remove the eps roof insulation",
+    "what if the walls were brick",
+    "would the roof be better in timber mass",
+    "could the structure be timber",
+    "change the walls from concrete to brick",
+    "use brick instead of concrete for the walls",
+])
+def test_negations_and_hypotheticals_escalate(matcher, text):
+    assert matcher.extract(text) is None
+
+
+# -- a material that fits only some of the component's parameters is not partially applied --
+@pytest.mark.parametrize("text", [
+    "change insulation to cork",       # cork is not a slab insulation
+    "change the insulation to xps",    # xps is not a wall insulation
+])
+def test_partial_matches_escalate(matcher, text):
+    assert matcher.extract(text) is None
+
+
+# -- compound requests: the part the matcher doesn't know must not be silently dropped --
+@pytest.mark.parametrize("text", [
+    "set exterior wall to brick and typology to courtyard",
+    "change walls to brick and increase the window ratio to high",
+    "make the roof timber frame and add more glazing",
+    "use brick for exterior walls and reduce wwr",
+    "change the wall color to brick red",
+    "change the front walls to brick",
+])
+def test_compound_requests_escalate(matcher, text):
+    assert matcher.extract(text) is None
+
+
+def test_ambiguous_requests_escalate(matcher):
+    assert matcher.extract("brick and concrete") is None
+    assert matcher.extract("make it greener") is None
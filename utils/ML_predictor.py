@@ -18,11 +18,14 @@ from PIL import Image
 script_dir = os.path.dirname(os.path.abspath(__file__))
 project_root = os.path.abspath(os.path.join(script_dir, ".."))
 
-compiled_input_path = os.path.join(project_root, "knowledge", "compiled_ml_data.json")
+# Session runs (utils/design_state.predictor_env) point input/output at knowledge/sessions/<id>/
+compiled_input_path = os.environ.get("COPILOT_ML_INPUT") or os.path.join(project_root, "knowledge", "compiled_ml_data.json")
 materials_path = os.path.join(project_root, "knowledge", "materials.json")
-json_folder = os.path.join(project_root, "knowledge", "iterations")
-destination_folder = os.path.join(project_root, "knowledge")
-destination_filename = "ml_output.json"
+image_folder = os.path.join(project_root, "knowledge", "iterations")   # Rhino captures (V*.png) are shared
+json_folder = os.environ.get("COPILOT_ML_ITERATIONS") or image_folder
+ml_output_file = os.environ.get("COPILOT_ML_OUTPUT") or os.path.join(project_root, "knowledge", "ml_output.json")
+destination_folder = os.path.dirname(ml_output_file)
+destination_filename = os.path.basename(ml_output_file)
 
 model_path = os.path.normpath(os.path.join(project_root, "..", "lightgbm_multi.pkl"))
 print("model to GWP PREDICTOR path:", model_path)
@@ -37,6 +40,7 @@ print(f"📂 Project root            : {project_root}")
 print(f"📄 Compiled input path     : {compiled_input_path}")
 print(f"📄 Materials path          : {materials_path}")
 print(f"📁 Iterations (json_folder): {json_folder}")
+print(f"📁 Captures (image_folder) : {image_folder}")
 print(f"📁 Destination folder      : {destination_folder}")
 print(f"📄 Model path              : {model_path}")
 
@@ -144,13 +148,13 @@ def save_version_json(inputs: dict, outputs: list, labels: list, folder: str):
 
 
 
-    existing_versions_clip = [f for f in os.listdir(folder) if f.startswith("V") and f.endswith(".json")]
+    existing_versions_clip = [f for f in os.listdir(image_folder) if f.startswith("V") and f.endswith(".json")]
     existing_numbers_clip = [int(f[1:-5]) for f in existing_versions_clip if f[1:-5].isdigit()]
     next_version_clip = max(existing_numbers_clip, default=-1)
     version_name_clip = f"V{next_version_clip}"
 
     latest_image_filename = version_name_clip + ".png"
-    latest_image_path = os.path.join(folder, latest_image_filename)
+    latest_image_path = os.path.join(image_folder, latest_image_filename)
     typology_prediction = clip_Gaia(latest_image_path) # calling CLIP on the latest png
     print(typology_prediction)
     # inputs["Typology"] = typology_prediction
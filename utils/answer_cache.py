@@ -0,0 +1,136 @@
+import threading
+import time
+import numpy as np
+from utils.embeddings import get_embedding
+from utils.shared_state import shared_state
+from utils.version_analysis_utils import get_design_revision, extract_versions_from_input
+
+# =====================================
+# Semantic answer cache for chat queries
+# =====================================
+
+ANSWER_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS answer_cache (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    revision TEXT NOT NULL,
+    intent TEXT,
+    versions TEXT,
+    query TEXT,
+    embedding BLOB,
+    answer TEXT,
+    created REAL
+);
+CREATE INDEX IF NOT EXISTS answer_cache_lookup ON answer_cache (revision, intent, versions);
+"""
+
+
+class SemanticAnswerCache:
+    """Cache answers by query embedding, keyed to the design revision and intent.
+
+    A hit requires the same intent, the same mentioned versions (V1, V2…),
+    an unchanged design revision and cosine similarity above `threshold`.
+    Any change to ml_output.json or knowledge/iterations clears the cache.
+    Entries live in the shared SQLite store, so every server worker sees them;
+    hit/miss counters are kept per worker so lookups never take the write lock.
+    """
+
+    def __init__(self, threshold=0.92, max_entries=256, store=shared_state):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.db = store
+        self._revision = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        store.ensure_schema(ANSWER_CACHE_SCHEMA)
+
+    def _check_revision(self):
+        revision = get_design_revision()
+        with self._lock:
+            changed, self._revision = revision != self._revision, revision
+        if changed:
+            dropped = self.db.execute("DELETE FROM answer_cache WHERE revision != ?", (revision,)).rowcount
+            if dropped:
+                print(f"[ANSWER CACHE] Design revision changed, dropping {dropped} entries")
+        return revision
+
+    def lookup(self, query, intent):
+        try:
+            query_emb = get_embedding(query)
+            query_emb = query_emb / np.linalg.norm(query_emb)
+            versions = ",".join(extract_versions_from_input(query))
+            revision = self._check_revision()
+            rows = self.db.execute(
+                "SELECT query, embedding, answer FROM answer_cache WHERE revision = ? AND intent IS ? AND versions = ?",
+                (revision, intent, versions)
+            ).fetchall()
+        except Exception as e:
+            print(f"[ANSWER CACHE] Lookup skipped: {e}")
+            return None
+
+        best, best_score = None, self.threshold
+        for cached_query, embedding, answer in rows:
+            score = float(np.dot(np.frombuffer(embedding, dtype=np.float32), query_emb))
+            if score >= best_score:
+                best, best_score = (cached_query, answer), score
+
+        with self._lock:
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if best is None:
+            return None
+        print(f"[ANSWER CACHE] Hit for '{query}' ≈ '{best[0]}' (score={best_score:.4f})")
+        return best[1]
+
+    def revision(self):
+        """Design revision to capture before computing an answer, then pass to store()."""
+        return get_design_revision()
+
+    def store(self, query, intent, answer, revision=None):
+        """Cache `answer`, computed against `revision`; skipped if the design changed in the meantime."""
+        if not answer:
+            return
+        try:
+            query_emb = get_embedding(query)
+            query_emb = (query_emb / np.linalg.norm(query_emb)).astype(np.float32)
+            current = self._check_revision()
+            if revision is not None and revision != current:
+                print(f"[ANSWER CACHE] Design changed while answering '{query}', not caching")
+                return
+            revision = current
+            with self.db.transaction() as conn:
+                conn.execute(
+                    "INSERT INTO answer_cache (revision, intent, versions, query, embedding, answer, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (revision, intent, ",".join(extract_versions_from_input(query)), query,
+                     query_emb.tobytes(), answer, time.time())
+                )
+                conn.execute(
+                    "DELETE FROM answer_cache WHERE id NOT IN "
+                    "(SELECT id FROM answer_cache ORDER BY id DESC LIMIT ?)",
+                    (self.max_entries,)
+                )
+        except Exception as e:
+            print(f"[ANSWER CACHE] Store skipped: {e}")
+
+    def invalidate(self):
+        self.db.execute("DELETE FROM answer_cache")
+        with self._lock:
+            self._revision = None
+
+    def stats(self):
+        """Shared entry count; hits and misses are this worker's."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        return {
+            "entries": self.db.execute("SELECT COUNT(*) FROM answer_cache").fetchone()[0],
+            "hits": hits,
+            "misses": misses,
+            "threshold": self.threshold
+        }
+
+
+# Shared instance used by the chat graph
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,57 @@
+import os
+import time
+
+# =====================================
+# Cache directories: age / size pruning
+# =====================================
+#
+# outputs/chart_cache/ and outputs/report_cache/ are keyed by content hashes,
+# so every changed chart or project leaves files behind that are never read
+# again. Both are pruned after use: entries older than the retention go first,
+# then the least recently used ones above the size limit (cache hits touch
+# their file, so the mtime is the last use). Files still being written
+# (".<job_id>.pdf", "*.tmp.png") are only removed by age.
+
+
+def touch(path):
+    """Mark a cache entry as used; False if it was pruned in the meantime."""
+    try:
+        os.utime(path, None)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _in_progress(name):
+    return name.startswith(".") or ".tmp" in name
+
+
+def prune_cache_dir(folder, max_age_s, max_files, suffix, label="CACHE"):
+    """Delete expired and least recently used `suffix` files of `folder`. Returns the number removed."""
+    try:
+        names = [name for name in os.listdir(folder) if name.endswith(suffix)]
+    except FileNotFoundError:
+        return 0
+
+    entries = []
+    for name in names:
+        try:
+            entries.append((os.stat(os.path.join(folder, name)).st_mtime, name))
+        except FileNotFoundError:
+            continue        # removed by another worker
+
+    cutoff = time.time() - max_age_s
+    doomed = [name for mtime, name in entries if mtime < cutoff]
+    live = sorted((mtime, name) for mtime, name in entries if mtime >= cutoff and not _in_progress(name))
+    doomed += [name for _, name in live[:max(0, len(live) - max_files)]]
+
+    removed = 0
+    for name in doomed:
+        try:
+            os.remove(os.path.join(folder, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        print(f"[{label}] Pruned {removed} cached file(s) from {folder}")
+    return removed
@@ -0,0 +1,20 @@
+import sys
+import importlib.util
+
+# =====================================
+# Chart worker: main module of spawned processes
+# =====================================
+#
+# A spawned process re-runs the parent's main module as "__mp_main__" before
+# it unpickles its task. Started as `python server/chat_server.py`, that is
+# the whole server: FastAPI, the LLM stack, the embeddings. The report charts
+# pool (and uvicorn's worker processes) only need the modules their tasks
+# live in, so they get this empty module as their main instead.
+
+
+def use_as_spawn_main():
+    """Make processes spawned from now on run this module as their main module."""
+    main = sys.modules["__main__"]
+    spec = importlib.util.find_spec("utils.chart_worker")
+    if getattr(getattr(main, "__spec__", None), "name", None) != spec.name:
+        main.__spec__ = spec    # multiprocessing.spawn re-imports __main__ by its spec name when it has one
@@ -0,0 +1,32 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# =====================================
+# Concurrent context gathering for LLM prompts
+# =====================================
+
+# Shared pool: fetchers are IO-bound (file reads, SQLite, embedding requests)
+_fetch_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="context-fetch")
+
+def gather_context(fetchers, defaults=None, label="CONTEXT"):
+    """Run independent zero-argument fetchers concurrently.
+
+    `fetchers` maps a name to a callable. Returns a dict of name -> result; a
+    fetcher that raises is logged and replaced by its entry in `defaults`
+    (or None), so one missing source never blocks the prompt.
+    """
+    defaults = defaults or {}
+    start = time.perf_counter()
+    futures = {name: _fetch_pool.submit(fn) for name, fn in fetchers.items()}
+
+    results = {}
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            print(f"[{label}] Fetcher '{name}' failed: {e}")
+            results[name] = defaults.get(name)
+
+    elapsed = (time.perf_counter() - start) * 1000
+    print(f"[{label}] Gathered {', '.join(fetchers)} in {elapsed:.1f} ms")
+    return results
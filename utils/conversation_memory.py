@@ -0,0 +1,279 @@
+import os
+import re
+import time
+import sqlite3
+import threading
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from utils.llm_gateway import llm_gateway, BACKGROUND
+from utils.prompt_budget import PROMPT_BUDGETS, estimate_tokens
+from utils.prompt_builder import build_messages
+from utils.shared_state import connect_wal
+
+# =====================================
+# Conversation memory: recent turns + rolling digest, persisted to SQLite
+# =====================================
+#
+# The last `max_turns` exchanges stay verbatim in a ring buffer. Turns pushed
+# out of it are folded into a short digest by a background LLM call every
+# `summarize_every` turns. Prompts get the digest plus as many recent turns
+# as fit in the history budget.
+#
+# SQLite (WAL) is the source of truth: the in-process buffer is re-read when
+# another server worker has added turns or a new digest for the session.
+
+MEMORY_DB_PATH = os.path.join("knowledge", "conversation_memory.sqlite3")
+CLAIM_TIMEOUT_S = 600   # turns claimed for a digest longer than this (worker died) are released
+
+DIGEST_INSTRUCTIONS = """
+You maintain a compact memory of a design conversation between an architect and a sustainability assistant.
+Merge the existing digest and the new turns into one updated digest.
+- Max 80 words, plain sentences, no bullet points.
+- Keep design decisions, materials and versions discussed, user preferences and open questions.
+- Drop greetings, repetition and numbers that are not decisions.
+"""
+
+# Follow-ups that only make sense with the previous turns ("why?", "what about V3?")
+FOLLOW_UP = re.compile(r"^(and|also|then|so|why|what about|how about)\b|\b(it|that|this|those|these|they|them|same)\b")
+
+_digest_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-digest")
+
+
+def is_follow_up(text):
+    """True for short or referential messages whose meaning depends on the history."""
+    text = text.strip().lower()
+    return len(text.split()) <= 3 or bool(FOLLOW_UP.search(text))
+
+
+def _clip(text, limit=400):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+class ConversationMemory:
+    """Bounded chat history for one conversation, with a summarized tail and SQLite persistence."""
+
+    def __init__(self, session_id="default", db_path=MEMORY_DB_PATH, max_turns=8, summarize_every=4,
+                 history_budget=PROMPT_BUDGETS["conversation_history"]):
+        self.session_id = session_id
+        self.db_path = db_path
+        self.summarize_every = summarize_every
+        self.history_budget = history_budget
+        self.recent = deque(maxlen=max_turns)
+        self.digest = ""
+        self._pending = []              # turns evicted from `recent`, not yet in the digest
+        self._summarizing = False
+        self._marker = None             # (last turn id, digest timestamp) the buffer was loaded at
+        self._lock = threading.Lock()
+        self._init_db()
+        self._load()
+
+    # -- persistence --
+    def _connect(self):
+        return connect_wal(self.db_path)
+
+    def _init_db(self):
+        with closing(self._connect()) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS turns (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id TEXT NOT NULL,
+                    user TEXT, assistant TEXT, intent TEXT, mode TEXT,
+                    timestamp REAL,
+                    summarized INTEGER DEFAULT 0,
+                    claimed_at REAL
+                )""")
+            # Databases created before claims were timestamped
+            columns = [r[1] for r in conn.execute("PRAGMA table_info(turns)")]
+            if "claimed_at" not in columns:
+                conn.execute("ALTER TABLE turns ADD COLUMN claimed_at REAL")
+            conn.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, id)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS digests (
+                    session_id TEXT PRIMARY KEY,
+                    digest TEXT,
+                    updated_at REAL
+                )""")
+
+    def _read_marker(self, conn):
+        last_id = conn.execute("SELECT MAX(id) FROM turns WHERE session_id = ?", (self.session_id,)).fetchone()[0]
+        row = conn.execute("SELECT updated_at FROM digests WHERE session_id = ?", (self.session_id,)).fetchone()
+        return (last_id, row[0] if row else None)
+
+    def _release_stale_claims(self, conn):
+        """Return turns claimed by a digest that never finished (its worker died) to the queue."""
+        cutoff = time.time() - CLAIM_TIMEOUT_S
+        where = "session_id = ? AND summarized = -1 AND (claimed_at IS NULL OR claimed_at < ?)"
+        if conn.execute(f"SELECT 1 FROM turns WHERE {where} LIMIT 1", (self.session_id, cutoff)).fetchone():
+            released = conn.execute(f"UPDATE turns SET summarized = 0, claimed_at = NULL WHERE {where}",
+                                    (self.session_id, cutoff)).rowcount
+            print(f"[MEMORY] Released {released} turns from a stale digest claim for '{self.session_id}'")
+
+    def _load(self, quiet=False):
+        """Restore the digest, the ring buffer and any unsummarized older turns."""
+        try:
+            with closing(self._connect()) as conn:
+                self._release_stale_claims(conn)
+                marker = self._read_marker(conn)
+                row = conn.execute("SELECT digest FROM digests WHERE session_id = ?", (self.session_id,)).fetchone()
+                rows = conn.execute(
+                    "SELECT id, user, assistant, intent, mode, timestamp FROM turns "
+                    "WHERE session_id = ? AND summarized = 0 ORDER BY id",
+                    (self.session_id,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"[MEMORY] Could not load history for '{self.session_id}': {e}")
+            return
+
+        turns = [
+            {"id": r[0], "user": r[1], "assistant": r[2], "intent": r[3], "mode": r[4], "timestamp": r[5]}
+            for r in rows
+        ]
+        keep = self.recent.maxlen
+        with self._lock:
+            self.digest = row[0] if row and row[0] else ""
+            self._pending = turns[:-keep] if len(turns) > keep else []
+            self.recent.clear()
+            self.recent.extend(turns[-keep:])
+            self._marker = marker
+        if turns and not quiet:
+            print(f"[MEMORY] Restored {len(turns)} turns for '{self.session_id}' (digest: {len(self.digest)} chars)")
+        self._maybe_summarize()
+
+    def _sync(self):
+        """Reload if another worker changed this session since the buffer was loaded."""
+        try:
+            with closing(self._connect()) as conn:
+                marker = self._read_marker(conn)
+        except sqlite3.Error:
+            return
+        if marker != self._marker:
+            self._load(quiet=True)
+
+    # -- turns --
+    def add_turn(self, user, assistant, intent=None, mode=None):
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute(
+                    "INSERT INTO turns (session_id, user, assistant, intent, mode, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                    (self.session_id, user, assistant, intent, mode, time.time())
+                )
+        except sqlite3.Error as e:
+            print(f"[MEMORY] Could not persist turn: {e}")
+            return
+        self._sync()
+
+    def recent_turns(self, n=5):
+        self._sync()
+        with self._lock:
+            return list(self.recent)[-n:]
+
+    def clear(self):
+        with self._lock:
+            self.recent.clear()
+            self._pending = []
+            self.digest = ""
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute("DELETE FROM turns WHERE session_id = ?", (self.session_id,))
+                conn.execute("DELETE FROM digests WHERE session_id = ?", (self.session_id,))
+        except sqlite3.Error as e:
+            print(f"[MEMORY] Could not clear history: {e}")
+
+    # -- prompt rendering --
+    def render_history(self, budget=None):
+        """Digest plus the newest turns that fit in `budget` tokens, oldest first ("" if empty)."""
+        budget = self.history_budget if budget is None else budget
+        self._sync()
+        with self._lock:
+            digest, turns = self.digest, list(self.recent)
+
+        blocks, remaining = [], budget
+        if digest:
+            digest_text = f"Earlier: {digest}"
+            remaining -= estimate_tokens(digest_text)
+            if remaining < 0:
+                return ""
+        for turn in reversed(turns):
+            block = f"User: {_clip(turn['user'], 200)}\nAssistant: {_clip(turn['assistant'])}"
+            cost = estimate_tokens(block)
+            if cost > remaining:
+                break
+            blocks.append(block)
+            remaining -= cost
+
+        blocks.reverse()
+        if digest:
+            blocks.insert(0, digest_text)
+        return "\n".join(blocks)
+
+    # -- background summarization --
+    def _maybe_summarize(self):
+        with self._lock:
+            if self._summarizing or len(self._pending) < self.summarize_every:
+                return
+            self._summarizing = True
+            batch = list(self._pending)
+        _digest_pool.submit(self._summarize, batch)
+
+    def _claim(self, ids):
+        """Mark `ids` as being summarized; returns the claim timestamp, or None if another worker took some."""
+        claimed_at = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            claimed = conn.executemany("UPDATE turns SET summarized = -1, claimed_at = ? WHERE id = ? AND summarized = 0",
+                                       [(claimed_at, i) for i in ids]).rowcount
+            conn.execute("COMMIT" if claimed == len(ids) else "ROLLBACK")
+        return claimed_at if claimed == len(ids) else None
+
+    def _summarize(self, batch):
+        ids = [t["id"] for t in batch]
+        claimed_at = None
+        try:
+            claimed_at = self._claim(ids)
+            if claimed_at is None:
+                return
+            turns_text = "\n".join(f"User: {_clip(t['user'], 200)}\nAssistant: {_clip(t['assistant'], 300)}" for t in batch)
+            messages = build_messages(
+                DIGEST_INSTRUCTIONS,
+                context={"Existing digest": self.digest or "(empty)", "New turns": turns_text},
+                call_name="conversation_digest"
+            )
+            try:
+                response = llm_gateway.chat(priority=BACKGROUND, label="conversation_digest", route="digest", messages=messages)
+                digest = response.choices[0].message.content.strip()
+            except Exception as e:
+                # Keep the information even without the LLM: append clipped user requests
+                print(f"[MEMORY] Digest LLM call failed, using extractive fallback: {e}")
+                digest = _clip(" ".join(filter(None, [self.digest] + [t["user"] for t in batch])), 600)
+
+            with closing(self._connect()) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                # The claim may have been released as stale (and retaken) while the LLM was slow
+                done = conn.executemany("UPDATE turns SET summarized = 1 WHERE id = ? AND summarized = -1 AND claimed_at = ?",
+                                        [(i, claimed_at) for i in ids]).rowcount
+                if done != len(ids):
+                    conn.execute("ROLLBACK")
+                    print(f"[MEMORY] Digest claim for '{self.session_id}' expired, discarding this digest")
+                    return
+                conn.execute(
+                    "INSERT INTO digests (session_id, digest, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(session_id) DO UPDATE SET digest = excluded.digest, updated_at = excluded.updated_at",
+                    (self.session_id, digest, time.time())
+                )
+                conn.execute("COMMIT")
+            print(f"[MEMORY] Folded {len(batch)} turns into the digest for '{self.session_id}'")
+        except Exception as e:
+            print(f"[MEMORY] Summarization failed: {e}")
+            try:
+                with closing(self._connect()) as conn:
+                    conn.executemany("UPDATE turns SET summarized = 0, claimed_at = NULL "
+                                     "WHERE id = ? AND summarized = -1 AND claimed_at = ?",
+                                     [(i, claimed_at) for i in ids])
+            except sqlite3.Error:
+                pass
+        finally:
+            with self._lock:
+                self._summarizing = False
+        self._load(quiet=True)
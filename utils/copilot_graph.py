@@ -6,15 +6,37 @@ class CopilotState(BaseModel):
     design_data: Dict[str, Any]
     intent: Optional[str] = None
     llm_response: Optional[str] = None
+    history: Optional[str] = None       # rendered conversation memory for the prompts
+    design_dir: Optional[str] = None    # session's own design files (utils/design_state); None = shared knowledge/ files
 
 
 
+import asyncio
 from llm_calls import (
     suggest_change,
     suggest_improvements,
-    answer_user_query
+    answer_user_query,
+    suggest_change_async,
+    suggest_improvements_async,
+    answer_user_query_async,
+    stream_chat_completion,
+    _answer_query_messages,
+    _improvement_messages
 )
 from utils.embeddings import classify_intent_via_embeddings
+from utils.answer_cache import answer_cache
+from utils.fast_answers import try_fast_answer
+from utils.conversation_memory import is_follow_up
+from utils.design_state import has_own_design
+
+def _cacheable(state: CopilotState) -> bool:
+    """Follow-ups ("why?", "what about it?") depend on the history, so they bypass the answer cache.
+
+    So do sessions with their own design: the cache is keyed to the shared ML output.
+    """
+    if has_own_design(state.design_dir):
+        return False
+    return not (state.history and is_follow_up(state.user_input))
 
 def classify_input_fn(state: CopilotState) -> CopilotState:
     intent, _ = classify_intent_via_embeddings(state.user_input)
@@ -22,46 +44,180 @@ def classify_input_fn(state: CopilotState) -> CopilotState:
     return state
 
 def suggest_change_fn(state: CopilotState) -> CopilotState:
-    state.llm_response = suggest_change(state.user_input, state.design_data)
+    state.llm_response = suggest_change(state.user_input, state.design_data, state.design_dir)
     return state
 
 def suggest_improvements_fn(state: CopilotState) -> CopilotState:
-    state.llm_response = suggest_improvements(state.user_input, state.design_data)
+    state.llm_response = suggest_improvements(state.user_input, state.design_data, state.history)
     return state
 
 def answer_query_fn(state: CopilotState) -> CopilotState:
-    state.llm_response = answer_user_query(state.user_input, state.design_data)
+    # Exact metric/version lookups are answered from the data, without the LLM
+    fast = try_fast_answer(state.user_input, state.design_dir)
+    if fast is not None:
+        state.llm_response = fast
+        return state
+    cacheable = _cacheable(state)
+    revision = answer_cache.revision() if cacheable else None   # the data this answer is computed against
+    cached = answer_cache.lookup(state.user_input, state.intent) if cacheable else None
+    if cached is not None:
+        state.llm_response = cached
+        return state
+    state.llm_response = answer_user_query(state.user_input, state.design_data, state.history, state.design_dir)
+    if cacheable:
+        answer_cache.store(state.user_input, state.intent, state.llm_response, revision=revision)
     return state
 
+# -- Async node variants (used with graph.ainvoke) --
+async def classify_input_afn(state: CopilotState) -> CopilotState:
+    intent, _ = await asyncio.to_thread(classify_intent_via_embeddings, state.user_input)
+    state.intent = intent
+    return state
 
+async def suggest_change_afn(state: CopilotState) -> CopilotState:
+    state.llm_response = await suggest_change_async(state.user_input, state.design_data, state.design_dir)
+    return state
+
+async def suggest_improvements_afn(state: CopilotState) -> CopilotState:
+    state.llm_response = await suggest_improvements_async(state.user_input, state.design_data, state.history)
+    return state
+
+async def answer_query_afn(state: CopilotState) -> CopilotState:
+    fast = await asyncio.to_thread(try_fast_answer, state.user_input, state.design_dir)
+    if fast is not None:
+        state.llm_response = fast
+        return state
+    cacheable = _cacheable(state)
+    revision = await asyncio.to_thread(answer_cache.revision) if cacheable else None
+    cached = await asyncio.to_thread(answer_cache.lookup, state.user_input, state.intent) if cacheable else None
+    if cached is not None:
+        state.llm_response = cached
+        return state
+    state.llm_response = await answer_user_query_async(state.user_input, state.design_data, state.history, state.design_dir)
+    if cacheable:
+        await asyncio.to_thread(answer_cache.store, state.user_input, state.intent, state.llm_response, revision)
+    return state
 
+
+
+import threading
 from langgraph.graph import StateGraph
 
-def build_copilot_graph():
+# Graph definition: node name -> function, and intent -> node routing
+GRAPH_NODES = {
+    "classify_input": classify_input_fn,
+    "handle_design_change": suggest_change_fn,
+    "suggest_improvement": suggest_improvements_fn,
+    "answer_query": answer_query_fn,
+}
+
+ASYNC_GRAPH_NODES = {
+    "classify_input": classify_input_afn,
+    "handle_design_change": suggest_change_afn,
+    "suggest_improvement": suggest_improvements_afn,
+    "answer_query": answer_query_afn,
+}
+
+INTENT_ROUTES = {
+    "design_change": "handle_design_change",
+    "improvement_suggestion": "suggest_improvement",
+    "carbon_query": "answer_query",
+    "general_query": "answer_query"  # ← AÑADE ESTO
+}
+
+def build_copilot_graph(async_nodes=False):
     g = StateGraph(CopilotState)
 
-    g.add_node("classify_input", classify_input_fn)
-    g.add_node("handle_design_change", suggest_change_fn)
-    g.add_node("suggest_improvement", suggest_improvements_fn)
-    g.add_node("answer_query", answer_query_fn)
+    nodes = ASYNC_GRAPH_NODES if async_nodes else GRAPH_NODES
+    for name, fn in nodes.items():
+        g.add_node(name, fn)
 
     g.set_entry_point("classify_input")
 
     g.add_conditional_edges(
         "classify_input",
         lambda state: state.intent,
-        {
-            "design_change": "handle_design_change",
-            "improvement_suggestion": "suggest_improvement",
-            "carbon_query": "answer_query",
-            "general_query": "answer_query"  # ← AÑADE ESTO
-        }
+        dict(INTENT_ROUTES)
     )
 
-
     # Fin del flujo
-    g.add_edge("handle_design_change", "__end__")
-    g.add_edge("suggest_improvement", "__end__")
-    g.add_edge("answer_query", "__end__")
+    for node in set(INTENT_ROUTES.values()):
+        g.add_edge(node, "__end__")
 
     return g.compile()
+
+
+# -- Compiled graphs shared across requests (one per node flavour) --
+_compiled_graphs = {}
+_graph_lock = threading.Lock()
+
+def _graph_signature(async_nodes=False):
+    """Identity of the graph definition; changes when nodes, routes or the builder are redefined."""
+    nodes = ASYNC_GRAPH_NODES if async_nodes else GRAPH_NODES
+    return (
+        build_copilot_graph.__code__,
+        tuple((name, fn.__code__) for name, fn in nodes.items()),
+        tuple(INTENT_ROUTES.items()),
+    )
+
+def get_copilot_graph(async_nodes=False):
+    """Return the compiled graph, rebuilding it only if the definition changed."""
+    signature = _graph_signature(async_nodes)
+    cached = _compiled_graphs.get(async_nodes)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    with _graph_lock:
+        cached = _compiled_graphs.get(async_nodes)
+        if cached is None or cached[0] != signature:
+            print(f"[GRAPH] Compiling copilot graph ({'async' if async_nodes else 'sync'} nodes)")
+            cached = (signature, build_copilot_graph(async_nodes))
+            _compiled_graphs[async_nodes] = cached
+    return cached[1]
+
+
+# -- Streaming variant: route first, then stream tokens from the LLM --
+async def stream_copilot_response(state: CopilotState):
+    """Yield ("intent", intent), then ("token", text) chunks, then ("done", full_response).
+
+    Uses the same intent routing as the graph. Query and improvement answers are
+    streamed token by token; design changes (which write files and run the
+    predictor) are yielded as one chunk once complete.
+    """
+    state = await classify_input_afn(state)
+    yield "intent", state.intent
+
+    node = INTENT_ROUTES.get(state.intent, "answer_query")
+
+    if node == "handle_design_change":
+        state = await suggest_change_afn(state)
+        yield "token", state.llm_response
+        yield "done", state.llm_response
+        return
+
+    if node == "answer_query":
+        fast = await asyncio.to_thread(try_fast_answer, state.user_input, state.design_dir)
+        if fast is not None:
+            yield "token", fast
+            yield "done", fast
+            return
+        revision = await asyncio.to_thread(answer_cache.revision) if _cacheable(state) else None
+        cached = await asyncio.to_thread(answer_cache.lookup, state.user_input, state.intent) if _cacheable(state) else None
+        if cached is not None:
+            yield "token", cached
+            yield "done", cached
+            return
+        messages = await asyncio.to_thread(_answer_query_messages, state.user_input, state.history, state.design_dir)
+    else:
+        messages = await asyncio.to_thread(_improvement_messages, state.user_input, state.design_data, state.history)
+
+    parts = []
+    route = "query" if node == "answer_query" else "suggestion"
+    async for delta in stream_chat_completion(messages, route=route):
+        parts.append(delta)
+        yield "token", delta
+
+    full_response = "".join(parts)
+    if node == "answer_query" and _cacheable(state):
+        await asyncio.to_thread(answer_cache.store, state.user_input, state.intent, full_response, revision)
+    yield "done", full_response
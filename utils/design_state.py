@@ -0,0 +1,86 @@
+import os
+import json
+import tempfile
+
+# =====================================
+# Design state: compiled parameters + ML output per session
+# =====================================
+#
+# The default session works on the files Rhino and the dashboard use
+# (knowledge/compiled_ml_data.json and knowledge/ml_output.json). Every other
+# session gets its own copy under knowledge/sessions/<session_id>/ the first
+# time it changes the design, so designers no longer overwrite each other.
+# Until then a session reads the shared files. `design_dir` is None for the
+# shared design.
+
+KNOWLEDGE_DIR = "knowledge"
+SESSIONS_DIR = os.path.join(KNOWLEDGE_DIR, "sessions")
+COMPILED_FILENAME = "compiled_ml_data.json"
+ML_OUTPUT_FILENAME = "ml_output.json"
+
+# Set by the geometry system (Rhino), so they always follow the shared file
+GEOMETRY_KEYS = ("A/V", "Volume(m3)", "VOL/VOLBBOX")
+
+
+def session_design_dir(session_id):
+    return os.path.join(SESSIONS_DIR, session_id)
+
+def has_own_design(design_dir):
+    """True once the session has written its own compiled parameters."""
+    return bool(design_dir) and os.path.exists(os.path.join(design_dir, COMPILED_FILENAME))
+
+def compiled_path(design_dir=None):
+    """Compiled parameters file the session reads (its own copy if it has one)."""
+    if has_own_design(design_dir):
+        return os.path.join(design_dir, COMPILED_FILENAME)
+    return os.path.join(KNOWLEDGE_DIR, COMPILED_FILENAME)
+
+def ml_output_path(design_dir=None):
+    """ML output file the session reads (its own predictions if it has any)."""
+    if design_dir and os.path.exists(os.path.join(design_dir, ML_OUTPUT_FILENAME)):
+        return os.path.join(design_dir, ML_OUTPUT_FILENAME)
+    return os.path.join(KNOWLEDGE_DIR, ML_OUTPUT_FILENAME)
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_parameters(design_dir=None):
+    """Current compiled parameters of the session; geometry values come from the shared file."""
+    try:
+        parameters = _read_json(compiled_path(design_dir))
+    except Exception as e:
+        print(f"[DESIGN STATE] Failed to load parameters: {e}")
+        return {}
+    if has_own_design(design_dir):
+        try:
+            shared = _read_json(os.path.join(KNOWLEDGE_DIR, COMPILED_FILENAME))
+            parameters.update({key: shared[key] for key in GEOMETRY_KEYS if key in shared})
+        except Exception:
+            pass
+    return parameters
+
+def save_parameters(parameters, design_dir=None):
+    """Write the compiled parameters to the session's own file (the shared one for the default session)."""
+    folder = design_dir or KNOWLEDGE_DIR
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, COMPILED_FILENAME)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(parameters, f, indent=2)
+        os.replace(tmp_path, path)     # readers in other workers never see a half-written file
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return path
+
+def predictor_env(design_dir=None):
+    """Environment overrides pointing ML_predictor.py at the session's files."""
+    if not design_dir:
+        return {}
+    return {
+        "COPILOT_ML_INPUT": os.path.abspath(os.path.join(design_dir, COMPILED_FILENAME)),
+        "COPILOT_ML_OUTPUT": os.path.abspath(os.path.join(design_dir, ML_OUTPUT_FILENAME)),
+        "COPILOT_ML_ITERATIONS": os.path.abspath(os.path.join(design_dir, "iterations")),
+    }
@@ -1,13 +1,24 @@
 import os
 import json
+import tempfile
+import threading
 import numpy as np
 from server.config import client, embedding_model
+from utils.shared_state import shared_state
 
 # Global cache to avoid redundant computation
 embedding_cache = {}
 
+INTENT_EXAMPLES_PATH = "knowledge/intent_examples.json"
+INTENT_MATRIX_PATH = "knowledge/intent_embeddings.npz"
+
+# Persisted example matrix: one L2-normalised row per (intent, example) pair.
+# Runtime edits bump the shared "intent_examples" revision so other server workers reload it.
+_example_index = None
+_example_lock = threading.Lock()
+
 # Load examples
-def load_intent_examples(path="knowledge/intent_examples.json"):
+def load_intent_examples(path=INTENT_EXAMPLES_PATH):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
@@ -24,10 +35,27 @@ def get_embedding(text: str) -> np.ndarray:
     embedding_cache[text] = vector
     return vector
 
+# Embed several texts with a single request (cached texts are not re-sent)
+def get_embeddings(texts: list) -> list:
+    missing = [t for t in dict.fromkeys(texts) if t not in embedding_cache]
+    if missing:
+        response = client.embeddings.create(
+            model=embedding_model,
+            input=[t.strip() for t in missing]
+        )
+        for text, item in zip(missing, response.data):
+            embedding_cache[text] = np.array(item.embedding)
+    return [embedding_cache[t] for t in texts]
+
 # Cosine similarity
 def cosine_similarity(vec1, vec2):
     return np.dot(vec1, vec2) / (np.linalg.norm(vec1) * np.linalg.norm(vec2))
 
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
 # Pre-cache example embeddings once at startup
 def preload_example_embeddings(examples: dict) -> dict:
     precomputed = {}
@@ -35,22 +63,197 @@ def preload_example_embeddings(examples: dict) -> dict:
         precomputed[intent] = [get_embedding(s) for s in samples]
     return precomputed
 
+# -- Atomic file writes (temp file in the same folder + os.replace) --
+def write_json_atomic(path, data):
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def save_matrix_atomic(path, **arrays):
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=".tmp_", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+# -- Persisted intent example matrix --
+def _save_example_index(index):
+    save_matrix_atomic(
+        INTENT_MATRIX_PATH,
+        matrix=index["matrix"],
+        intents=np.array(index["intents"], dtype=object),
+        texts=np.array(index["texts"], dtype=object),
+        model=np.array(embedding_model),
+    )
+
+def _load_saved_rows():
+    """Return {(intent, text): row} from the persisted matrix, or {} if unusable."""
+    if not os.path.exists(INTENT_MATRIX_PATH):
+        return {}
+    try:
+        with np.load(INTENT_MATRIX_PATH, allow_pickle=True) as saved:
+            if str(saved["model"]) != embedding_model:
+                print("[INTENT INDEX] Embedding model changed, re-embedding examples")
+                return {}
+            return {
+                (str(i), str(t)): row
+                for i, t, row in zip(saved["intents"], saved["texts"], saved["matrix"])
+            }
+    except Exception as e:
+        print(f"[INTENT INDEX] Could not read {INTENT_MATRIX_PATH}: {e}")
+        return {}
+
+def _current_example_index(revision, force_reload=False):
+    """The example matrix at `revision`, rebuilt from disk if stale (caller holds _example_lock)."""
+    global _example_index
+    if _example_index is not None and not force_reload and _example_index["revision"] == revision:
+        return _example_index
+
+    examples = load_intent_examples()
+    saved_rows = _load_saved_rows()
+
+    pairs = [(intent, text) for intent, samples in examples.items() for text in samples]
+    missing = list(dict.fromkeys(text for intent, text in pairs if (intent, text) not in saved_rows))
+    new_vectors = dict(zip(missing, get_embeddings(missing))) if missing else {}
+
+    rows = [
+        saved_rows[pair] if pair in saved_rows else new_vectors[pair[1]]
+        for pair in pairs
+    ]
+    index = {
+        "intents": [p[0] for p in pairs],
+        "texts": [p[1] for p in pairs],
+        "matrix": normalize_rows(np.array(rows, dtype=np.float32)) if rows else np.zeros((0, 0), dtype=np.float32),
+        "revision": revision,
+    }
+
+    if missing or len(saved_rows) != len(pairs):
+        _save_example_index(index)
+        print(f"[INTENT INDEX] Saved {len(pairs)} examples ({len(missing)} newly embedded)")
+
+    _example_index = index
+    return index
+
+def load_example_index(force_reload=False):
+    """Return the example matrix, embedding only examples missing from the saved file."""
+    revision = shared_state.revision("intent_examples")
+    with _example_lock:
+        return _current_example_index(revision, force_reload)
+
+# -- Runtime example registration --
+def add_intent_examples(intent: str, texts: list) -> list:
+    """Embed and register new examples for an existing intent. Returns the texts actually added."""
+    global _example_index
+    requested = list(dict.fromkeys(t.strip() for t in texts if t.strip()))
+    known = set(load_intent_examples().get(intent, []))
+    candidates = [t for t in requested if t not in known]
+    # Embed before taking the write lock; texts that turn out to be new are re-checked inside it
+    vectors = dict(zip(candidates, get_embeddings(candidates))) if candidates else {}
+
+    # The JSON + NPZ read-modify-write is serialised across server workers by the shared store's write lock
+    with shared_state.transaction(), _example_lock:
+        index = _current_example_index(shared_state.revision("intent_examples"))
+        examples = load_intent_examples()
+        if intent not in examples:
+            raise ValueError(f"Unknown intent '{intent}'. Known intents: {', '.join(examples)}")
+
+        existing = set(examples[intent])
+        new_texts = [t for t in requested if t not in existing]
+        if not new_texts:
+            return []
+        missing = [t for t in new_texts if t not in vectors]
+        if missing:
+            vectors.update(zip(missing, get_embeddings(missing)))
+
+        new_rows = normalize_rows(np.array([vectors[t] for t in new_texts], dtype=np.float32))
+        matrix = new_rows if index["matrix"].size == 0 else np.vstack([index["matrix"], new_rows])
+        updated = {
+            "intents": index["intents"] + [intent] * len(new_texts),
+            "texts": index["texts"] + new_texts,
+            "matrix": matrix,
+        }
+
+        examples[intent].extend(new_texts)
+        _save_example_index(updated)
+        write_json_atomic(INTENT_EXAMPLES_PATH, examples)
+        updated["revision"] = shared_state.bump("intent_examples")
+        # Swap in a new dict: classifiers hold either the old or the new index, never a mix of both
+        _example_index = updated
+
+    print(f"[INTENT INDEX] Added {len(new_texts)} example(s) to {intent}")
+    return new_texts
+
+def remove_intent_examples(intent: str, texts: list) -> list:
+    """Unregister examples from an intent. Returns the texts actually removed."""
+    global _example_index
+    # The JSON + NPZ read-modify-write is serialised across server workers by the shared store's write lock
+    with shared_state.transaction(), _example_lock:
+        index = _current_example_index(shared_state.revision("intent_examples"))
+        examples = load_intent_examples()
+        if intent not in examples:
+            raise ValueError(f"Unknown intent '{intent}'. Known intents: {', '.join(examples)}")
+
+        to_remove = {t.strip() for t in texts} & set(examples[intent])
+        if not to_remove:
+            return []
+
+        keep = [
+            row for row, (i, t) in enumerate(zip(index["intents"], index["texts"]))
+            if not (i == intent and t in to_remove)
+        ]
+        updated = {
+            "intents": [index["intents"][row] for row in keep],
+            "texts": [index["texts"][row] for row in keep],
+            "matrix": index["matrix"][keep],
+        }
+
+        examples[intent] = [t for t in examples[intent] if t not in to_remove]
+        _save_example_index(updated)
+        write_json_atomic(INTENT_EXAMPLES_PATH, examples)
+        updated["revision"] = shared_state.bump("intent_examples")
+        # Swap in a new dict: classifiers hold either the old or the new index, never a mix of both
+        _example_index = updated
+
+    print(f"[INTENT INDEX] Removed {len(to_remove)} example(s) from {intent}")
+    return sorted(to_remove)
+
 # Intent classification with cached comparisons
 def classify_intent_via_embeddings(user_input: str, examples: dict = None, precomputed: dict = None) -> tuple:
     try:
-        if examples is None:
-            examples = load_intent_examples()
-        if precomputed is None:
-            precomputed = preload_example_embeddings(examples)
-
         input_emb = get_embedding(user_input)
         best_intent, best_score = "general_query", -1
 
-        for intent, sample_embeddings in precomputed.items():
-            for sample_emb in sample_embeddings:
-                score = cosine_similarity(input_emb, sample_emb)
-                if score > best_score:
-                    best_score, best_intent = score, intent
+        if examples is None and precomputed is None:
+            # Single matrix product against the persisted example matrix
+            index = load_example_index()
+            if len(index["texts"]):
+                scores = index["matrix"] @ (input_emb / np.linalg.norm(input_emb))
+                best_row = int(np.argmax(scores))
+                best_intent, best_score = index["intents"][best_row], float(scores[best_row])
+        else:
+            if precomputed is None:
+                precomputed = preload_example_embeddings(examples)
+            for intent, sample_embeddings in precomputed.items():
+                for sample_emb in sample_embeddings:
+                    score = cosine_similarity(input_emb, sample_emb)
+                    if score > best_score:
+                        best_score, best_intent = score, intent
 
         print(f"[🔎 EMBEDDING INTENT] → {best_intent} (score={best_score:.4f})")
         return (best_intent, best_score) if best_score > 0.7 else ("general_query", best_score)
@@ -1,15 +1,25 @@
 # ╔══════════════════════════════════════════════════════════╗
 #   export.py  –  Copilot-style narrated report with LLM
 # ╚══════════════════════════════════════════════════════════╝
-
-import os, re, json
+#
+# ReportBuilder assembles the PDF; the chat server keeps one module import
+# (pandas / plotly / fpdf loaded once) and builds reports in-process.
+#
+#   python utils/export.py [V1 V2 …] [--output path.pdf] [--full]
+
+import os, re, json, time, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 import pandas as pd
-import plotly.express as px
 from fpdf import FPDF, XPos, YPos
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from server.config import client, completion_model
+from utils.llm_gateway import llm_gateway, BACKGROUND
+from utils.prompt_budget import PROMPT_BUDGETS, render_inputs, render_outputs, fit_sections
+from utils.prompt_builder import build_messages, canonical_json
+from utils.shared_state import shared_state
+from utils.report_charts import chart_renderer as default_chart_renderer, CHART_STYLE_VERSION
+from server.config import resolve_route
 
 # =====  directory & version filter  =========================
 OUT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "outputs"))
@@ -26,41 +36,134 @@ BENCHMARKS = {
     "A-D": 6.5
 }
 
+# =====  fonts  ==============================================
+# Georgia is looked up in COPILOT_REPORT_FONT_DIR, then the usual system folders.
+# Without it (typically Linux) DejaVu Serif is used, then fpdf's built-in Times.
+FONT_FAMILY = "Georgia"
+GEORGIA_FILES = {"": "georgia.ttf", "B": "georgiab.ttf", "I": "georgiai.ttf", "BI": "georgiaz.ttf"}
+DEJAVU_FILES = {"": "DejaVuSerif.ttf", "B": "DejaVuSerif-Bold.ttf", "I": "DejaVuSerif-Italic.ttf", "BI": "DejaVuSerif-BoldItalic.ttf"}
+FONT_DIRS = [d for d in [
+    os.environ.get("COPILOT_REPORT_FONT_DIR"),
+    r"C:\Windows\Fonts",
+    "/usr/share/fonts/truetype/msttcorefonts",
+    "/usr/share/fonts/truetype/dejavu",
+    "/usr/share/fonts/TTF",
+    "/Library/Fonts",
+    os.path.expanduser("~/.fonts"),
+] if d]
+
+# Characters the built-in (latin-1) fonts cannot encode
+CORE_FONT_SUBSTITUTES = str.maketrans({"–": "-", "—": "-", "‘": "'", "’": "'", "“": '"', "”": '"', "…": "...", "▲": "+", "▼": "-"})
+
+def resolve_font_files(font_dirs=None):
+    """Return {style: path} for Georgia or DejaVu Serif, or None to use the built-in Times font."""
+    font_dirs = FONT_DIRS if font_dirs is None else font_dirs
+    for files in (GEORGIA_FILES, DEJAVU_FILES):
+        for folder in font_dirs:
+            paths = {style: os.path.join(folder, name) for style, name in files.items()}
+            if all(os.path.exists(p) for p in paths.values()):
+                return paths
+    return None
+
 def beautify(k: str) -> str:
     k = re.sub(r"[_\-]", " ", k)
     k = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", k)
     return k.strip().title()
 
-def generate_input_narration(version_name, input_data):
-    try:
-        prompt = f"""
+INPUT_NARRATION_INSTRUCTIONS = """
 You are a sustainability design analyst reviewing architectural design inputs.
-Below are the input parameters for version {version_name}. Write a 2–3 sentence commentary describing the design approach and sustainability context.
+You will receive the input parameters of one design version. Write a 2–3 sentence commentary describing the design approach and sustainability context.
 """
-        response = client.chat.completions.create(
-            model=completion_model,
-            messages=[{"role": "system", "content": prompt + json.dumps(input_data, indent=2)}],
-            temperature=0.6,
-            max_tokens=300
+
+PAGE_DESCRIPTION_INSTRUCTIONS = """
+You are an expert in sustainable architecture. Write a brief, informative summary of the data provided for the given report section.
+"""
+
+# -- Narration cache --
+# Key = hash of the final messages (instructions + version/section + data) and the
+# resolved model settings, so re-exporting only pays for new or changed sections.
+# Stored in the shared SQLite store; LLM errors and empty completions are never cached.
+NARRATION_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS narration_cache (
+    key TEXT PRIMARY KEY,
+    label TEXT,
+    text TEXT,
+    created REAL,
+    last_used REAL
+);
+"""
+NARRATION_CACHE_TTL = 90 * 24 * 3600   # drop entries unused for 90 days
+
+def narration_cache_key(messages, request):
+    return hashlib.sha256(canonical_json({"messages": messages, "request": request}).encode("utf-8")).hexdigest()
+
+def cached_narration(label, messages, **overrides):
+    """Narration text for `messages`, from the cache or a BACKGROUND "narration" route call."""
+    shared_state.ensure_schema(NARRATION_CACHE_SCHEMA)
+    key = narration_cache_key(messages, {**resolve_route("narration"), **overrides})
+    row = shared_state.execute("SELECT text FROM narration_cache WHERE key = ?", (key,)).fetchone()
+    if row:
+        shared_state.execute("UPDATE narration_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        print(f"[NARRATION CACHE] Reused {label} ({key[:10]})")
+        return row[0]
+
+    response = llm_gateway.chat(
+        priority=BACKGROUND, label=label, route="narration",
+        messages=messages, **overrides
+    )
+    text = (response.choices[0].message.content or "").strip()
+    if not text:
+        raise ValueError(f"{label}: empty completion")     # placeholder now, retried on the next export
+    # The completion is already paid for: a cache write error must not lose it
+    try:
+        now = time.time()
+        shared_state.execute(
+            "INSERT OR REPLACE INTO narration_cache (key, label, text, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, label, text, now, now)
         )
-        return response.choices[0].message.content.strip()
+        shared_state.execute("DELETE FROM narration_cache WHERE last_used < ?", (now - NARRATION_CACHE_TTL,))
+    except Exception as e:
+        print(f"[NARRATION CACHE] Could not store {label}: {e}")
+    return text
+
+class NarrationUnavailable(str):
+    """Placeholder text of a narration whose LLM call failed: laid out like any narration, never kept."""
+
+def generate_input_narration(version_name, input_data):
+    try:
+        messages = build_messages(
+            INPUT_NARRATION_INSTRUCTIONS,
+            context={
+                "Version": version_name,
+                "Inputs": fit_sections([("", render_inputs(input_data), 0)], PROMPT_BUDGETS["report_narration"]),
+            },
+            call_name="report_narration"
+        )
+        return cached_narration("input_narration", messages)
     except Exception:
-        return "LLM error: input summary unavailable."
+        return NarrationUnavailable("LLM error: input summary unavailable.")
+
+def render_page_data(data_dict):
+    """Outputs dicts become one metric line; nested trend dicts ({series: {version: value}}) one line per series."""
+    if data_dict and all(isinstance(v, dict) for v in data_dict.values()):
+        return "\n".join(f"{series}: {render_outputs(values)}" for series, values in data_dict.items())
+    if data_dict and all(isinstance(v, (int, float)) for v in data_dict.values()):
+        return render_outputs(data_dict)
+    return canonical_json(data_dict)
 
 def generate_page_level_llm_description(page_title, data_dict):
     try:
-        prompt = f"""
-You are an expert in sustainable architecture. Write a brief, informative summary of the following data for the report section titled: {page_title}
-"""
-        response = client.chat.completions.create(
-            model=completion_model,
-            messages=[{"role": "system", "content": prompt + json.dumps(data_dict, indent=2)}],
-            temperature=0.5,
-            max_tokens=250
+        messages = build_messages(
+            PAGE_DESCRIPTION_INSTRUCTIONS,
+            context={
+                "Section": page_title,
+                "Data": fit_sections([("", render_page_data(data_dict), 0)], PROMPT_BUDGETS["report_narration"]),
+            },
+            call_name="report_narration"
         )
-        return response.choices[0].message.content.strip()
+        return cached_narration("page_narration", messages, temperature=0.5, max_tokens=250)
     except Exception:
-        return "LLM error: section summary unavailable."
+        return NarrationUnavailable("LLM error: section summary unavailable.")
 
 def get_val(frag, d):
     for k, v in d.items():
@@ -69,7 +172,33 @@ def get_val(frag, d):
             except: return 0.0
     return 0.0
 
+class ReportCancelled(Exception):
+    pass
+
+CANCEL_POLL_S = 0.5     # how often waits on narrations / charts look at the cancel event
+
 class PDF(FPDF):
+    font_family_name = FONT_FAMILY
+
+    def setup_fonts(self, font_files):
+        if font_files:
+            for style, path in font_files.items():
+                self.add_font(FONT_FAMILY, style, path)
+        else:
+            print("[EXPORT] Georgia/DejaVu fonts not found, using built-in Times")
+            self.font_family_name = "Times"
+
+    def set_font(self, family=None, style="", size=0):
+        # Layout code always asks for Georgia; map it to whatever was registered
+        if family == FONT_FAMILY:
+            family = self.font_family_name
+        super().set_font(family, style, size)
+
+    def normalize_text(self, text):
+        if self.font_family_name == "Times":
+            text = text.translate(CORE_FONT_SUBSTITUTES).encode("latin-1", "replace").decode("latin-1")
+        return super().normalize_text(text)
+
     def header(self):
         if self.page_no() > 1:
             try: self.image(LOGO_PATH, x=192, y=5, w=18)
@@ -112,7 +241,7 @@ class PDF(FPDF):
         self.ln(10)
         self.cell(0, 10, f"Generated on {ts}", align="C", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
-    def page_inputs(self, v, data):
+    def page_inputs(self, v, data, narration):
         self.head_title = f"Input Parameters – {v}"
         self.head_color = COLORS[2]
         self.add_page()
@@ -131,9 +260,9 @@ class PDF(FPDF):
             self.cell(95, 8, right, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
         self.ln(5)
-        self.wrap(generate_input_narration(v, data))
+        self.wrap(narration)
 
-    def page_plot(self, title, data, img, color_index):
+    def page_plot(self, title, img, color_index, narration):
         self.head_title = title
         self.head_color = COLORS[color_index % len(COLORS)]
         self.add_page()
@@ -144,12 +273,21 @@ class PDF(FPDF):
 
         self.set_font("Georgia", "", 10)
         self.set_text_color(33)
-        self.wrap(generate_page_level_llm_description(title, data))
+        self.wrap(narration)
         self.ln(4)
 
         if os.path.exists(img):
             self.image(img, x=15, w=180)
 
+    def render_page(self, page):
+        """Lay out one page spec (see ReportBuilder._version_pages)."""
+        if page["page"] == "inputs":
+            self.page_inputs(page["version"], page["data"], page["narration"])
+        elif page["page"] == "materials":
+            self.page_materials(page["version"], page["image"])
+        else:
+            self.page_plot(page["title"], page["image"], page["color_index"], page["narration"])
+
     def page_materials(self, v, image_path):
         self.head_title = f"Material System – {v}"
         self.head_color = COLORS[3]
@@ -165,77 +303,311 @@ class PDF(FPDF):
         if os.path.exists(image_path):
             self.image(image_path, x=15, w=180)
 
-pdf = PDF()
-pdf.add_font("Georgia", "",  r"C:\\Windows\\Fonts\\georgia.ttf")
-pdf.add_font("Georgia", "B", r"C:\\Windows\\Fonts\\georgiab.ttf")
-pdf.add_font("Georgia", "I", r"C:\\Windows\\Fonts\\georgiai.ttf")
-pdf.add_font("Georgia", "BI",r"C:\\Windows\\Fonts\\georgiaz.ttf")
-
-pdf.cover(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-
-vers = {}
-for f in sorted(os.listdir(VERS_DIR)):
-    if re.match(r"^V\d+\.json$", f, re.IGNORECASE):
-        name = os.path.splitext(f)[0]
-        with open(os.path.join(VERS_DIR, f)) as fp:
-            vers[name] = json.load(fp)
-order = sorted(vers)
-
-def save_bar_plot(data_dict, title, path, benchmark=None):
-    fig = px.bar(x=list(data_dict.keys()), y=list(data_dict.values()),
-                 color=list(data_dict.keys()), text=[f"{v:.2f}" for v in data_dict.values()],
-                 color_discrete_sequence=COLORS)
-    if benchmark is not None:
-        fig.add_hline(y=benchmark, line_dash="dash", line_color="red",
-                      annotation_text="Benchmark", annotation_position="top right")
-    fig.update_layout(
-        title=title, plot_bgcolor='white', paper_bgcolor='white',
-        width=640, height=400, margin=dict(l=20, r=20, t=40, b=20), font=dict(family="Georgia")
-    )
-    fig.write_image(path)
-
-def save_trend(df, title, path):
-    fig = px.line(df, markers=True, color_discrete_sequence=COLORS)
-    fig.update_layout(
-        title=title, plot_bgcolor='white', paper_bgcolor='white',
-        width=700, height=400, margin=dict(l=20, r=20, t=40, b=20), font=dict(family="Georgia")
-    )
-    fig.write_image(path)
-
-energy_records = []
-carbon_records = []
-gwp_records = []
-
-for v, js in vers.items():
-    pdf.page_inputs(v, js["inputs_decoded"])
-    version_img_path = os.path.join(VERS_DIR, f"{v}.png")
-    pdf.page_materials(v, version_img_path)
-
-    energy_dict = {k: get_val(k, js["outputs"]) for k in ["Energy Intensity", "Cooling Demand", "Heating Demand"]}
-    carbon_dict = {k: get_val(k, js["outputs"]) for k in ["Operational Carbon", "A-D", "GWP total"]}
-
-    save_bar_plot(energy_dict, f"Energy – {v}", os.path.join(OUT_DIR, f"energy_{v}.png"), benchmark=BENCHMARKS["EUI"])
-    save_bar_plot(carbon_dict, f"Carbon – {v}", os.path.join(OUT_DIR, f"carbon_{v}.png"), benchmark=BENCHMARKS["Operational"])
-
-    pdf.page_plot(f"Energy Performance – {v}", js["outputs"], os.path.join(OUT_DIR, f"energy_{v}.png"), 0)
-    pdf.page_plot(f"Carbon Emissions – {v}", js["outputs"], os.path.join(OUT_DIR, f"carbon_{v}.png"), 1)
-
-    energy_records.append({"Version": v, **energy_dict})
-    carbon_records.append({"Version": v, "Operational": carbon_dict["Operational Carbon"], "A-D": carbon_dict["A-D"]})
-    gwp_records.append({"Version": v, "Total": carbon_dict["Operational Carbon"] + carbon_dict["A-D"]})
-
-energy_df = pd.DataFrame(energy_records).set_index("Version")
-carbon_df = pd.DataFrame(carbon_records).set_index("Version")
-gwp_df = pd.DataFrame(gwp_records).set_index("Version")
-
-save_trend(energy_df, "Energy Trend by Version", os.path.join(OUT_DIR, "energy_trend.png"))
-save_trend(carbon_df, "Carbon Trend by Version", os.path.join(OUT_DIR, "carbon_trend.png"))
-save_trend(gwp_df, "GWP Trend by Version", os.path.join(OUT_DIR, "gwp_trend.png"))
-
-pdf.page_plot("Energy Trend by Version", energy_df.to_dict(), os.path.join(OUT_DIR, "energy_trend.png"), 0)
-pdf.page_plot("Carbon Trend by Version", carbon_df.to_dict(), os.path.join(OUT_DIR, "carbon_trend.png"), 1)
-pdf.page_plot("GWP Trend by Version", gwp_df.to_dict(), os.path.join(OUT_DIR, "gwp_trend.png"), 2)
-
-pdf_path = os.path.join(OUT_DIR, "Full_Building_Report.pdf")
-pdf.output(pdf_path)
-print("✅ Report generated:", pdf_path)
+def bar_chart_spec(data_dict, title, benchmark=None):
+    return {"kind": "bar", "title": title, "data": data_dict, "benchmark": benchmark, "colors": COLORS}
+
+def trend_chart_spec(df, title):
+    return {"kind": "trend", "title": title, "data": df.to_dict(), "colors": COLORS}
+
+def load_versions(versions_dir=VERS_DIR, versions=None):
+    """{name: version data} for V*.json files in filename order, optionally limited to `versions`."""
+    vers = {}
+    for f in sorted(os.listdir(versions_dir)):
+        if re.match(r"^V\d+\.json$", f, re.IGNORECASE):
+            name = os.path.splitext(f)[0]
+            if versions is not None and name not in versions:
+                continue
+            with open(os.path.join(versions_dir, f)) as fp:
+                vers[name] = json.load(fp)
+    return vers
+
+# =====  page fragments  =====================================
+# Each version's pages are persisted as page specs (layout inputs + narration
+# text + chart paths), keyed by a hash of everything that shapes them. The next
+# export lays those pages out again without narrations, so only new or changed
+# versions (and the trend pages) cost real work. Chart paths are the
+# content-addressed files of outputs/chart_cache/, which the build re-renders
+# if they were pruned. Versions with a failed narration are not saved, so
+# their pages are retried.
+FRAGMENT_DIR = os.path.join(OUT_DIR, "report_fragments")
+FRAGMENT_FORMAT = 2     # 2: chart images point at the chart cache, not outputs/<chart>_<version>.png
+
+def _file_digest(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def version_fragment_key(v, js, image_path, sections, chart_backend):
+    payload = {
+        "format": FRAGMENT_FORMAT, "version": v, "data": js, "image": _file_digest(image_path),
+        "sections": [s for s in SECTIONS if s in sections and s != "trends"], "charts": [chart_backend, CHART_STYLE_VERSION],
+        "narration": [INPUT_NARRATION_INSTRUCTIONS, PAGE_DESCRIPTION_INSTRUCTIONS, resolve_route("narration")],
+    }
+    return hashlib.sha256(canonical_json(payload).encode("utf-8")).hexdigest()
+
+def load_fragment(v, key, fragment_dir=FRAGMENT_DIR, chart_paths=None):
+    """Saved page specs for `v` if they match `key` and every chart is one of `chart_paths`, else None."""
+    try:
+        with open(os.path.join(fragment_dir, f"{v}.json"), encoding="utf-8") as f:
+            fragment = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if fragment.get("key") != key:
+        return None
+    if chart_paths is not None and any(page["page"] == "plot" and page["image"] not in chart_paths
+                                       for page in fragment["pages"]):
+        return None     # stale chart: not the image this build renders for the version's data
+    return fragment["pages"]
+
+def save_fragment(v, key, pages, fragment_dir=FRAGMENT_DIR):
+    os.makedirs(fragment_dir, exist_ok=True)
+    path = os.path.join(fragment_dir, f"{v}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"key": key, "version": v, "pages": pages}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+# =====  report builder  =====================================
+SECTIONS = ("inputs", "materials", "energy", "carbon", "trends")
+
+class ReportBuilder:
+    """Build the narrated PDF report for a set of versions.
+
+    Versions whose page fragment is still valid are laid out from it; for
+    the others, narrations are planned up front and generated concurrently
+    on a pool sized to the LLM gateway's concurrency while their charts
+    render, and their fragments are saved. Trend pages are always rebuilt.
+    `on_progress(progress)` is called after every page and narration with
+    pages_done / pages_total / llm_done / llm_total / llm_pending; setting
+    `cancel_event` stops the build at the next page, or within CANCEL_POLL_S
+    while it waits for narrations or charts (ReportCancelled).
+    `narration_failures` counts the placeholders of the last build.
+    """
+
+    def __init__(self, versions_dir=VERS_DIR, out_dir=OUT_DIR, font_dirs=None, on_progress=None, cancel_event=None,
+                 narration_workers=None, chart_renderer=None, incremental=True):
+        self.versions_dir = versions_dir
+        self.out_dir = out_dir
+        self.fragment_dir = os.path.join(out_dir, "report_fragments")
+        self.font_files = resolve_font_files(font_dirs)
+        self.on_progress = on_progress
+        self.cancel_event = cancel_event
+        self.narration_workers = narration_workers or llm_gateway.max_concurrency
+        self.chart_renderer = chart_renderer or default_chart_renderer
+        self.incremental = incremental
+        self.progress = {}
+        self.latencies = []             # (narration label, seconds) of the last build
+        self.narration_failures = 0     # narrations of the last build that fell back to a placeholder
+        self._lock = threading.Lock()
+
+    # -- progress --
+    def _report(self, **increments):
+        with self._lock:
+            for key, amount in increments.items():
+                self.progress[key] += amount
+            progress = {**self.progress, "llm_pending": self.progress["llm_total"] - self.progress["llm_done"]}
+        if self.on_progress:
+            self.on_progress(progress)
+
+    def _check_cancel(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ReportCancelled()
+
+    def _page_done(self):
+        self._report(pages_done=1)
+        self._check_cancel()
+
+    def _wait(self, futures):
+        """Wait for `futures`, checking `cancel_event`; on cancel drop the ones not started and raise ReportCancelled."""
+        pending = set(futures)
+        while pending:
+            try:
+                self._check_cancel()
+            except ReportCancelled:
+                for future in pending:
+                    future.cancel()
+                raise
+            _, pending = wait(pending, timeout=CANCEL_POLL_S)
+        for future in futures:
+            future.result()     # re-raise a failed render / narration
+
+    def _result(self, future):
+        self._wait([future])
+        return future.result()
+
+    def _plan(self, vers, pending, sections):
+        per_version_pages = sum(s in sections for s in ("inputs", "materials", "energy", "carbon"))
+        per_version_llm = sum(s in sections for s in ("inputs", "energy", "carbon"))
+        trends = 3 if "trends" in sections and vers else 0
+        self.progress = {"pages_done": 0, "pages_total": 1 + per_version_pages * len(vers) + trends,
+                         "llm_done": 0, "llm_total": per_version_llm * len(pending) + trends}
+        self._report()
+
+    # -- narrations --
+    def _narration_jobs(self, pending, trends, sections):
+        """Every LLM narration still needed, as (key, function, args) in page order."""
+        jobs = []
+        for v, js in pending.items():
+            if "inputs" in sections:
+                jobs.append((("inputs", v), generate_input_narration, (v, js["inputs_decoded"])))
+            if "energy" in sections:
+                jobs.append((("energy", v), generate_page_level_llm_description, (f"Energy Performance – {v}", js["outputs"])))
+            if "carbon" in sections:
+                jobs.append((("carbon", v), generate_page_level_llm_description, (f"Carbon Emissions – {v}", js["outputs"])))
+        for title, df in trends:
+            jobs.append((("trend", title), generate_page_level_llm_description, (title, df.to_dict())))
+        return jobs
+
+    def _timed_narration(self, key, fn, args):
+        start = time.perf_counter()
+        text = fn(*args)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.latencies.append((" ".join(key), elapsed))
+            if isinstance(text, NarrationUnavailable):
+                self.narration_failures += 1
+        print(f"[EXPORT] Narration {' '.join(key)}: {elapsed:.2f}s")
+        self._report(llm_done=1)
+        return text
+
+    def _log_timings(self, total):
+        if self.latencies:
+            times = sorted(t for _, t in self.latencies)
+            print(f"[EXPORT] {len(times)} narrations on {self.narration_workers} workers: "
+                  f"sum {sum(times):.1f}s, median {times[len(times) // 2]:.2f}s, max {times[-1]:.2f}s")
+        if self.narration_failures:
+            print(f"[EXPORT] {self.narration_failures} narration(s) unavailable, placeholders used")
+        print(f"[EXPORT] Report built in {total:.1f}s")
+
+    # -- pages --
+    def _version_pages(self, v, js, narrations, chart_paths, sections):
+        """Page specs for one version, waiting for its narrations."""
+        pages = []
+        if "inputs" in sections:
+            pages.append({"page": "inputs", "version": v, "data": js["inputs_decoded"],
+                          "narration": self._result(narrations[("inputs", v)])})
+        if "materials" in sections:
+            pages.append({"page": "materials", "version": v, "image": os.path.join(self.versions_dir, f"{v}.png")})
+        if "energy" in sections:
+            pages.append({"page": "plot", "title": f"Energy Performance – {v}", "color_index": 0,
+                          "image": chart_paths[("energy", v)], "narration": self._result(narrations[("energy", v)])})
+        if "carbon" in sections:
+            pages.append({"page": "plot", "title": f"Carbon Emissions – {v}", "color_index": 1,
+                          "image": chart_paths[("carbon", v)], "narration": self._result(narrations[("carbon", v)])})
+        return pages
+
+    def _chart_specs(self, metrics, trends, sections):
+        """Every chart of the report by page key; versions laid out from fragments need theirs too."""
+        specs = {}
+        for v, (energy_dict, carbon_dict) in metrics.items():
+            if "energy" in sections:
+                specs[("energy", v)] = bar_chart_spec(energy_dict, f"Energy – {v}", BENCHMARKS["EUI"])
+            if "carbon" in sections:
+                specs[("carbon", v)] = bar_chart_spec(carbon_dict, f"Carbon – {v}", BENCHMARKS["Operational"])
+        for title, df in trends:
+            specs[("trend", title)] = trend_chart_spec(df, title)
+        return specs
+
+    # -- build --
+    def build(self, versions=None, output_path=None, sections=SECTIONS):
+        """Write the report for `versions` (default: all V*.json) and return the PDF path."""
+        start = time.perf_counter()
+        output_path = output_path or os.path.join(self.out_dir, "Full_Building_Report.pdf")
+        os.makedirs(self.out_dir, exist_ok=True)
+        vers = load_versions(self.versions_dir, versions)
+        self.latencies = []
+        self.narration_failures = 0
+
+        metrics = {}
+        for v, js in vers.items():
+            metrics[v] = (
+                {k: get_val(k, js["outputs"]) for k in ["Energy Intensity", "Cooling Demand", "Heating Demand"]},
+                {k: get_val(k, js["outputs"]) for k in ["Operational Carbon", "A-D", "GWP total"]},
+            )
+        trends = []
+        if "trends" in sections and vers:
+            energy_df = pd.DataFrame([{"Version": v, **e} for v, (e, c) in metrics.items()]).set_index("Version")
+            carbon_df = pd.DataFrame([{"Version": v, "Operational": c["Operational Carbon"], "A-D": c["A-D"]}
+                                      for v, (e, c) in metrics.items()]).set_index("Version")
+            gwp_df = pd.DataFrame([{"Version": v, "Total": c["Operational Carbon"] + c["A-D"]}
+                                   for v, (e, c) in metrics.items()]).set_index("Version")
+            trends = [
+                ("Energy Trend by Version", energy_df),
+                ("Carbon Trend by Version", carbon_df),
+                ("GWP Trend by Version", gwp_df),
+            ]
+        chart_specs = self._chart_specs(metrics, trends, sections)
+        chart_paths = {key: self.chart_renderer.cache_path(spec) for key, spec in chart_specs.items()}
+
+        # Reuse the saved pages of versions that did not change
+        keys, fragments = {}, {}
+        for v, js in vers.items():
+            keys[v] = version_fragment_key(v, js, os.path.join(self.versions_dir, f"{v}.png"), sections,
+                                           self.chart_renderer.backend)
+            pages = load_fragment(v, keys[v], self.fragment_dir, set(chart_paths.values())) if self.incremental else None
+            if pages is not None:
+                fragments[v] = pages
+        pending = {v: js for v, js in vers.items() if v not in fragments}
+        self._plan(vers, pending, sections)
+        print(f"[EXPORT] {len(fragments)} version(s) from saved page fragments, {len(pending)} to build")
+
+        # Narrations run in the background while the charts render (process pool) and the pages are laid out
+        pool = ThreadPoolExecutor(max_workers=self.narration_workers, thread_name_prefix="report-narration")
+        narrations = {
+            key: pool.submit(self._timed_narration, key, fn, args)
+            for key, fn, args in self._narration_jobs(pending, trends, sections)
+        }
+        try:
+            chart_futures, _ = self.chart_renderer.submit_all(chart_specs.values())
+            self._wait(chart_futures)
+
+            pdf = PDF()
+            pdf.setup_fonts(self.font_files)
+            pdf.cover(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+            self._page_done()
+
+            for v, js in vers.items():
+                pages = fragments.get(v)
+                if pages is None:
+                    pages = self._version_pages(v, js, narrations, chart_paths, sections)
+                    # A placeholder narration must not be reused: rebuild this version next time
+                    if any(isinstance(page.get("narration"), NarrationUnavailable) for page in pages):
+                        print(f"[EXPORT] {v}: narration unavailable, page fragment not saved")
+                    else:
+                        save_fragment(v, keys[v], pages, self.fragment_dir)
+                for page in pages:
+                    pdf.render_page(page)
+                    self._page_done()
+
+            for color_index, (title, df) in enumerate(trends):
+                pdf.page_plot(title, chart_paths[("trend", title)], color_index, self._result(narrations[("trend", title)]))
+                self._page_done()
+        finally:
+            # On cancel/failure drop the narrations that have not started yet
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        pdf.output(output_path)
+        self._log_timings(time.perf_counter() - start)
+        return output_path
+
+
+# =====  CLI  ================================================
+PROGRESS_PREFIX = "[EXPORT PROGRESS]"
+
+def print_progress(progress):
+    print(f"{PROGRESS_PREFIX} {json.dumps(progress)}", flush=True)
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate the narrated building performance report.")
+    parser.add_argument("versions", nargs="*", help="versions to include (default: all V*.json)")
+    parser.add_argument("--output", help="PDF path (default: outputs/Full_Building_Report.pdf)")
+    parser.add_argument("--font-dir", action="append", help="folder with georgia*.ttf (repeatable)")
+    parser.add_argument("--full", action="store_true", help="ignore saved page fragments and rebuild every version")
+    args = parser.parse_args()
+
+    builder = ReportBuilder(font_dirs=args.font_dir and args.font_dir + FONT_DIRS, on_progress=print_progress,
+                            incremental=not args.full)
+    pdf_path = builder.build(versions=args.versions or None, output_path=args.output)
+    print("✅ Report generated:", pdf_path)
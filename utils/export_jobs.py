@@ -0,0 +1,282 @@
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from utils.shared_state import shared_state
+from utils.prompt_builder import canonical_json
+from utils.report_charts import CHART_BACKEND, CHART_STYLE_VERSION
+from utils.cache_dirs import prune_cache_dir, touch
+from server.config import resolve_route
+
+# =====================================
+# Export jobs: report generation in the background
+# =====================================
+#
+# POST /api/export_report submits a job and returns its id immediately.
+# Jobs run ReportBuilder (utils/export.py) one at a time on a background
+# thread of the server process, so pandas/plotly/fpdf are imported once, and
+# record its progress (pages done, LLM calls pending) after every page. Each
+# job builds its own PDF (outputs/report_cache/.<job_id>.pdf), so concurrent
+# exports never overwrite each other. Finished PDFs are moved into
+# outputs/report_cache/ keyed by a hash of every version
+# file, the report code and its model/chart settings, so exporting an unchanged project returns the previous PDF at once
+# (reports with a failed narration are not cached: the job keeps its own file).
+# The cache is pruned by age and size after every build. Job records live in the
+# shared state store, so any server worker can report progress or cancel;
+# the owning worker refreshes a heartbeat on its jobs, and a queued/running
+# job whose heartbeat stopped (worker crashed or restarted) counts as failed.
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# Every module whose code shapes the PDF (layout, charts, prompts, model routes)
+REPORT_MODULES = [os.path.join(ROOT_DIR, *parts) for parts in (
+    ("utils", "export.py"), ("utils", "report_charts.py"), ("utils", "prompt_budget.py"),
+    ("utils", "prompt_builder.py"), ("server", "config.py"),
+)]
+VERS_DIR = os.path.join(ROOT_DIR, "knowledge", "iterations")
+REPORT_CACHE_DIR = os.path.join(ROOT_DIR, "outputs", "report_cache")
+
+FINISHED = ("done", "failed", "cancelled")
+JOB_RETENTION_S = 24 * 3600
+REPORT_CACHE_RETENTION_S = float(os.environ.get("COPILOT_REPORT_CACHE_RETENTION_S", str(7 * 24 * 3600)))
+REPORT_CACHE_MAX_FILES = int(os.environ.get("COPILOT_REPORT_CACHE_MAX_FILES", "50"))
+HEARTBEAT_S = 10                # owner refreshes its unfinished jobs this often
+JOB_STALE_S = 60                # unfinished job without a heartbeat for this long is failed
+
+_VERSION_FILE = re.compile(r"^V\d+\.(json|png)$", re.IGNORECASE)
+
+
+def report_inputs_hash(folder=VERS_DIR, modules=REPORT_MODULES):
+    """SHA-256 over every version file (inputs, outputs, material images), the report code and its settings."""
+    digest = hashlib.sha256()
+    paths = [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if _VERSION_FILE.match(f)]
+    for path in paths:
+        digest.update(os.path.basename(path).encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    for path in modules:
+        digest.update(os.path.relpath(path, ROOT_DIR).encode())
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    # Environment overrides that change the output without touching the code
+    settings = {"charts": CHART_BACKEND, "chart_style": CHART_STYLE_VERSION, "narration": resolve_route("narration")}
+    digest.update(canonical_json(settings).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def cached_report_path(inputs_hash):
+    return os.path.join(REPORT_CACHE_DIR, f"{inputs_hash[:32]}.pdf")
+
+
+def job_report_path(job_id):
+    """Build target of one job; only this job writes it."""
+    return os.path.join(REPORT_CACHE_DIR, f".{job_id}.pdf")
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ExportJobManager:
+    """Queue of export jobs with progress, cancellation and a PDF cache keyed by the inputs hash."""
+
+    def __init__(self, store=shared_state, max_parallel=1):
+        self.store = store
+        self._pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="export-job")
+        self._cancel_events = {}        # job id -> cancel event of a build running in this worker
+        self._owned = set()             # unfinished jobs queued or running in this worker
+        self._heartbeat = None
+        self._lock = threading.Lock()
+
+    # -- records --
+    def get(self, job_id):
+        job = self.store.get("export_jobs", job_id)
+        if job is not None and self._is_stale(job):
+            job = self._expire(job_id)
+        return job
+
+    def _update(self, job_id, **fields):
+        # Read-modify-write in one transaction: progress and cancel may come from different workers
+        with self.store.transaction():
+            job = self.store.get("export_jobs", job_id) or {}
+            job.update(fields)
+            self.store.set("export_jobs", job_id, job)
+        return job
+
+    def _prune(self):
+        # Caller holds a store transaction
+        cutoff = time.time() - JOB_RETENTION_S
+        for job_id, job in self.store.items("export_jobs").items():
+            if job.get("status") in FINISHED and job.get("finished", 0) < cutoff:
+                self.store.delete("export_jobs", job_id)
+                _discard(job_report_path(job_id))      # uncached report of a job with failed narrations
+
+    # -- liveness --
+    def _is_stale(self, job):
+        if job.get("status") in FINISHED:
+            return False
+        return time.time() - job.get("heartbeat", job.get("created", 0)) > JOB_STALE_S
+
+    def _fail_stale(self, job_id, job):
+        # Caller holds a store transaction
+        job.update(status="failed", finished=time.time(),
+                   error=f"Export worker (pid {job.get('owner_pid')}) stopped responding")
+        self.store.set("export_jobs", job_id, job)
+        print(f"[EXPORT JOB] {job_id}: no heartbeat from pid {job.get('owner_pid')}, marked failed")
+
+    def _expire(self, job_id):
+        """Mark a job failed if its owner stopped heartbeating (re-checked inside the transaction)."""
+        with self.store.transaction():
+            job = self.store.get("export_jobs", job_id)
+            if job is not None and self._is_stale(job):
+                self._fail_stale(job_id, job)
+        return job
+
+    def _beat(self):
+        while True:
+            time.sleep(HEARTBEAT_S)
+            with self._lock:
+                owned = list(self._owned)
+            for job_id in owned:
+                try:
+                    self._update(job_id, heartbeat=time.time())
+                except Exception as e:
+                    print(f"[EXPORT JOB] {job_id}: heartbeat failed: {e}")
+
+    def _start_heartbeat(self):
+        with self._lock:
+            if self._heartbeat is None:
+                self._heartbeat = threading.Thread(target=self._beat, name="export-heartbeat", daemon=True)
+                self._heartbeat.start()
+
+    def _active_job_for(self, inputs_hash):
+        # Caller holds a store transaction; jobs left behind by a dead worker are failed on the way
+        for job_id, job in self.store.items("export_jobs").items():
+            if job.get("inputs_hash") != inputs_hash or job.get("status") in FINISHED:
+                continue
+            if self._is_stale(job):
+                self._fail_stale(job_id, job)
+                continue
+            return job
+        return None
+
+    # -- submission --
+    def submit(self):
+        """Start (or reuse) an export for the current versions and return the job record."""
+        inputs_hash = report_inputs_hash()
+        job_id = uuid.uuid4().hex[:12]
+        now = time.time()
+        base = {"id": job_id, "inputs_hash": inputs_hash, "created": now, "owner_pid": os.getpid(), "heartbeat": now,
+                "pages_done": 0, "pages_total": None, "llm_pending": None, "cancel_requested": False}
+
+        cached = cached_report_path(inputs_hash)
+        if touch(cached):
+            print(f"[EXPORT JOB] {job_id}: versions unchanged, reusing cached report")
+            return self._update(job_id, **base, status="done", cached=True, result=cached, finished=time.time())
+
+        # Check and insert in one write transaction, so two workers cannot both start this export
+        with self.store.transaction():
+            self._prune()
+            active = self._active_job_for(inputs_hash)
+            if active is None:
+                job = {**base, "status": "queued", "cached": False, "result": None}
+                self.store.set("export_jobs", job_id, job)
+        if active is not None:
+            print(f"[EXPORT JOB] Export for these versions already running as {active['id']}")
+            return active
+
+        with self._lock:
+            self._owned.add(job_id)
+        self._start_heartbeat()
+        self._pool.submit(self._run, job_id, inputs_hash)
+        print(f"[EXPORT JOB] {job_id}: queued")
+        return job
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            return job
+        job = self._update(job_id, cancel_requested=True)
+        if job["status"] == "queued":
+            job = self._update(job_id, status="cancelled", finished=time.time())
+        with self._lock:
+            event = self._cancel_events.get(job_id)
+        if event is not None:
+            event.set()
+        print(f"[EXPORT JOB] {job_id}: cancellation requested")
+        return job
+
+    # -- runner --
+    def _cancel_requested(self, job_id):
+        job = self.get(job_id)
+        return job is None or job.get("cancel_requested")
+
+    def _run(self, job_id, inputs_hash):
+        try:
+            self._build(job_id, inputs_hash)
+        finally:
+            with self._lock:
+                self._owned.discard(job_id)
+
+    def _build(self, job_id, inputs_hash):
+        if self._cancel_requested(job_id):
+            return
+        self._update(job_id, status="running", started=time.time())
+        start = time.perf_counter()
+        try:
+            from utils import export       # pandas / plotly / fpdf load on the first export only
+        except Exception as e:
+            self._update(job_id, status="failed", error=f"Report builder unavailable: {e}", finished=time.time())
+            return
+
+        cancel_event = threading.Event()
+        with self._lock:
+            self._cancel_events[job_id] = cancel_event
+
+        def on_progress(progress):
+            # Cancellation may have been requested through another worker
+            if self._update(job_id, **progress).get("cancel_requested"):
+                cancel_event.set()
+
+        os.makedirs(REPORT_CACHE_DIR, exist_ok=True)
+        output_path = job_report_path(job_id)
+        builder = export.ReportBuilder(on_progress=on_progress, cancel_event=cancel_event)
+        try:
+            builder.build(output_path=output_path)
+        except export.ReportCancelled:
+            _discard(output_path)
+            self._update(job_id, status="cancelled", finished=time.time())
+            print(f"[EXPORT JOB] {job_id}: cancelled after {time.perf_counter() - start:.1f}s")
+            return
+        except Exception as e:
+            _discard(output_path)
+            self._update(job_id, status="failed", error=str(e), finished=time.time())
+            print(f"[EXPORT JOB] {job_id}: failed after {time.perf_counter() - start:.1f}s: {e}")
+            return
+        finally:
+            with self._lock:
+                self._cancel_events.pop(job_id, None)
+
+        if builder.narration_failures:
+            # Placeholders instead of narrations: deliver this PDF, but let the next export retry the LLM
+            self._update(job_id, status="done", result=output_path, llm_pending=0,
+                         narration_failures=builder.narration_failures, finished=time.time())
+            print(f"[EXPORT JOB] {job_id}: report ready in {time.perf_counter() - start:.1f}s "
+                  f"({builder.narration_failures} narration(s) unavailable, not cached)")
+            return
+
+        # Atomic on the same filesystem: readers of the cache never see a partial PDF
+        cached = cached_report_path(inputs_hash)
+        os.replace(output_path, cached)
+        self._update(job_id, status="done", result=cached, llm_pending=0, finished=time.time())
+        print(f"[EXPORT JOB] {job_id}: report ready in {time.perf_counter() - start:.1f}s")
+        prune_cache_dir(REPORT_CACHE_DIR, REPORT_CACHE_RETENTION_S, REPORT_CACHE_MAX_FILES, ".pdf", label="EXPORT JOB")
+
+
+# Shared manager used by the chat server
+export_jobs = ExportJobManager()
@@ -0,0 +1,146 @@
+import re
+import json
+import time
+from utils.version_analysis_utils import (
+    summarize_version_outputs,
+    load_version_details,
+    extract_versions_from_input
+)
+from utils.design_state import ml_output_path
+
+# =====================================
+# Fast answers: exact metric / version lookups without an LLM call
+# =====================================
+#
+# Questions such as "what's the GWP of V3", "which version is best" or
+# "EUI now?" only need numbers that are already in ml_output.json and the
+# saved versions. They are answered from templates here; anything open-ended
+# returns None and goes to the LLM as before.
+
+# (pattern, fragment of the output key, display name, unit) – first match wins
+METRICS = [
+    (r"\bgwp\b|global warming|total carbon", "GWP total", "GWP", "kg CO2e/m²a"),
+    (r"\beui\b|energy (use )?intensity", "EUI", "EUI", "kWh/m²a"),
+    (r"\bcooling\b", "Cooling Demand", "Cooling demand", "kWh/m²a"),
+    (r"\bheating\b", "Heating Demand", "Heating demand", "kWh/m²a"),
+    (r"\boperational\b", "Operational Carbon", "Operational carbon", "kg CO2e/m²a"),
+    (r"\ba1\s*-\s*a3\b", "A1-A3", "Embodied carbon A1-A3", "kg CO2e/m²a"),
+    (r"\bembodied\b", "A-D", "Embodied carbon A-D", "kg CO2e/m²a"),
+]
+DEFAULT_METRIC = METRICS[0]
+
+# Anything asking for reasons, advice or comparisons needs the LLM
+OPEN_ENDED = re.compile(
+    r"\b(why|explain|reduce|improve|lower|increase|should|could|would|suggest|recommend|"
+    r"compare|difference|differ|change|affect|impact|because|strateg\w*|how (can|do|to)|"
+    r"high|low|good|bad|enough|acceptable|ok|okay)\b"
+)
+LOOKUP = re.compile(r"^(what|what's|whats|how much|which|show|give|tell|list|current|is)\b|\?$")
+CURRENT = re.compile(r"\b(now|current(ly)?|this design|right now|at the moment|today)\b")
+BEST = re.compile(r"\b(best|lowest|greenest|most sustainable|top)\b")
+WORST = re.compile(r"\b(worst|highest|least sustainable)\b")
+VERSION_WORD = re.compile(r"\b(version|versions|iteration|iterations|option|options)\b")
+LIST_VERSIONS = re.compile(r"\b(all|list|every)\b.*\b(versions|iterations)\b")
+
+
+def _find_metric(text):
+    for pattern, key_fragment, name, unit in METRICS:
+        if re.search(pattern, text):
+            return pattern, key_fragment, name, unit
+    return None
+
+def _metric_value(outputs, key_fragment):
+    for key, value in outputs.items():
+        if key_fragment in key and isinstance(value, (int, float)):
+            return value
+    return None
+
+def _load_current_outputs(design_dir=None):
+    try:
+        with open(ml_output_path(design_dir), "r", encoding="utf-8") as f:
+            return json.load(f).get("outputs", {})
+    except Exception:
+        return {}
+
+def _fmt(value, unit):
+    return f"{value:.2f} {unit}"
+
+
+# -- Templates --
+def _answer_best(metric, worst):
+    _, key_fragment, name, unit = metric
+    ranked = [
+        (v["version"], _metric_value(v.get("outputs", {}), key_fragment))
+        for v in summarize_version_outputs()
+    ]
+    ranked = [(version, value) for version, value in ranked if value is not None]
+    if not ranked:
+        return None
+    version, value = (max if worst else min)(ranked, key=lambda item: item[1])
+    label = "highest" if worst else "lowest"
+    return f"**{version}** has the {label} {name} of the {len(ranked)} saved versions: **{_fmt(value, unit)}**."
+
+def _answer_versions(metric, versions):
+    _, key_fragment, name, unit = metric
+    lines = []
+    for version in versions:
+        details = load_version_details(version)
+        if not details:
+            return None   # unknown version: let the LLM explain
+        value = _metric_value(details.get("outputs", {}), key_fragment)
+        if value is None:
+            return None
+        lines.append((version, value))
+    if len(lines) == 1:
+        version, value = lines[0]
+        return f"{name} of {version}: **{_fmt(value, unit)}**."
+    return f"{name} by version:\n" + "\n".join(f"• {v}: {_fmt(val, unit)}" for v, val in lines)
+
+def _answer_current(metric, design_dir=None):
+    _, key_fragment, name, unit = metric
+    value = _metric_value(_load_current_outputs(design_dir), key_fragment)
+    if value is None:
+        return None
+    return f"Current design {name}: **{_fmt(value, unit)}**."
+
+def _answer_list(metric):
+    _, key_fragment, name, unit = metric
+    rows = [(v["version"], _metric_value(v.get("outputs", {}), key_fragment)) for v in summarize_version_outputs()]
+    rows = [(version, value) for version, value in rows if value is not None]
+    if not rows:
+        return None
+    return f"{name} of saved versions:\n" + "\n".join(f"• {v}: {_fmt(val, unit)}" for v, val in rows)
+
+
+def try_fast_answer(user_input, design_dir=None):
+    """Return an exact templated answer for metric/version lookups, or None to fall back to the LLM.
+
+    "Current design" values come from the session's own ML output when `design_dir` is set.
+    """
+    start = time.perf_counter()
+    text = user_input.strip().lower()
+    if not text or OPEN_ENDED.search(text):
+        return None
+
+    metric = _find_metric(text)
+    versions = list(dict.fromkeys(extract_versions_from_input(user_input)))
+    short = len(text.split()) <= 8
+
+    try:
+        if LIST_VERSIONS.search(text):
+            answer = _answer_list(metric or DEFAULT_METRIC)
+        elif (BEST.search(text) or WORST.search(text)) and VERSION_WORD.search(text) and not versions:
+            answer = _answer_best(metric or DEFAULT_METRIC, worst=bool(WORST.search(text)))
+        elif metric and versions and (LOOKUP.search(text) or short):
+            answer = _answer_versions(metric, versions)
+        elif metric and not versions and (CURRENT.search(text) or (short and LOOKUP.search(text))):
+            answer = _answer_current(metric, design_dir)
+        else:
+            answer = None
+    except Exception as e:
+        print(f"[FAST ANSWER] Lookup failed, falling back to LLM: {e}")
+        return None
+
+    if answer is not None:
+        print(f"[FAST ANSWER] '{user_input}' answered in {1000 * (time.perf_counter() - start):.1f} ms")
+    return answer
@@ -0,0 +1,339 @@
+import math
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import threading
+from collections import deque
+import openai
+from server.config import (
+    client, async_client, completion_model, llm_max_concurrency, llm_max_retries, llm_retry_backoff,
+    resolve_route
+)
+from utils.llm_metrics import LatencyHistogram
+
+# =====================================
+# LLM gateway: priority queue + concurrency cap in front of the local server
+# =====================================
+
+# Lower number = served first
+INTERACTIVE = 0   # chat replies, design changes, greetings
+BACKGROUND = 10   # GWP summaries, report narrations
+PROBE = 20        # /llm_status and other diagnostics
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background", PROBE: "probe"}
+
+
+# Transient failures worth another attempt. Read timeouts (APITimeoutError) are not
+# retried: a generation that hung once would pin the slot for another full timeout.
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class LLMRequestCancelled(Exception):
+    pass
+
+class LLMDeadlineExceeded(Exception):
+    pass
+
+
+class LLMTicket:
+    """One queued LLM request. `cancel()` drops it from the queue or abandons it in flight."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, priority=INTERACTIVE, deadline=None, label="llm", route=None):
+        self.id = next(self._ids)
+        self.priority = priority
+        self.deadline = deadline          # absolute time.monotonic() value, or None
+        self.label = label
+        self.route = route                # MODEL_ROUTES key, fills model/max_tokens/temperature
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.state = "queued"             # queued | running | done | cancelled | expired
+        self._granted = threading.Event()
+        self._async_waiter = None         # (loop, future) for async callers
+        self._task = None                 # asyncio task running the request, if any
+        self._released = False
+        self._gateway = None              # set on enqueue; state changes then happen under its lock
+
+    def remaining(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def cancel(self):
+        if self._gateway is not None:
+            with self._gateway._lock:
+                if self.state in ("done", "cancelled", "expired"):
+                    return
+                self.state = "cancelled"
+        elif self.state in ("done", "cancelled", "expired"):
+            return
+        else:
+            self.state = "cancelled"
+        self._wake()
+        if self._task is not None:
+            self._task.get_loop().call_soon_threadsafe(self._task.cancel)
+
+    def _wake(self):
+        self._granted.set()
+        if self._async_waiter is not None:
+            loop, future = self._async_waiter
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+
+class LLMGateway:
+    """Serialises access to the completion endpoint.
+
+    Requests wait in a priority queue (interactive before background before
+    probes, FIFO within a priority) and at most `max_concurrency` generations
+    run at once. Requests may carry a deadline (seconds from submission) and
+    can be cancelled while queued or running. Transient connection/server
+    errors are retried with jittered backoff while the slot is held, and the
+    running time of every call is recorded per label in `self.latency` and
+    per model route in `self.route_latency`.
+    """
+
+    def __init__(self, max_concurrency=1, sync_client=client, aio_client=async_client,
+                 max_retries=llm_max_retries, retry_backoff=llm_retry_backoff):
+        self.max_concurrency = max_concurrency
+        self.sync_client = sync_client
+        self.aio_client = aio_client
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.latency = LatencyHistogram()
+        self.route_latency = LatencyHistogram()
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._waits = deque(maxlen=500)
+        self._counters = {"completed": 0, "failed": 0, "cancelled": 0, "expired": 0, "retried": 0}
+
+    # -- queue management --
+    def _enqueue(self, ticket):
+        with self._lock:
+            ticket._gateway = self
+            heapq.heappush(self._heap, (ticket.priority, next(self._seq), ticket))
+            self._dispatch()
+
+    def _dispatch(self):
+        """Grant free slots to the highest-priority live tickets (caller holds the lock)."""
+        while self._heap and self._in_flight < self.max_concurrency:
+            _, _, ticket = heapq.heappop(self._heap)
+            if ticket.state != "queued":
+                continue
+            if ticket.expired():
+                ticket.state = "expired"
+                ticket._wake()
+                continue
+            ticket.state = "running"
+            ticket.started_at = time.monotonic()
+            self._in_flight += 1
+            self._waits.append((ticket.priority, ticket.started_at - ticket.enqueued_at))
+            ticket._wake()
+
+    def _release(self, ticket, outcome):
+        """Free the ticket's slot (idempotent) and hand it to the next waiter."""
+        with self._lock:
+            if ticket._released or ticket.started_at is None:
+                return
+            ticket._released = True
+            self._in_flight -= 1
+            if ticket.state == "running":
+                ticket.state = "done"
+            self._counters[outcome] += 1
+            self._dispatch()
+        elapsed = time.monotonic() - ticket.started_at
+        self.latency.record(ticket.label, elapsed, outcome)
+        if ticket.route:
+            self.route_latency.record(ticket.route, elapsed, outcome)
+
+    def _check_granted(self, ticket):
+        """Return if the ticket holds a slot, otherwise raise (cancelled or expired)."""
+        with self._lock:
+            if ticket.state == "running":
+                return
+            if ticket.state == "queued":
+                ticket.state = "expired"
+            outcome = "cancelled" if ticket.state == "cancelled" else "expired"
+        self._abandon(ticket, outcome)
+        if outcome == "cancelled":
+            raise LLMRequestCancelled(f"{ticket.label} cancelled while queued")
+        raise LLMDeadlineExceeded(f"{ticket.label} waited past its deadline")
+
+    def _abandon(self, ticket, outcome):
+        """Count a ticket that will never run; a slot granted just before cancellation is returned."""
+        with self._lock:
+            granted = ticket.started_at is not None
+            if not granted:
+                self._counters[outcome] += 1
+        if granted:
+            self._release(ticket, outcome)
+
+    def _request_kwargs(self, ticket, kwargs):
+        # Route settings are defaults: explicit kwargs from the caller win
+        if ticket.route:
+            for key, value in resolve_route(ticket.route).items():
+                kwargs.setdefault(key, value)
+        kwargs.setdefault("model", completion_model)
+        remaining = ticket.remaining()
+        if remaining is not None:
+            kwargs["timeout"] = max(0.1, min(kwargs.get("timeout", remaining), remaining))
+        return kwargs
+
+    def _retry_delay(self, ticket, attempt, error):
+        """Backoff before the next attempt, or None if the error is final."""
+        if not isinstance(error, RETRYABLE_ERRORS) or isinstance(error, openai.APITimeoutError):
+            return None
+        if attempt >= self.max_retries or ticket.state == "cancelled":
+            return None
+        # Exponential backoff with full jitter so parallel callers don't retry in lockstep
+        delay = random.uniform(0, self.retry_backoff * (2 ** attempt))
+        remaining = ticket.remaining()
+        if remaining is not None and remaining <= delay:
+            return None
+        with self._lock:
+            self._counters["retried"] += 1
+        print(f"[LLM GATEWAY] {ticket.label}: {type(error).__name__} on attempt {attempt + 1}, retrying in {delay:.2f}s")
+        return delay
+
+    def _new_ticket(self, priority, deadline, label, ticket, route=None):
+        if ticket is not None:
+            return ticket
+        return LLMTicket(priority, None if deadline is None else time.monotonic() + deadline, label, route)
+
+    # -- sync API --
+    def chat(self, priority=INTERACTIVE, deadline=None, label="llm", ticket=None, route=None, **kwargs):
+        """Blocking chat completion through the queue (same kwargs as client.chat.completions.create).
+
+        `route` (a MODEL_ROUTES key) supplies the model, max_tokens and temperature defaults.
+        """
+        ticket = self._new_ticket(priority, deadline, label, ticket, route)
+        self._enqueue(ticket)
+        ticket._granted.wait(ticket.remaining())
+        self._check_granted(ticket)
+
+        outcome = "failed"
+        try:
+            for attempt in itertools.count():
+                try:
+                    response = self.sync_client.chat.completions.create(**self._request_kwargs(ticket, kwargs))
+                    break
+                except Exception as e:
+                    delay = self._retry_delay(ticket, attempt, e)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+            if ticket.state == "cancelled":
+                outcome = "cancelled"
+                raise LLMRequestCancelled(f"{ticket.label} cancelled while running")
+            outcome = "completed"
+            return response
+        finally:
+            self._release(ticket, outcome)
+
+    # -- async API --
+    async def _await_grant(self, ticket):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ticket._async_waiter = (loop, future)
+        self._enqueue(ticket)
+        if ticket.state == "queued":
+            try:
+                await asyncio.wait_for(future, ticket.remaining())
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                ticket.cancel()
+                self._abandon(ticket, "cancelled")
+                raise
+        self._check_granted(ticket)
+
+    async def _acreate(self, ticket, kwargs):
+        for attempt in itertools.count():
+            try:
+                return await self.aio_client.chat.completions.create(**self._request_kwargs(ticket, kwargs))
+            except Exception as e:
+                delay = self._retry_delay(ticket, attempt, e)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+
+    async def achat(self, priority=INTERACTIVE, deadline=None, label="llm", ticket=None, route=None, **kwargs):
+        """Async chat completion through the queue (AsyncOpenAI client)."""
+        ticket = self._new_ticket(priority, deadline, label, ticket, route)
+        await self._await_grant(ticket)
+
+        ticket._task = asyncio.current_task()
+        outcome = "failed"
+        try:
+            response = await self._acreate(ticket, kwargs)
+            outcome = "completed"
+            return response
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            ticket._task = None
+            self._release(ticket, outcome)
+
+    async def astream(self, priority=INTERACTIVE, deadline=None, label="llm", ticket=None, route=None, **kwargs):
+        """Yield streamed chunks; the slot is held until the stream is exhausted or closed."""
+        ticket = self._new_ticket(priority, deadline, label, ticket, route)
+        await self._await_grant(ticket)
+
+        ticket._task = asyncio.current_task()
+        outcome = "failed"
+        try:
+            # Only opening the stream is retried; once tokens flow a failure is final
+            stream = await self._acreate(ticket, dict(kwargs, stream=True))
+            async for chunk in stream:
+                yield chunk
+            outcome = "completed"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            ticket._task = None
+            self._release(ticket, outcome)
+
+    # -- metrics --
+    def metrics(self):
+        with self._lock:
+            queued = [t for _, _, t in self._heap if t.state == "queued"]
+            now = time.monotonic()
+            by_priority = {}
+            for t in queued:
+                name = PRIORITY_NAMES.get(t.priority, str(t.priority))
+                by_priority[name] = by_priority.get(name, 0) + 1
+
+            waits = {}
+            for priority, wait in self._waits:
+                waits.setdefault(PRIORITY_NAMES.get(priority, str(priority)), []).append(wait)
+
+            return {
+                "max_concurrency": self.max_concurrency,
+                "in_flight": self._in_flight,
+                "queue_depth": len(queued),
+                "queue_depth_by_priority": by_priority,
+                "oldest_queued_s": round(max((now - t.enqueued_at for t in queued), default=0.0), 3),
+                "wait_time_s": {
+                    name: {
+                        "count": len(values),
+                        "mean": round(sum(values) / len(values), 3),
+                        "p95": round(sorted(values)[math.ceil(len(values) * 0.95) - 1], 3),
+                        "max": round(max(values), 3),
+                    }
+                    for name, values in waits.items()
+                },
+                "latency_s": self.latency.snapshot(),
+                "latency_by_route_s": self.route_latency.snapshot(),
+                **self._counters,
+            }
+
+
+# Shared gateway used by llm_calls, the chat server and report export
+llm_gateway = LLMGateway(max_concurrency=llm_max_concurrency)
@@ -0,0 +1,56 @@
+import threading
+
+# =====================================
+# LLM latency histograms (per call label)
+# =====================================
+
+# Upper bucket bounds in seconds; the last bucket is open-ended
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram per label (e.g. "answer_user_query", "gwp_summary")."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, label, seconds, outcome="completed"):
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "max": 0.0, "outcomes": {}}
+                self._series[label] = series
+            index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            series["counts"][index] += 1
+            series["sum"] += seconds
+            series["max"] = max(series["max"], seconds)
+            series["outcomes"][outcome] = series["outcomes"].get(outcome, 0) + 1
+
+    def _quantile(self, counts, q):
+        """Upper bound of the bucket containing the q-quantile (None when it is the open bucket)."""
+        target = q * sum(counts)
+        running = 0
+        for bound, count in zip(self.buckets + (None,), counts):
+            running += count
+            if running >= target:
+                return bound
+        return None
+
+    def snapshot(self):
+        with self._lock:
+            result = {}
+            for label, series in self._series.items():
+                total = sum(series["counts"])
+                labels = [f"<={b}s" for b in self.buckets] + [f">{self.buckets[-1]}s"]
+                result[label] = {
+                    "count": total,
+                    "mean": round(series["sum"] / total, 3) if total else 0.0,
+                    "p50_le": self._quantile(series["counts"], 0.5),
+                    "p95_le": self._quantile(series["counts"], 0.95),
+                    "max": round(series["max"], 3),
+                    "buckets": {name: c for name, c in zip(labels, series["counts"]) if c},
+                    "outcomes": dict(series["outcomes"]),
+                }
+            return result
@@ -0,0 +1,243 @@
+import re
+from collections import deque
+from utils.material_mapper import MaterialMapper
+
+# =====================================
+# Phrase matcher: design-change requests -> parameter updates without the LLM
+# =====================================
+#
+# "switch walls to timber frame and roof insulation to cork" is fully
+# described by MaterialMapper's tables. Component and material phrases are
+# compiled into one Aho-Corasick automaton, scanned in a single pass, and
+# paired in order ("<component> … <material>" or "<material> <component>").
+# Anything the pairing can't resolve unambiguously, or any wording left over
+# besides filler ("… and reduce wwr"), returns None so the whole request goes
+# to the LLM instead.
+
+
+class AhoCorasick:
+    """Multi-pattern matcher over a normalised string; returns (start, end, payload) hits."""
+
+    def __init__(self, phrases):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for phrase, payload in phrases:
+            self._add(phrase, payload)
+        self._build()
+
+    def _add(self, phrase, payload):
+        node = 0
+        for ch in phrase:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        self._out[node].append((len(phrase), payload))
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find_all(self, text):
+        node, hits = 0, []
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length, payload in self._out[node]:
+                hits.append((i + 1 - length, i + 1, payload))
+        return hits
+
+
+# -- Vocabulary --
+# Component phrase -> parameters it refers to (insulation phrases point at the insulation keys)
+COMPONENT_PHRASES = {
+    "exterior wall": ["EW_PAR"], "external wall": ["EW_PAR"], "outer wall": ["EW_PAR"], "facade": ["EW_PAR"],
+    "interior wall": ["IW_PAR"], "internal wall": ["IW_PAR"], "inner wall": ["IW_PAR"], "partition wall": ["IW_PAR"],
+    "wall": ["EW_PAR"],                 # bare "wall" is the exterior wall, as in apply_component_specific_change
+    "wall insulation": ["EW_INS"], "exterior wall insulation": ["EW_INS"], "external wall insulation": ["EW_INS"],
+    "facade insulation": ["EW_INS"],
+    "roof": ["RO_PAR"], "roof insulation": ["RO_INS"],
+    "slab": ["IS_PAR"], "floor": ["IS_PAR"], "floor slab": ["IS_PAR"], "interior slab": ["IS_PAR"],
+    "slab insulation": ["ES_INS"], "floor insulation": ["ES_INS"], "ground slab": ["ES_INS"],
+    "exterior slab insulation": ["ES_INS"],
+    "insulation": ["EW_INS", "RO_INS", "ES_INS"],
+    "structure": ["BC"], "beam": ["BC"], "column": ["BC"], "beam and column": ["BC"],
+    "beam & column": ["BC"], "structural frame": ["BC"],
+}
+
+# Partition key -> insulation key tried when the material only fits the insulation ("roof to cork")
+INSULATION_OF = {"EW_PAR": "EW_INS", "RO_PAR": "RO_INS", "IS_PAR": "ES_INS"}
+
+# Extra spellings -> MaterialMapper material names
+MATERIAL_SYNONYMS = {
+    "rock wool": "mineral_wool", "rockwool": "mineral_wool", "stone wool": "mineral_wool",
+    "glasswool": "glass_wool", "fiberglass": "glass_wool", "fibreglass": "glass_wool",
+    "wood fibre": "wood_fiber", "woodfiber": "wood_fiber", "woodfibre": "wood_fiber",
+    "expanded polystyrene": "eps", "extruded polystyrene": "xps",
+    "foam glass": "extruded_glas", "foamglass": "extruded_glas", "extruded glass": "extruded_glas",
+    "cross laminated timber": "timber_mass", "clt": "timber_mass", "mass timber": "timber_mass",
+    "massive timber": "timber_mass", "wood frame": "timber_frame", "timber framing": "timber_frame",
+    "rammed earth": "earth", "clay": "earth", "bricks": "brick", "straw bale": "straw",
+}
+
+# Wording that changes the meaning of a plain "component → material" pairing:
+# alternatives, negations ("no", "don't", "avoid", "remove") and hypotheticals ("what if", "would")
+ESCALATE = re.compile(
+    r"\b(from|instead|replace|replacing|not|except|keep|unless|or|which|should|better"
+    r"|no|never|avoid|avoiding|without|remove|removing|delete|drop|if|would|could|might"
+    r"|dont|doesnt|didnt|isnt|arent|wont|cant|shouldnt)\b"
+    r"|n['’]t\b|\?"
+)
+
+# Other design parameters: a request that also touches these needs the LLM for the rest of it
+OTHER_PARAMETERS = re.compile(
+    r"\b(wwr|windows?|glazing|glass|typology|shape|courtyard|storeys?|stor(?:y|ies)|height|orientation"
+    r"|gfa|area|volume|ratio|geometry|massing|color|colour)\b"
+)
+
+# Words that may surround the matched component/material phrases; anything else is an unknown instruction
+FILLER_WORDS = {
+    "change", "set", "switch", "make", "use", "update", "turn", "go", "put", "apply", "choose", "pick", "try",
+    "to", "into", "for", "with", "of", "in", "on", "as", "by", "at",
+    "the", "a", "an", "and", "&", "all", "both", "every", "each", "also", "then", "now",
+    "please", "pls", "can", "you", "i", "we", "want", "wish", "like", "let's", "lets", "let", "us", "me",
+    "my", "our", "its", "it", "them", "their", "be", "is", "are", "material", "materials", "system", "type",
+}
+
+_WORD = re.compile(r"[a-z0-9&]")
+_TOKEN = re.compile(r"[a-z0-9&']+")
+
+
+def _normalise(text):
+    text = text.lower().replace("_", " ").replace("-", " ")
+    text = re.sub(r"\bwalls\b", "wall", text)
+    text = re.sub(r"\b(beams|columns|slabs|floors|roofs)\b", lambda m: m.group(1)[:-1], text)
+    return re.sub(r"\s+", " ", text)
+
+
+class DesignChangeMatcher:
+    """Extract {param: value} updates from simple material-change requests."""
+
+    def __init__(self, mapper=None):
+        self.mapper = mapper or MaterialMapper()
+        materials = set()
+        for mapping in self.mapper.material_mappings.values():
+            materials.update(mapping)
+
+        phrases = [(phrase, ("component", params)) for phrase, params in COMPONENT_PHRASES.items()]
+        phrases += [(name.replace("_", " "), ("material", name)) for name in materials]
+        phrases += [(phrase, ("material", name)) for phrase, name in MATERIAL_SYNONYMS.items() if name in materials]
+        self.automaton = AhoCorasick(phrases)
+
+    def _scan(self, text):
+        """Leftmost-longest, whole-word matches in reading order, as (start, end, payload)."""
+        hits = []
+        for start, end, payload in self.automaton.find_all(text):
+            if start > 0 and _WORD.match(text[start - 1]):
+                continue
+            if end < len(text) and _WORD.match(text[end]):
+                continue
+            hits.append((start, end, payload))
+        hits.sort(key=lambda h: (h[0], -(h[1] - h[0])))
+
+        selected, last_end = [], -1
+        for start, end, payload in hits:
+            if start >= last_end:
+                selected.append((start, end, payload))
+                last_end = end
+        return selected
+
+    @staticmethod
+    def _has_leftover(text, hits):
+        """True if the text outside the matched phrases asks for something else ("… and reduce wwr")."""
+        rest, last_end = [], 0
+        for start, end, _ in hits:
+            rest.append(text[last_end:start])
+            last_end = end
+        rest = " ".join(rest + [text[last_end:]])
+        if OTHER_PARAMETERS.search(rest):
+            return True
+        return any(token not in FILLER_WORDS for token in _TOKEN.findall(rest))
+
+    def _resolve(self, params, material):
+        """Parameter values for `material` on the given component, trying insulation companions.
+
+        Returns None unless the material fits every parameter of the component,
+        so "insulation to cork" is not applied to only some of the insulations.
+        """
+        updates = {}
+        for param in params:
+            for key in (param, INSULATION_OF.get(param)):
+                category = self.mapper.get_category_for_param(key) if key else None
+                if category and material in self.mapper.material_mappings[category]:
+                    updates[key] = self.mapper.material_mappings[category][material]
+                    break
+            else:
+                return None
+        return updates
+
+    def extract(self, text):
+        """Return parameter updates, or None if the request is ambiguous or not a plain material change."""
+        text = _normalise(text)
+        if ESCALATE.search(text):
+            return None
+
+        hits = self._scan(text)
+        if self._has_leftover(text, hits):
+            return None                                         # partly unknown request: never apply half of it
+
+        updates = {}
+        components, pending_material = [], None
+        for _, _, (kind, value) in hits:
+            if kind == "component":
+                if pending_material is not None and not components:
+                    pairs = [(value, pending_material)]          # "timber frame walls"
+                    pending_material = None
+                else:
+                    components.append(value)                    # "walls and roof to …"
+                    continue
+            else:
+                if not components:
+                    if pending_material is not None:
+                        return None                             # two materials, no component
+                    pending_material = value
+                    continue
+                pairs = [(params, value) for params in components]
+                components = []
+
+            for params, material in pairs:
+                resolved = self._resolve(params, material)
+                if not resolved:
+                    return None                                 # material doesn't fit the component
+                for key, val in resolved.items():
+                    if updates.get(key, val) != val:
+                        return None                             # conflicting instructions
+                    updates[key] = val
+
+        if components or pending_material is not None or not updates:
+            return None
+        return updates
+
+
+_matcher = None
+
+def extract_parameter_updates(user_prompt):
+    """Shared-matcher shortcut for DesignChangeMatcher.extract (built on first use)."""
+    global _matcher
+    if _matcher is None:
+        _matcher = DesignChangeMatcher()
+    return _matcher.extract(user_prompt)
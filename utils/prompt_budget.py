@@ -0,0 +1,168 @@
+import re
+import json
+
+# =====================================
+# Prompt budget: compact context rendering + token accounting
+# =====================================
+
+# -- Optional exact tokenizer; falls back to a local heuristic --
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _encoding = None
+
+GWP_KEY = "GWP total (kg CO2e/m²a GFA)"
+
+# Per-call context budgets (estimated tokens for the context sections only)
+PROMPT_BUDGETS = {
+    "answer_user_query": 900,
+    "suggest_improvements": 1400,
+    "compare_versions_summary": 1200,
+    "report_narration": 700,
+    "conversation_history": 300,   # digest + recent turns, added on top of the call's own budget
+    "conversation_digest": 900,
+}
+
+# Short column names for output metrics (matched by substring of the full key)
+OUTPUT_ABBREVIATIONS = [
+    ("GWP total", "GWP"),
+    ("EUI", "EUI"),
+    ("Cooling Demand", "Cooling"),
+    ("Heating Demand", "Heating"),
+    ("Operational Carbon", "OpCarbon"),
+    ("A1-A3", "EC_A1-A3"),
+    ("A-D", "EC_A-D"),
+]
+
+INPUT_ABBREVIATIONS = {
+    "Window-to-Wall_Ratio": "WWR",
+    "Ext.Wall_Partition": "ExtWall",
+    "Ext.Wall_Insulation": "ExtWallIns",
+    "Int.Wall_Partition": "IntWall",
+    "Ext.Slab_Insulation": "SlabIns",
+    "Int.Slab_Partition": "Slab",
+    "Roof_Partition": "Roof",
+    "Roof_Insulation": "RoofIns",
+    "Beams & Columns": "Structure",
+}
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text):
+    """Estimate the token count of a prompt string."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # Words and punctuation are roughly one token each; long words split further
+    pieces = _TOKEN_PATTERN.findall(text)
+    return sum(1 + len(p) // 8 for p in pieces)
+
+def count_message_tokens(messages):
+    return sum(estimate_tokens(m.get("content", "")) + 4 for m in messages)
+
+def log_prompt_tokens(call_name, messages):
+    """Print the estimated prompt size of an LLM call and return it."""
+    total = count_message_tokens(messages)
+    per_role = ", ".join(f"{m['role']} {estimate_tokens(m.get('content', ''))}" for m in messages)
+    budget = PROMPT_BUDGETS.get(call_name)
+    budget_text = f" / budget {budget}" if budget else ""
+    print(f"[PROMPT] {call_name}: ~{total} tokens ({per_role}){budget_text}")
+    return total
+
+# -- Compact renderers --
+def _format_value(value):
+    if isinstance(value, float):
+        return f"{value:.2f}".rstrip("0").rstrip(".")
+    return str(value)
+
+def abbreviate_output(key):
+    for fragment, short in OUTPUT_ABBREVIATIONS:
+        if fragment in key:
+            return short
+    return key
+
+def render_inputs(inputs):
+    """Render decoded inputs as a single `key=value; …` line."""
+    if not inputs:
+        return "(no inputs)"
+    return "; ".join(f"{INPUT_ABBREVIATIONS.get(k, k)}={_format_value(v)}" for k, v in inputs.items())
+
+def render_outputs(outputs):
+    """Render outputs as a single `metric=value; …` line (units: kWh/m²a, kg CO2e/m²a GFA)."""
+    if not outputs:
+        return "(no outputs)"
+    return "; ".join(f"{abbreviate_output(k)}={_format_value(v)}" for k, v in outputs.items())
+
+def render_versions_table(versions):
+    """Render [{"version", "outputs"}] as a pipe table with abbreviated metric columns."""
+    if not versions:
+        return "(no saved versions)"
+
+    columns = []
+    for entry in versions:
+        for key in entry.get("outputs", {}):
+            if key not in columns:
+                columns.append(key)
+
+    lines = ["version | " + " | ".join(abbreviate_output(c) for c in columns)]
+    for entry in versions:
+        outputs = entry.get("outputs", {})
+        lines.append(entry.get("version", "?") + " | " + " | ".join(_format_value(outputs.get(c, "-")) for c in columns))
+    return "\n".join(lines)
+
+# -- Version selection --
+def _metric_value(entry, metric):
+    value = entry.get("outputs", {}).get(metric)
+    return value if isinstance(value, (int, float)) else float("inf")
+
+def select_relevant_versions(summaries, mentioned=(), latest=2, best=1, metric=GWP_KEY):
+    """Keep mentioned versions, the `best` lowest-metric ones and the `latest` saved ones."""
+    by_name = {entry.get("version"): entry for entry in summaries}
+    chosen = [name for name in mentioned if name in by_name]
+
+    ranked = sorted(summaries, key=lambda e: _metric_value(e, metric))
+    chosen += [e.get("version") for e in ranked[:best] if _metric_value(e, metric) != float("inf")]
+    chosen += [e.get("version") for e in summaries[-latest:]] if latest else []
+
+    selected = list(dict.fromkeys(chosen))
+    return [by_name[name] for name in selected]
+
+# -- Budget enforcement --
+def fit_sections(sections, budget):
+    """Assemble (title, text, priority) sections within a token budget.
+
+    Sections are admitted by ascending priority number (0 = must keep); a
+    section that does not fit is cut line by line, and anything left over is
+    dropped. The output keeps the original section order.
+    """
+    remaining = budget
+    kept, trimmed = {}, []
+    for index, (title, text, _) in sorted(enumerate(sections), key=lambda item: item[1][2]):
+        block = f"{title}:\n{text}" if title else text
+        cost = estimate_tokens(block)
+        if cost <= remaining:
+            kept[index] = block
+            remaining -= cost
+            continue
+
+        lines, partial = block.split("\n"), []
+        for line in lines:
+            line_cost = estimate_tokens(line) + 1
+            if line_cost > remaining:
+                break
+            partial.append(line)
+            remaining -= line_cost
+        if len(partial) > (1 if title else 0):
+            kept[index] = "\n".join(partial + ["(truncated)"])
+            trimmed.append(title or f"section {index}")
+
+    dropped = [sections[i][0] or f"section {i}" for i in range(len(sections)) if i not in kept]
+    if dropped or trimmed:
+        print(f"[PROMPT] Budget {budget} reached – truncated: {', '.join(trimmed) or '-'}; dropped: {', '.join(dropped) or '-'}")
+    return "\n\n".join(kept[i] for i in sorted(kept))
+
+def canonical_json(data):
+    """Deterministic single-line JSON for prompts: sorted keys, fixed separators."""
+    return json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
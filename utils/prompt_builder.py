@@ -0,0 +1,50 @@
+import textwrap
+from utils.prompt_budget import canonical_json, log_prompt_tokens
+
+# =====================================
+# Prompt builder: stable prefix first, volatile data last
+# =====================================
+#
+# Local servers (LM Studio / llama.cpp) reuse the KV cache for the longest
+# prompt prefix shared with the previous request. Keeping the fixed
+# instructions at the top, byte-identical between calls, and appending the
+# design/version data at the end means only the tail is re-processed.
+
+def render_context(context):
+    """Render a {title: value} mapping in the given order; dict/list values become canonical JSON."""
+    if context is None:
+        return ""
+    if isinstance(context, str):
+        return context.strip()
+
+    blocks = []
+    for title, value in context.items():
+        if isinstance(value, (dict, list)):
+            value = canonical_json(value)
+        blocks.append(f"### {title}\n{str(value).strip()}")
+    return "\n\n".join(blocks)
+
+def build_messages(instructions, context=None, user=None, call_name=None):
+    """Build chat messages with a static system prompt and the volatile data last.
+
+    - system: `instructions` only (dedented; must not contain per-call data)
+    - user:   rendered `context` followed by the user's request
+
+    Order context from least to most volatile so more of the prefix survives.
+    """
+    system_text = textwrap.dedent(instructions).strip()
+    context_text = render_context(context)
+
+    parts = []
+    if context_text:
+        parts.append(context_text)
+    if user:
+        parts.append(f"### Request\n{user.strip()}" if context_text else user.strip())
+
+    messages = [{"role": "system", "content": system_text}]
+    if parts:
+        messages.append({"role": "user", "content": "\n\n".join(parts)})
+
+    if call_name:
+        log_prompt_tokens(call_name, messages)
+    return messages
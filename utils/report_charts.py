@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.cache_dirs import prune_cache_dir, touch
+from utils.chart_worker import use_as_spawn_main
+
+# =====================================
+# Report charts: bar / trend images for export.py
+# =====================================
+#
+# Charts are described by plain, picklable specs and rendered either with
+# matplotlib's Agg backend (default, no browser engine) or plotly + kaleido
+# (COPILOT_CHART_BACKEND=plotly). Rendering always runs in a pool of spawned
+# worker processes, so pyplot's global state never touches the server process
+# and no locks are inherited through fork; the workers start from the small
+# utils/chart_worker module, not the server script. Every image lives in
+# outputs/chart_cache/ under a hash of its spec and backend, and report pages
+# point at that file directly: a path always holds the same picture, and
+# charts whose data did not change are not redrawn. The cache is pruned after
+# every render by age and size.
+#
+#   bar spec:   {"kind": "bar", "title": …, "data": {label: value}, "benchmark": float|None, "colors": […]}
+#   trend spec: {"kind": "trend", "title": …, "data": {series: {version: value}}, "colors": […]}
+
+CHART_CACHE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "outputs", "chart_cache"))
+CHART_BACKEND = os.environ.get("COPILOT_CHART_BACKEND", "matplotlib")
+CHART_WORKERS = int(os.environ.get("COPILOT_CHART_WORKERS", str(min(4, os.cpu_count() or 1))))
+CHART_STYLE_VERSION = 1         # bump when the drawing code changes so cached images are redrawn
+CHART_CACHE_RETENTION_S = float(os.environ.get("COPILOT_CHART_CACHE_RETENTION_S", str(7 * 24 * 3600)))
+CHART_CACHE_MAX_FILES = int(os.environ.get("COPILOT_CHART_CACHE_MAX_FILES", "2000"))
+
+SIZES = {"bar": (640, 400), "trend": (700, 400)}
+FONT_FAMILY = ["Georgia", "DejaVu Serif", "serif"]
+
+
+def chart_key(spec, backend):
+    payload = json.dumps({"spec": spec, "backend": backend, "style": CHART_STYLE_VERSION},
+                         sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# -- matplotlib (Agg) --
+def _matplotlib_figure(spec):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.lines import Line2D
+
+    width, height = SIZES[spec["kind"]]
+    plt.rcParams["font.family"] = FONT_FAMILY
+    fig, ax = plt.subplots(figsize=(width / 100, height / 100), dpi=100)
+    fig.patch.set_facecolor("white")
+    ax.set_facecolor("white")
+    colors = spec["colors"]
+
+    if spec["kind"] == "bar":
+        labels, values = list(spec["data"]), list(spec["data"].values())
+        bar_colors = [colors[i % len(colors)] for i in range(len(labels))]
+        bars = ax.bar(labels, values, color=bar_colors)
+        ax.bar_label(bars, labels=[f"{v:.2f}" for v in values], padding=2, fontsize=9)
+        handles = [Line2D([0], [0], marker="s", linestyle="", color=c, markersize=9) for c in bar_colors]
+        if spec.get("benchmark") is not None:
+            ax.axhline(spec["benchmark"], linestyle="--", color="red", linewidth=1)
+            ax.annotate("Benchmark", xy=(1, spec["benchmark"]), xycoords=("axes fraction", "data"),
+                        ha="right", va="bottom", fontsize=9)
+        legend_labels = labels
+    else:
+        handles, legend_labels = [], []
+        for i, (series, points) in enumerate(spec["data"].items()):
+            line, = ax.plot(list(points), list(points.values()), marker="o", color=colors[i % len(colors)])
+            handles.append(line)
+            legend_labels.append(series)
+        ax.set_xlabel("Version")
+
+    ax.set_title(spec["title"], loc="left", fontsize=13)
+    for side in ("top", "right"):
+        ax.spines[side].set_visible(False)
+    ax.legend(handles, legend_labels, loc="upper left", bbox_to_anchor=(1.01, 1), frameon=False, fontsize=9)
+    fig.tight_layout()
+    return fig, plt
+
+
+def _render_matplotlib(spec, path):
+    fig, plt = _matplotlib_figure(spec)
+    try:
+        fig.savefig(path, format="png", facecolor="white")
+    finally:
+        plt.close(fig)
+
+
+# -- plotly + kaleido (previous renderer) --
+def _render_plotly(spec, path):
+    import plotly.express as px
+
+    width, height = SIZES[spec["kind"]]
+    if spec["kind"] == "bar":
+        data = spec["data"]
+        fig = px.bar(x=list(data.keys()), y=list(data.values()),
+                     color=list(data.keys()), text=[f"{v:.2f}" for v in data.values()],
+                     color_discrete_sequence=spec["colors"])
+        if spec.get("benchmark") is not None:
+            fig.add_hline(y=spec["benchmark"], line_dash="dash", line_color="red",
+                          annotation_text="Benchmark", annotation_position="top right")
+    else:
+        import pandas as pd
+        fig = px.line(pd.DataFrame(spec["data"]), markers=True, color_discrete_sequence=spec["colors"])
+    fig.update_layout(
+        title=spec["title"], plot_bgcolor='white', paper_bgcolor='white',
+        width=width, height=height, margin=dict(l=20, r=20, t=40, b=20), font=dict(family="Georgia")
+    )
+    fig.write_image(path)
+
+
+RENDERERS = {"matplotlib": _render_matplotlib, "plotly": _render_plotly}
+
+
+def render_to_cache(spec, backend, key):
+    """Worker entry point: draw `spec` into the cache (atomic rename) and return the cached path."""
+    cached = os.path.join(CHART_CACHE_DIR, f"{key}.png")
+    tmp_path = f"{cached}.{os.getpid()}.tmp.png"
+    RENDERERS[backend](spec, tmp_path)
+    os.replace(tmp_path, cached)
+    return cached
+
+
+class ChartRenderer:
+    """Render chart specs into the image cache through a shared process pool."""
+
+    def __init__(self, backend=CHART_BACKEND, max_workers=CHART_WORKERS):
+        if backend not in RENDERERS:
+            raise ValueError(f"Unknown chart backend '{backend}' (choose from {', '.join(RENDERERS)})")
+        self.backend = backend
+        self.max_workers = max_workers
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            use_as_spawn_main()     # don't re-run the server script in every worker
+            self._pool = ProcessPoolExecutor(max_workers=max(1, self.max_workers),
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def cache_path(self, spec):
+        """Image of `spec` in the cache (content-addressed: only this chart is ever written there)."""
+        return os.path.join(CHART_CACHE_DIR, f"{chart_key(spec, self.backend)}.png")
+
+    def submit_all(self, specs):
+        """Start rendering the specs missing from the cache. Returns (futures, reused); the caller waits."""
+        os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+        futures, keys, reused = [], set(), 0
+        for spec in specs:
+            key = chart_key(spec, self.backend)
+            if key in keys:
+                continue
+            keys.add(key)
+            if touch(os.path.join(CHART_CACHE_DIR, f"{key}.png")):
+                reused += 1
+            else:
+                # Even a single chart goes to the pool: pyplot is not thread-safe in the calling process
+                futures.append(self._executor().submit(render_to_cache, spec, self.backend, key))
+
+        print(f"[CHARTS] {len(futures)} to render with {self.backend}, {reused} reused from cache")
+        prune_cache_dir(CHART_CACHE_DIR, CHART_CACHE_RETENTION_S, CHART_CACHE_MAX_FILES, ".png", label="CHARTS")
+        return futures, reused
+
+
+# Shared renderer: the process pool is started on first use and reused across exports
+chart_renderer = ChartRenderer()
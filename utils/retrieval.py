@@ -0,0 +1,145 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from server.config import embedding_model
+from utils.embeddings import get_embedding, get_embeddings, normalize_rows, save_matrix_atomic
+
+# =====================================
+# Embedding-indexed retrieval over the knowledge/ folder
+# =====================================
+
+CLIMATE_STRATEGIES_PATH = "knowledge/climate_strategies.json"
+MATERIALS_PATH = "knowledge/materials.json"
+KNOWLEDGE_INDEX_PATH = "knowledge/knowledge_index.npz"
+
+# Cosine similarity below which a chunk is unrelated to the question and is not injected
+RETRIEVAL_MIN_SCORE = float(os.environ.get("COPILOT_RETRIEVAL_MIN_SCORE", "0.45"))
+
+_knowledge_index = None
+_index_lock = threading.Lock()
+
+# -- Chunking --
+def chunk_climate_strategies(path=CLIMATE_STRATEGIES_PATH):
+    """One chunk per strategy line, prefixed with its climate zone and topic."""
+    with open(path, "r", encoding="utf-8") as f:
+        zones = json.load(f)
+
+    chunks = []
+    for zone, groups in zones.items():
+        zone_label = zone.replace("_", " ")
+        for group, strategies in groups.items():
+            topic = group.replace("_strategies", "")
+            for strategy in strategies:
+                chunks.append({
+                    "source": "climate_strategies",
+                    "text": f"[{zone_label} | {topic}] {strategy}"
+                })
+    return chunks
+
+def chunk_materials(path=MATERIALS_PATH):
+    """One chunk per building component listing the materials available for it."""
+    with open(path, "r", encoding="utf-8") as f:
+        categories = json.load(f)
+
+    chunks = []
+    for category, options in categories.items():
+        names = ", ".join(name.replace("_", " ") for name in options.values())
+        chunks.append({
+            "source": "materials",
+            "text": f"[{category.replace('_', ' ').replace('.', ' ')} options] {names}"
+        })
+    return chunks
+
+def build_chunks():
+    chunks = []
+    for chunker, path in ((chunk_climate_strategies, CLIMATE_STRATEGIES_PATH), (chunk_materials, MATERIALS_PATH)):
+        try:
+            chunks.extend(chunker(path))
+        except Exception as e:
+            print(f"[RETRIEVAL] Skipping {path}: {e}")
+    return chunks
+
+# -- Persisted vector index --
+def _sources_signature():
+    """Hash of the source files and embedding model; a change forces a rebuild."""
+    digest = hashlib.sha256(embedding_model.encode("utf-8"))
+    for path in (CLIMATE_STRATEGIES_PATH, MATERIALS_PATH):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def load_knowledge_index(force_rebuild=False):
+    """Return {"texts", "sources", "matrix"}, embedding the chunks only when sources change."""
+    global _knowledge_index
+    with _index_lock:
+        if _knowledge_index is not None and not force_rebuild:
+            return _knowledge_index
+
+        signature = _sources_signature()
+        if not force_rebuild and os.path.exists(KNOWLEDGE_INDEX_PATH):
+            try:
+                with np.load(KNOWLEDGE_INDEX_PATH, allow_pickle=True) as saved:
+                    if str(saved["signature"]) == signature:
+                        _knowledge_index = {
+                            "texts": [str(t) for t in saved["texts"]],
+                            "sources": [str(s) for s in saved["sources"]],
+                            "matrix": saved["matrix"],
+                        }
+                        return _knowledge_index
+            except Exception as e:
+                print(f"[RETRIEVAL] Could not read {KNOWLEDGE_INDEX_PATH}: {e}")
+
+        chunks = build_chunks()
+        texts = [c["text"] for c in chunks]
+        matrix = normalize_rows(np.array(get_embeddings(texts), dtype=np.float32)) if texts else np.zeros((0, 0), dtype=np.float32)
+        _knowledge_index = {
+            "texts": texts,
+            "sources": [c["source"] for c in chunks],
+            "matrix": matrix,
+        }
+        save_matrix_atomic(
+            KNOWLEDGE_INDEX_PATH,
+            matrix=matrix,
+            texts=np.array(texts, dtype=object),
+            sources=np.array(_knowledge_index["sources"], dtype=object),
+            signature=np.array(signature),
+        )
+        print(f"[RETRIEVAL] Indexed {len(texts)} knowledge chunks")
+        return _knowledge_index
+
+# -- Query --
+def retrieve_snippets(query, k=4, min_score=RETRIEVAL_MIN_SCORE, sources=None):
+    """Return up to k chunks scoring at least `min_score` as [{"text", "source", "score"}]."""
+    try:
+        index = load_knowledge_index()
+        if not index["texts"]:
+            return []
+
+        query_emb = get_embedding(query)
+        scores = index["matrix"] @ (query_emb / np.linalg.norm(query_emb))
+        if sources:
+            mask = np.array([s in sources for s in index["sources"]])
+            scores = np.where(mask, scores, -np.inf)
+
+        top = np.argsort(scores)[::-1][:k]
+        return [
+            {"text": index["texts"][i], "source": index["sources"][i], "score": float(scores[i])}
+            for i in top
+            if np.isfinite(scores[i]) and scores[i] >= min_score
+        ]
+    except Exception as e:
+        print(f"[RETRIEVAL] Error: {e}")
+        return []
+
+def format_snippets(snippets):
+    """Render snippets as a short bullet list for prompt injection."""
+    if not snippets:
+        return "(no relevant knowledge found)"
+    return "\n".join(f"- {s['text']}" for s in snippets)
+
+def snippet_sections(title, snippets, priority=2):
+    """fit_sections entry for the snippets, or none at all when nothing passed the score cutoff."""
+    return [(title, format_snippets(snippets), priority)] if snippets else []
@@ -0,0 +1,126 @@
+import os
+import re
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from utils.conversation_memory import ConversationMemory
+from utils.design_state import session_design_dir, load_parameters
+
+# =====================================
+# Session store: per-designer chat state
+# =====================================
+#
+# Each browser/designer gets its own design data and conversation memory,
+# keyed by the X-Session-Id header (or the copilot_session cookie). The data
+# itself lives on disk (knowledge/sessions/<id>/, see utils/design_state) and
+# in SQLite (conversation memory), so any server worker can serve any session;
+# this store only keeps a bounded number of Session handles per process and
+# evicts idle ones.
+
+SESSION_HEADER = "X-Session-Id"
+SESSION_COOKIE = "copilot_session"
+DEFAULT_SESSION = "default"
+
+_VALID_ID = re.compile(r"^[A-Za-z0-9_-]{6,64}$")
+
+
+class Session:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.memory = ConversationMemory(session_id=session_id)
+        # The default session works on the shared knowledge/ files (Rhino, dashboard)
+        self.design_dir = None if session_id == DEFAULT_SESSION else session_design_dir(session_id)
+        self.turn_lock = asyncio.Lock()     # one chat turn at a time per session (per worker); sessions run in parallel
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+
+    def touch(self):
+        self.last_seen = time.time()
+
+    # Read from disk on every access so every worker sees the latest parameters
+    @property
+    def design_data(self):
+        return load_parameters(self.design_dir)
+
+
+class SessionStore:
+    """Bounded LRU of sessions with idle eviction; the store lock only guards the index."""
+
+    def __init__(self, max_sessions=32, idle_timeout=3600):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def get(self, session_id):
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+                session.touch()
+                return session
+
+        # Loading history hits SQLite: do it outside the store lock
+        session = Session(session_id)
+        with self._lock:
+            existing = self._sessions.get(session_id)
+            if existing is not None:
+                existing.touch()
+                return existing
+            self._sessions[session_id] = session
+            self._evict_lru()
+        print(f"[SESSIONS] Opened session '{session_id}' ({len(self._sessions)} active)")
+        return session
+
+    def _evict_lru(self):
+        """Drop least recently used sessions above `max_sessions`, skipping ones mid-turn (caller holds the lock)."""
+        excess = len(self._sessions) - self.max_sessions
+        if excess <= 0:
+            return
+        for old_id, old in list(self._sessions.items())[:-1]:
+            if old.turn_lock.locked():
+                continue    # a turn is running: evicting would let a second Session for this id race it
+            del self._sessions[old_id]
+            self.evicted += 1
+            print(f"[SESSIONS] Evicted least recently used session '{old_id}'")
+            excess -= 1
+            if excess == 0:
+                break
+
+    def _evict_idle(self):
+        """Drop sessions idle for longer than `idle_timeout` (caller holds the lock)."""
+        cutoff = time.time() - self.idle_timeout
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_seen >= cutoff or session.turn_lock.locked():
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+            print(f"[SESSIONS] Evicted idle session '{session_id}'")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "active": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_timeout_s": self.idle_timeout,
+                "evicted": self.evicted,
+            }
+
+
+def session_id_from(headers, cookies):
+    """Session id from the header, then the cookie; clients sending neither share the default session."""
+    for candidate in (headers.get(SESSION_HEADER), cookies.get(SESSION_COOKIE)):
+        if candidate and _VALID_ID.match(candidate):
+            return candidate
+    return DEFAULT_SESSION
+
+
+# Shared store used by the chat server
+session_store = SessionStore(
+    max_sessions=int(os.environ.get("COPILOT_MAX_SESSIONS", "32")),
+    idle_timeout=float(os.environ.get("COPILOT_SESSION_IDLE_TIMEOUT", "3600"))
+)
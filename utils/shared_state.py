@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# =====================================
+# Shared state: one SQLite database (WAL mode) for all server workers
+# =====================================
+#
+# With `--workers N` every worker is a separate process, so in-memory dicts
+# drift apart. Anything that must look the same from every worker (session
+# design data, the answer cache, index revisions, counters) lives here
+# instead. WAL lets readers run alongside the single writer; each thread
+# keeps its own connection.
+
+SHARED_STATE_PATH = os.path.join("knowledge", "shared_state.sqlite3")
+
+
+def connect_wal(db_path, timeout=10):
+    """Open a SQLite connection in WAL mode with a busy timeout (autocommit)."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
+
+
+class SharedState:
+    """Namespaced JSON key/value store plus revision counters, safe across threads and processes."""
+
+    def __init__(self, db_path=SHARED_STATE_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._schemas = set()
+        self._schema_lock = threading.Lock()
+        self.ensure_schema("""
+            CREATE TABLE IF NOT EXISTS kv (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT,
+                updated_at REAL,
+                PRIMARY KEY (namespace, key)
+            )""")
+
+    # -- connections --
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect_wal(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction on this thread's connection (BEGIN IMMEDIATE: one writer at a time).
+
+        Nested calls on the same thread join the outer transaction (e.g. bump() inside a transaction).
+        """
+        conn = self._conn()
+        if getattr(self._local, "depth", 0):
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            self._local.depth = 0
+        conn.execute("COMMIT")
+
+    def execute(self, sql, params=()):
+        return self._conn().execute(sql, params)
+
+    def ensure_schema(self, ddl):
+        """Run CREATE ... IF NOT EXISTS statements once per process."""
+        with self._schema_lock:
+            if ddl in self._schemas:
+                return
+            self._conn().executescript(ddl)
+            self._schemas.add(ddl)
+
+    # -- key/value --
+    def get(self, namespace, key, default=None):
+        row = self.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, namespace, key, value):
+        self.execute(
+            "INSERT INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(namespace, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at",
+            (namespace, key, json.dumps(value), time.time())
+        )
+
+    def delete(self, namespace, key=None):
+        if key is None:
+            self.execute("DELETE FROM kv WHERE namespace = ?", (namespace,))
+        else:
+            self.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def items(self, namespace):
+        rows = self.execute("SELECT key, value FROM kv WHERE namespace = ? ORDER BY key", (namespace,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    # -- counters / revisions --
+    def incr(self, namespace, key, amount=1):
+        """Atomically add `amount` to an integer value and return the new value."""
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO kv (namespace, key, value, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(namespace, key) DO UPDATE SET value = CAST(value AS INTEGER) + ?, updated_at = excluded.updated_at",
+                (namespace, key, str(amount), time.time(), amount)
+            )
+            return int(conn.execute("SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()[0])
+
+    def revision(self, name):
+        """Current revision of a shared resource (0 if never bumped)."""
+        return int(self.get("revisions", name, 0))
+
+    def bump(self, name):
+        """Mark a shared resource as changed so other workers reload it."""
+        return self.incr("revisions", name)
+
+
+# Shared instance used by the server, caches and session store
+shared_state = SharedState()
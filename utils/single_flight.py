@@ -0,0 +1,126 @@
+import copy
+import asyncio
+import functools
+import threading
+
+# =====================================
+# Single-flight: share one in-flight computation between identical callers
+# =====================================
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Concurrent callers with the same key wait for the first caller's result.
+
+    Nothing is cached: once the computation finishes the key is forgotten and
+    the next caller starts a fresh one. Use only for idempotent operations.
+    With `copy_result`, callers that shared a computation each get their own
+    deep copy, so one of them mutating the result cannot affect the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self.executed = 0
+        self.shared = 0
+
+    def do(self, key, fn, copy_result=False):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result) if copy_result else call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                shared = call.waiters
+            call.event.set()
+        # Waiters copy the original, so the leader must not hand it out either
+        return copy.deepcopy(call.result) if copy_result and shared else call.result
+
+    async def ado(self, key, coro_fn):
+        """Async variant: callers on the same event loop await one shared task."""
+        loop = asyncio.get_running_loop()
+        task_key = (id(loop), key)
+        with self._lock:
+            task = self._tasks.get(task_key)
+            if task is None:
+                task = loop.create_task(coro_fn())
+                self._tasks[task_key] = task
+                task.add_done_callback(lambda t: self._forget(task_key, t))
+                self.executed += 1
+            else:
+                self.shared += 1
+        # shield: one caller being cancelled must not cancel the others' result
+        return await asyncio.shield(task)
+
+    def _forget(self, task_key, task):
+        with self._lock:
+            if self._tasks.get(task_key) is task:
+                del self._tasks[task_key]
+        if not task.cancelled():
+            task.exception()  # mark as retrieved when every waiter was cancelled
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "in_flight": len(self._calls) + len(self._tasks),
+            }
+
+
+# Shared group used by the decorators below
+single_flight = SingleFlight()
+
+def _call_key(fn, revision, args, kwargs):
+    rev = revision(*args, **kwargs) if revision else None
+    return (fn.__module__, fn.__qualname__, repr(args), repr(sorted(kwargs.items())), rev)
+
+def coalesced(revision=None, group=single_flight, copy_result=False):
+    """Decorator: coalesce concurrent identical calls (same function, arguments and data revision).
+
+    `revision` is called with the function's arguments and returns a cheap
+    fingerprint of the data the result depends on (e.g. file mtimes). Leave it
+    out when the call is short and reads its data itself. `copy_result` gives
+    every caller that shared a call its own copy of a mutable result.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return group.do(_call_key(fn, revision, args, kwargs), lambda: fn(*args, **kwargs), copy_result)
+        return wrapper
+    return decorator
+
+def coalesced_async(revision=None, group=single_flight):
+    """Async counterpart of `coalesced` for coroutine functions."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await group.ado(_call_key(fn, revision, args, kwargs), lambda: fn(*args, **kwargs))
+        return wrapper
+    return decorator
@@ -3,11 +3,17 @@ import os
 import re
 import traceback
 from server.config import client, completion_model
+from utils.single_flight import coalesced
 
 # =====================================
 # Version Utilities for Historical Analysis
 # =====================================
 
+# Loaders below are coalesced: concurrent calls with the same arguments share
+# one read instead of each parsing every V*.json. Reads are short, so the key
+# is the arguments alone (no per-call folder scan), and every caller that
+# shared a read gets its own copy of the result.
+@coalesced(copy_result=True)
 def list_all_version_files(folder="knowledge/iterations"):
     """Return a sorted list of all version filenames (e.g., V0.json … V19.json)"""
     try:
@@ -17,6 +23,7 @@ def list_all_version_files(folder="knowledge/iterations"):
         print(f"[VERSION LIST] Error: {e}")
         return []
 
+@coalesced(copy_result=True)
 def load_specific_version(version_name, folder="knowledge/iterations"):
     """Load and return the JSON for a specific version like 'V3'"""
     try:
@@ -29,6 +36,7 @@ def load_specific_version(version_name, folder="knowledge/iterations"):
         print(f"[LOAD VERSION] Error loading {version_name}: {e}")
         return None
 
+@coalesced(copy_result=True)
 def summarize_version_outputs(folder="knowledge/iterations"):
     """Return a list of version summaries (version + outputs only)"""
     summaries = []
@@ -44,9 +52,10 @@ def summarize_version_outputs(folder="knowledge/iterations"):
             print(f"[SUMMARY ERROR] {filename}: {e}")
     return summaries
 
-def get_best_version(metric="GWP total", folder="knowledge/iterations"):
-    """Find the version with the lowest specified output metric"""
-    summaries = summarize_version_outputs(folder)
+def get_best_version(metric="GWP total", folder="knowledge/iterations", summaries=None):
+    """Find the version with the lowest specified output metric (reuses `summaries` if given)"""
+    if summaries is None:
+        summaries = summarize_version_outputs(folder)
     best = None
     best_val = float("inf")
     for entry in summaries:
@@ -56,6 +65,7 @@ def get_best_version(metric="GWP total", folder="knowledge/iterations"):
             best_val = val
     return best, best_val
 
+@coalesced(copy_result=True)
 def load_version_details(version_name, folder="knowledge/iterations"):
     """
     Load a specific version file based on exact version name (e.g., 'V7').
@@ -79,6 +89,7 @@ def extract_versions_from_input(user_input):
     """Return all version mentions like V1, V7, V12 (case-insensitive)."""
     return re.findall(r'\bV\d+\b', user_input.upper())
 
+@coalesced(copy_result=True)
 def summarize_versions_data(version_names, folder="knowledge/iterations"):
     """Return dict of version_name -> {inputs_decoded, outputs} for selected versions"""
     result = {}
@@ -90,3 +101,19 @@ def summarize_versions_data(version_names, folder="knowledge/iterations"):
                 "outputs": data.get("outputs", {})
             }
     return result
+
+def get_design_revision(folder="knowledge/iterations", ml_output_path="knowledge/ml_output.json"):
+    """Return a cheap fingerprint of ml_output.json and the iteration files (name, size, mtime)."""
+    parts = []
+    paths = [ml_output_path]
+    try:
+        paths += [os.path.join(folder, f) for f in sorted(os.listdir(folder))]
+    except Exception:
+        pass
+    for path in paths:
+        try:
+            st = os.stat(path)
+            parts.append(f"{os.path.basename(path)}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            continue
+    return "|".join(parts)